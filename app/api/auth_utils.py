@@ -3,6 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from appwrite.services.account import Account
 from appwrite.exception import AppwriteException
 from app.core.clients import get_user_client
+from app.core.timing import timed
+from app.core.tracing import CLIENT, span
 import logging
 from typing import Dict, Optional
 import secrets
@@ -53,7 +55,8 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme)) -> Use
         account = Account(user_client)
 
         # 3. Verify the token by fetching the user account
-        user_data = account.get() # This call uses the JWT set on user_client
+        with timed("auth"), span("appwrite.account_get", kind=CLIENT):
+            user_data = account.get() # This call uses the JWT set on user_client
 
         # 4. Create and return a UserResponse instance
         profile_data = {
@@ -64,7 +67,7 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme)) -> Use
             "registration": user_data.get('$registration'),
             "prefs": user_data.get('prefs', {})
         }
-        logger.debug(f"Token validated for user: {profile_data['user_id']}, Anonymous: {profile_data['is_anonymous']}")
+        logger.debug("Token validated for user: %s, Anonymous: %s", profile_data['user_id'], profile_data['is_anonymous'])
         return UserResponse(**profile_data) # Return model instance
 
     except AppwriteException as e:
@@ -97,7 +100,7 @@ async def get_user_or_anonymous(token: Optional[str] = Depends(oauth2_scheme)) -
             return await get_current_user(token)
         except HTTPException as e:
             if e.status_code == status.HTTP_401_UNAUTHORIZED:
-                 logger.debug(f"Invalid token provided, treating as anonymous.")
+                 logger.debug("Invalid token provided, treating as anonymous.")
             elif e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
                  logger.warning(f"Auth service unavailable ({e.detail}), treating as anonymous.")
             else:
@@ -105,7 +108,7 @@ async def get_user_or_anonymous(token: Optional[str] = Depends(oauth2_scheme)) -
 
     # Generate anonymous user structure
     anon_id = f"anon_{secrets.token_hex(8)}"
-    logger.debug(f"No valid token found or validation failed, returning anonymous user structure (ID: {anon_id})")
+    logger.debug("No valid token found or validation failed, returning anonymous user structure (ID: %s)", anon_id)
     anon_data = {
         "user_id": anon_id,
         "email": None,
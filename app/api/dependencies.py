@@ -24,6 +24,7 @@ from collections import defaultdict
 
 from app.config.settings import settings, Settings
 from app.core.clients import get_pinecone_index
+from app.core.metrics import RATE_LIMIT_REJECTIONS
 from app.api.auth_utils import get_current_user, get_user_or_anonymous, UserResponse
 
 logger = logging.getLogger(__name__)
@@ -89,6 +90,7 @@ def verify_api_key(api_key: Optional[str] = Header(None, alias="X-API-Key")):
     # Check and update rate limit
     current_count = key_data["calls"].get(current_min, 0)
     if current_count >= key_data["rate_limit"]:
+        RATE_LIMIT_REJECTIONS.inc(limiter="api_key")
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Rate limit exceeded"
@@ -99,6 +101,22 @@ def verify_api_key(api_key: Optional[str] = Header(None, alias="X-API-Key")):
     
     return True
 
+def verify_admin_token(admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """
+    Gate operational endpoints (/debug) behind settings.ADMIN_TOKEN.
+
+    Raises:
+        HTTPException: 404 while no ADMIN_TOKEN is configured, 401 if the token is missing or wrong
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not admin_token or not secrets.compare_digest(admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token"
+        )
+    return True
+
 def get_pinecone_client():
     """
     Dependency for accessing the Pinecone client.
@@ -147,6 +165,7 @@ async def check_rate_limit(
 
     # Check if limit exceeded
     if len(valid_timestamps) >= max_requests:
+        RATE_LIMIT_REJECTIONS.inc(limiter="user")
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Rate limit exceeded. Try again in {window} seconds.",
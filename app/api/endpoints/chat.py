@@ -150,7 +150,7 @@ async def get_conversation_messages(
             except Exception as pydantic_error:
                 # Log the specific document that failed validation
                 logger.error(f"Pydantic validation failed for Appwrite doc ID {doc.get('$id')}: {pydantic_error}")
-                logger.debug(f"Failing document data: {doc}")
+                logger.debug("Failing document data: %s", doc)
                 # Optionally skip this message or raise the error depending on desired behavior
                 # continue # Skip this message and log
 
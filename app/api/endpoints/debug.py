@@ -0,0 +1,56 @@
+# app/api/endpoints/debug.py
+"""
+Operational endpoints for live workers, gated by X-Admin-Token.
+
+/debug/profile captures a time-boxed sampling profile of the worker serving
+the request, while it keeps serving traffic; /debug/loop reports the event
+loop lag monitor. Both return 404 unless settings.ADMIN_TOKEN is set.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.api.dependencies import verify_admin_token
+from app.config.settings import settings
+from app.core.profiling import ProfilerBusy, get_loop_lag_monitor, sample_stacks, to_collapsed, to_speedscope
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["debug"], dependencies=[Depends(verify_admin_token)])
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(5.0, gt=0, le=settings.PROFILE_MAX_SECONDS, description="Capture length"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="Time between samples"),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$",
+                        description="collapsed stacks (text) or speedscope JSON"),
+    loop_only: bool = Query(False, description="Only sample the event loop thread"),
+):
+    """
+    Sample every thread's stack for `seconds` and return the profile.
+
+    Sampling runs in a worker thread, so the event loop (and what blocks it)
+    is profiled while requests continue. One capture at a time per worker.
+    """
+    thread_ids = {threading.get_ident()} if loop_only else None  # Handlers run on the loop thread
+    logger.info(f"Capturing a {seconds}s profile (interval {interval_ms}ms, loop_only={loop_only})")
+    try:
+        samples = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000, thread_ids)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if format == "speedscope":
+        return JSONResponse(to_speedscope(samples, interval_ms / 1000, name=f"worker {os.getpid()}"))
+    return PlainTextResponse(to_collapsed(samples))
+
+
+@router.get("/loop")
+async def loop_stats() -> Dict[str, Any]:
+    """Event loop lag monitor state: stalls seen and the largest lag measured."""
+    return get_loop_lag_monitor().stats()
@@ -2,37 +2,33 @@
 """
 API endpoints for document ingestion.
 
-This module defines the /ingestion endpoint which:
-1. Receives document URLs or text content
-2. Processes the documents (fetching if needed)
-3. Generates embeddings and stores in Pinecone
-4. Returns a confirmation response
-
-This is a placeholder implementation since the ingestion logic would
-depend on specific document formats and sources for the Shamela library.
+This module defines the /ingestion endpoints which:
+1. Ingest a single document (URL or text) synchronously
+2. Queue batches of documents as background jobs (app/core/jobs.py)
+3. Report job progress and allow cancelling or retrying a job
+
+Batch jobs run on a small dedicated worker pool, so large ingests do not
+degrade chat latency on the same host.
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
 import logging
-import hashlib
-import time
-from typing import Dict, Any, List
-import uuid
+from typing import List
 
-from app.models.schemas import IngestionRequest, IngestionResponse
-from app.core.embeddings import get_text_embedding, get_embeddings_in_chunks
+from app.models.schemas import IngestionRequest, IngestionResponse, IngestionJobStatus
 from app.api.dependencies import get_pinecone_client, verify_api_key
-from app.core.document_processor import process_document
-from fastapi import BackgroundTasks
+from app.core.ingestion.documents import DocumentIngestionError, ingest_document as ingest_document_item
+from app.core.jobs import JobManager, get_job_manager
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["ingestion"])
 
-# Add this new endpoint to batch process documents
+
 @router.post(
     "/batch",
-    response_model=IngestionResponse,
+    response_model=IngestionJobStatus,
     status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(verify_api_key)],
     summary="Ingest multiple documents in the background",
@@ -40,32 +36,65 @@ router = APIRouter(tags=["ingestion"])
 )
 async def ingest_documents_batch(
     request: List[IngestionRequest],
-    background_tasks: BackgroundTasks,
-    pinecone_index=Depends(get_pinecone_client)
+    job_manager: JobManager = Depends(get_job_manager)
 ):
     """
-    Ingest multiple documents into the vector database as a background task.
-    
-    This endpoint accepts a list of document URLs and processes them asynchronously.
+    Queue a list of documents for ingestion as a background job.
+
+    Poll GET /ingestion/jobs/{job_id} for progress.
     """
-    # Generate a batch job ID
-    batch_id = str(uuid.uuid4())
-    
-    # Add the task to background processing
-    background_tasks.add_task(
-        process_document_batch, 
-        request, 
-        batch_id, 
-        pinecone_index
-    )
-    
-    return IngestionResponse(
-        success=True,
-        document_id=batch_id,
-        message=f"Batch ingestion started with ID: {batch_id}"
-    )
+    if not request:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No documents to ingest")
+    job_id = await run_in_threadpool(job_manager.submit, [item.model_dump(mode="json") for item in request])
+    return await run_in_threadpool(job_manager.get, job_id)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=IngestionJobStatus,
+    dependencies=[Depends(verify_api_key)],
+    summary="Get ingestion job status"
+)
+async def get_ingestion_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """Return progress counts and the first errors of an ingestion job."""
+    job = await run_in_threadpool(job_manager.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.post(
+    "/jobs/{job_id}/cancel",
+    response_model=IngestionJobStatus,
+    dependencies=[Depends(verify_api_key)],
+    summary="Cancel an ingestion job"
+)
+async def cancel_ingestion_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """Cancel a job. A running job stops before its next document."""
+    job = await run_in_threadpool(job_manager.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.post(
+    "/jobs/{job_id}/retry",
+    response_model=IngestionJobStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(verify_api_key)],
+    summary="Retry the failed documents of an ingestion job"
+)
+async def retry_ingestion_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """Re-queue a finished or cancelled job's failed and unprocessed documents."""
+    try:
+        job = await run_in_threadpool(job_manager.retry, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return job
+
 
-# Update the main ingestion endpoint
 @router.post(
     "/",
     response_model=IngestionResponse,
@@ -80,80 +109,32 @@ async def ingest_document(
 ):
     """
     Ingest a document into the vector database.
-    
+
     This endpoint:
     1. Takes a document URL or text via JSON request
-    2. Processes the document (in a real app, would fetch from URL)
-    3. Generates embeddings for the document
-    4. Stores the document and its metadata in Pinecone
-    
-    Note: This is a simplified placeholder implementation.
-    A complete implementation would handle:
-    - Document fetching from URLs
-    - Text extraction from various formats
-    - Chunking long documents
-    - More sophisticated metadata extraction
-    
+    2. Fetches and chunks the document
+    3. Generates embeddings for the chunks
+    4. Upserts the chunks and their metadata into Pinecone
+
     Returns:
         JSON object with ingestion status
     """
-    logger.info(f"Processing document from: {request.document_url}")
-    
+    logger.info(f"Processing document from: {request.source_url or 'text content'}")
+
     try:
-        # Process the document
-        chunks, metadata = process_document(str(request.document_url))
-        
-        if not chunks:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Could not process document - invalid content or format"
-            )
-        
-        # Combine user-provided metadata with extracted metadata
-        if request.metadata:
-            for chunk in chunks:
-                chunk["metadata"].update(request.metadata)
-        
-        # Generate embeddings for all chunks
-        texts = [chunk["text"] for chunk in chunks]
-        embeddings = get_embeddings_in_chunks(texts)
-        
-        if not embeddings or None in embeddings:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to generate embeddings for one or more chunks"
-            )
-        
-        # Prepare vectors for Pinecone
-        vectors = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            if embedding is None:
-                logger.warning(f"Skipping chunk {i} due to missing embedding")
-                continue
-                
-            vectors.append({
-                "id": chunk["id"],
-                "values": embedding,
-                "metadata": chunk["metadata"]
-            })
-        
-        # Batch upsert to Pinecone (in chunks of 100 for performance)
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i+batch_size]
-            pinecone_index.upsert(vectors=batch)
-        
-        logger.info(f"Successfully ingested document with {len(vectors)} chunks")
-        
-        return IngestionResponse(
-            success=True,
-            document_id=chunks[0]["id"].split("_")[0],  # Base document ID
-            message=f"Document successfully ingested with {len(vectors)} chunks"
-        )
-        
+        counts = await run_in_threadpool(ingest_document_item, request.model_dump(mode="json"), pinecone_index)
+    except DocumentIngestionError as e:
+        logger.error(f"Failed to ingest document: {e}")
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to ingest document: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Document ingestion failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    return IngestionResponse(
+        status="success",
+        message=f"Document successfully ingested with {counts['vectors']} chunks",
+        processed_chunks=counts["chunks"]
+    )
@@ -9,7 +9,7 @@ import logging
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 
-from app.models.schemas import RetrievalRequest
+from app.models.schemas import RetrievalRequest, RetrievalFilter
 from app.core.rag import generate_rag_response
 from app.api.dependencies import verify_api_key
 
@@ -23,6 +23,7 @@ class RagQueryRequest(BaseModel):
     query: str = Field(..., description="User's question", min_length=1)
     top_k: int = Field(default=5, description="Number of documents to retrieve", ge=1, le=20)
     reranking: bool = Field(default=True, description="Whether to rerank results")
+    filter: Optional[RetrievalFilter] = Field(default=None, description="Restrict retrieval to books, authors or categories")
 
 class RagResponse(BaseModel):
     """Response model for RAG queries."""
@@ -56,7 +57,8 @@ async def rag_query(request: RagQueryRequest):
         result = await generate_rag_response(
             query=request.query,
             top_k=request.top_k,
-            reranking=request.reranking
+            reranking=request.reranking,
+            filters=request.filter
         )
         
         return result
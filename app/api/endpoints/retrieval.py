@@ -6,15 +6,25 @@ This module defines the /retrieval endpoint which:
 1. Receives a query text in a request
 2. Retrieves semantically similar documents from Pinecone
 3. Returns the matching documents with their metadata
+
+and /retrieval/batch, which answers many queries with batched embedding
+calls and streams the results back as NDJSON.
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status
-from app.models.schemas import RetrievalRequest, RetrievalResponse, DocumentMatch
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.models.schemas import (
+    BatchRetrievalRequest, RetrievalFilter, RetrievalRequest, RetrievalResponse, DocumentMatch
+)
+from app.core.embeddings import embed_texts_batched, get_query_rate_limiter
 from app.core.retrieval import get_retriever, Retriever
 from app.config.settings import settings
 from app.api.dependencies import verify_api_key
+import asyncio
+import json
 import logging
-from typing import List, Optional, Dict, Any
+from typing import AsyncGenerator, List, Optional, Dict, Any
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +48,8 @@ async def retrieve_documents(request: RetrievalRequest):
     3. Searches Pinecone for similar document vectors
     4. Returns the matching documents with metadata
     
-    The top_k parameter controls how many results to return.
+    The top_k parameter controls how many results to return; the optional
+    filter restricts results to books, authors or categories inside the backend.
     
     Returns:
         JSON object containing matched documents with their metadata
@@ -47,7 +58,8 @@ async def retrieve_documents(request: RetrievalRequest):
 
     try:
         retriever: Retriever = get_retriever()
-        matches: Optional[List[DocumentMatch]] = await retriever.retrieve(request.query, top_k=request.top_k)
+        matches: Optional[List[DocumentMatch]] = await retriever.retrieve(request.query, top_k=request.top_k,
+                                                                           filters=request.filter)
 
         if matches is None:
             logger.error("Retrieval operation failed (retriever returned None)")
@@ -66,6 +78,71 @@ async def retrieve_documents(request: RetrievalRequest):
             detail=f"An unexpected error occurred: {e}"
         )
 
+async def _stream_batch_results(retriever: Retriever,
+                                queries: List[str],
+                                vectors: List[Optional[List[float]]],
+                                top_k: int,
+                                filters: Optional[RetrievalFilter]) -> AsyncGenerator[str, None]:
+    """
+    Query the index for every embedded query, at most RETRIEVAL_BATCH_CONCURRENCY
+    at a time, and yield one NDJSON line per query in input order.
+    """
+    semaphore = asyncio.Semaphore(settings.RETRIEVAL_BATCH_CONCURRENCY)
+
+    async def retrieve_one(vector: Optional[List[float]]) -> Optional[List[DocumentMatch]]:
+        if vector is None:
+            return None
+        async with semaphore:
+            return await retriever.retrieve_by_vector(vector, top_k=top_k, filters=filters)
+
+    tasks = [asyncio.create_task(retrieve_one(vector)) for vector in vectors]
+    try:
+        for position, (query, vector, task) in enumerate(zip(queries, vectors, tasks)):
+            matches = await task
+            line: Dict[str, Any] = {
+                "index": position,
+                "query": query,
+                "matches": [match.model_dump() for match in matches or []],
+            }
+            if vector is None:
+                line["error"] = "Failed to generate query embedding"
+            elif matches is None:
+                line["error"] = "Retrieval failed"
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    finally:
+        # Client went away or a query raised: don't leave index queries running
+        for task in tasks:
+            task.cancel()
+
+@router.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(verify_api_key)],
+    summary="Retrieve documents for many queries",
+    response_description="One NDJSON line per query, in input order"
+)
+async def retrieve_documents_batch(request: BatchRetrievalRequest):
+    """
+    Retrieve documents for a list of queries in one request.
+
+    All queries are embedded together (one embeddings call per
+    EMBEDDING_MAX_BATCH_SIZE queries), then the index is queried concurrently
+    under a bounded pool. Each line of the response is a JSON object with the
+    query's index, text and matches, plus an "error" field if it failed.
+    """
+    logger.info(f"Received batch retrieval request with {len(request.queries)} queries")
+    retriever: Retriever = get_retriever()
+    # Query budget, not the ingestion limiter background jobs keep busy
+    vectors = await run_in_threadpool(embed_texts_batched, request.queries, limiter=get_query_rate_limiter())
+    failed = sum(1 for vector in vectors if vector is None)
+    if failed:
+        logger.warning(f"Failed to embed {failed}/{len(request.queries)} batch queries")
+
+    return StreamingResponse(
+        _stream_batch_results(retriever, request.queries, vectors, request.top_k, request.filter),
+        media_type="application/x-ndjson"
+    )
+
 @router.get("/debug", response_model=Dict[str, Any])
 async def debug_rag(query: str = "Test query"):
     """Debug endpoint to test the RAG pipeline components."""
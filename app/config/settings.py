@@ -48,9 +48,31 @@ class Settings(BaseSettings):
     MISTRAL_API_ENDPOINT: str = "https://api.mistral.ai/v1/chat/completions"
     GEMINI_MODEL: str = "gemini-2.0-flash" # Changed from gemini-2.0-flash based on previous code
 
+    # Embedding Configuration
+    EMBEDDING_MODEL: str = "mistral-embed"
+    EMBEDDING_MAX_BATCH_TOKENS: int = 16000  # Mistral rejects requests over 16,384 tokens
+    EMBEDDING_MAX_BATCH_SIZE: int = 128
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_REQUESTS_PER_MINUTE: int = 60  # 0 = no limit
+    EMBEDDING_TOKENS_PER_MINUTE: int = 500000  # 0 = no limit
+    # Separate budget for interactive query embeddings, so they never queue behind ingestion (0 = no limit)
+    QUERY_EMBEDDING_REQUESTS_PER_MINUTE: int = 0
+    QUERY_EMBEDDING_TOKENS_PER_MINUTE: int = 0
+    EMBEDDING_MICROBATCH_ENABLED: bool = False  # Batch concurrent query embeddings into one request
+    EMBEDDING_MICROBATCH_MAX_SIZE: int = 32  # Queries per micro-batch
+    EMBEDDING_MICROBATCH_MAX_WAIT_MS: float = 5.0  # How long the first query waits for others to join
+    EMBEDDING_STORE_PATH: str = "data/embeddings"  # Binary shard store used by ingestion and the local retriever
+    EMBEDDING_STORE_DTYPE: str = "float32"  # "float32" or "float16"
+    EMBEDDING_STORE_SHARD_ROWS: int = 50000
+
     # Pinecone specific (Defaults can be set here)
     PINECONE_INDEX_NAME: str = "shamela"
     PINECONE_ENVIRONMENT: str = "us-east-1-aws"  # Or load from env if needed
+    UPSERT_CONCURRENCY: int = 4  # Upsert batches in flight at once
+    UPSERT_MAX_REQUEST_BYTES: int = 2000000  # Pinecone rejects upsert requests over 2MB
+    PINECONE_SLIM_METADATA: bool = False  # Upsert only ids and small fields; text is read from PAGE_STORE_PATH or CHUNK_TEXT_STORE_PATH
+    CHUNK_TEXT_STORE_PATH: str = "data/chunk_text.sqlite"
+    PAGE_STORE_PATH: str = "data/page_store"  # Compressed page text served by (book_id, chunk_id)
     RETRIEVAL_TOP_K: int = 5 # Added
     # Appwrite specific (Defaults can be set here)
     APPWRITE_DATABASE_ID: str = "arabia_db"  # Or load from env if needed
@@ -62,18 +84,42 @@ class Settings(BaseSettings):
     # Document processing
     MAX_CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    SECTION_CHUNK_MAX_TOKENS: int = 800  # Token budget for section-bounded chunks
+    INGESTION_JOB_DB_PATH: str = "data/ingestion_jobs.sqlite"  # Background ingestion job records
+    INGESTION_JOB_WORKERS: int = 1  # Jobs processed at once, kept small to protect chat latency
+    INGESTION_JOB_EMBED_WORKERS: int = 1  # Concurrent embedding requests per job
 
     # Logging configuration
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    SERVER_TIMING_ENABLED: bool = False  # Server-Timing header and SSE "timing" event with a per-stage breakdown
+    METRICS_ENABLED: bool = True  # Record metrics and serve them at GET /metrics (Prometheus text format)
+    METRICS_MULTIPROC_DIR: str = ""  # Shared directory for per-worker snapshots when running several workers
+    METRICS_FLUSH_SECONDS: float = 5.0  # How often each worker writes its snapshot there
+    TRACING_ENABLED: bool = False  # Record trace spans around requests, pipeline stages and external calls
+    TRACE_JSONL_PATH: str = "logs/traces.jsonl"  # Local JSON-lines span file ("" to disable)
+    TRACE_OTLP_ENDPOINT: str = ""  # OTLP/HTTP JSON collector URL, e.g. http://localhost:4318/v1/traces
+    TRACE_SERVICE_NAME: str = "rag-backend"  # service.name on exported spans
+    TRACE_SAMPLE_RATE: float = 1.0  # Fraction of root traces recorded
+    LOOP_LAG_MONITOR_ENABLED: bool = True  # Measure event loop lag and log the stacks of blocking callbacks
+    LOOP_LAG_INTERVAL_SECONDS: float = 0.5  # How often the lag probe runs
+    LOOP_LAG_THRESHOLD_MS: float = 250.0  # Loop blocked this long: log the loop thread's stack
+    ADMIN_TOKEN: str = ""  # X-Admin-Token for the /debug endpoints; empty disables them
+    PROFILE_MAX_SECONDS: float = 60.0  # Longest /debug/profile capture
 
     # Streaming Configuration # Added section
     STREAM_CHUNK_SIZE: int = 50
     STREAM_CHUNK_DELAY: float = 0.02
 
     # Retrieval Configuration
-    RETRIEVER_PROVIDER: str = "pinecone" # Options: "pinecone", "faiss" (future), etc.
+    RETRIEVER_PROVIDER: str = "pinecone" # Options: "pinecone", "local" (EMBEDDING_STORE_PATH), etc.
     RETRIEVAL_TOP_K: int = 5
+    RETRIEVAL_BATCH_CONCURRENCY: int = 8  # Index queries in flight per /retrieval/batch request
+    CONTEXT_TOKEN_BUDGET: int = 6000  # Prompt input tokens (template, history, passages, query) for chat
+    CONTEXT_HISTORY_MAX_SHARE: float = 0.3  # Largest share of that budget given to conversation history
+    CONTEXT_MERGE_CHUNKS: bool = True  # Merge overlapping/adjacent chunks of a section before building prompts
+    CONTEXT_COMPRESSION_ENABLED: bool = False  # Keep only query-relevant sentences of each passage (per-request override)
+    CONTEXT_COMPRESSION_MAX_TOKENS: int = 200  # Token budget per compressed passage
 
     # Prompt Configuration # Added section
     PROMPT_TEMPLATE: str = """You are an expert assistant specializing in Arabic and Islamic texts. Below is the conversation history, followed by retrieved context passages. 
@@ -95,10 +141,16 @@ Instructions:
 
     # Arabic-specific settings
     NORMALIZE_ARABIC: bool = True
+    # Applied to embedded text (ingested chunks and queries) and content hashes: none, light, search or dedup.
+    # The live index was embedded from raw text: changing this requires re-embedding and re-indexing the corpus.
+    NORMALIZATION_PROFILE: str = "none"
 
     # Logging configuration
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_QUEUE_ENABLED: bool = True  # Format and write log records on a background thread (QueueHandler/QueueListener)
+    LOG_JSON: bool = False  # One JSON object per line, with trace/span ids, instead of LOG_FORMAT
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0  # Share of repeated DEBUG records kept per call site
 
     # Authentication (Use defaults here, BaseSettings loads from env)
     SECRET_KEY: str = "your-secret-key-should-be-at-least-32-characters-long"  # CHANGE THIS IN PRODUCTION
@@ -132,6 +184,13 @@ Instructions:
             raise ValueError(f"{info.field_name} must be a non-empty string set in environment variables or .env file")
         return v
 
+    @field_validator('NORMALIZATION_PROFILE')
+    def check_normalization_profile(cls, v):
+        profiles = ("none", "light", "search", "dedup")  # app/utils/normalization.PROFILES
+        if v not in profiles:
+            raise ValueError(f"NORMALIZATION_PROFILE must be one of {', '.join(profiles)}, not '{v}'")
+        return v
+
     # --- Pydantic Config ---
     class Config:
         """Inner configuration class for Pydantic settings."""
@@ -0,0 +1,157 @@
+# app/core/chunk_text_store.py
+"""
+Local compressed chunk-text store.
+
+With PINECONE_SLIM_METADATA enabled, vectors are upserted with only ids and
+small filterable fields, and chunk text is resolved here by chunk id at query
+time. This keeps Pinecone query responses and upsert payloads small. The
+upsert engine writes each chunk's text here before sending its slim vector,
+so every ingestion path (endpoint, jobs, dataset pipeline) keeps its text.
+
+The store is a single SQLite file of zlib-compressed texts. It can also be
+built from shamela_robust.db up front with:
+    python -m app.core.chunk_text_store shamela_robust.db --output data/chunk_text.sqlite
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_LEVEL = 6
+WRITE_BATCH_SIZE = 1000
+LOOKUP_CHUNK = 500  # Ids per SELECT ... IN (...)
+
+# Small fields kept in Pinecone metadata when slimming: enough to build
+# DocumentMetadata, cite the source and filter by book, author or category
+SLIM_METADATA_FIELDS = (
+    "book_id", "book_name", "author_name", "category_name", "section_id", "section_title",
+    "page_start", "page_end", "part_start", "part_end", "page_row_start", "page_row_end",
+    "chunk_index", "token_count", "content_hash",
+    "duplicate_count", "duplicate_book_ids",
+)
+
+
+def slim_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only SLIM_METADATA_FIELDS, dropping the chunk text and other bulky fields."""
+    return {key: metadata[key] for key in SLIM_METADATA_FIELDS if key in metadata}
+
+
+class ChunkTextStore:
+    """SQLite file mapping chunk ids to zlib-compressed chunk text."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunk_text (id TEXT PRIMARY KEY, text BLOB NOT NULL)")
+        self._conn.commit()
+
+    def write(self, chunks: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or replace the text of every chunk.
+
+        Args:
+            chunks: Chunk dictionaries with "id" and "text"
+
+        Returns:
+            Number of chunks written
+        """
+        written = 0
+        batch = []
+        for chunk in chunks:
+            batch.append((str(chunk["id"]), zlib.compress(chunk["text"].encode("utf-8"), COMPRESSION_LEVEL)))
+            if len(batch) >= WRITE_BATCH_SIZE:
+                written += self._write_batch(batch)
+                batch = []
+        written += self._write_batch(batch)
+        return written
+
+    def _write_batch(self, batch: List[tuple]) -> int:
+        if not batch:
+            return 0
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunk_text (id, text) VALUES (?, ?)", batch)
+            self._conn.commit()
+        return len(batch)
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        """Return the text of each id found in the store."""
+        texts: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(ids), LOOKUP_CHUNK):
+                chunk = ids[start:start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT id, text FROM chunk_text WHERE id IN ({placeholders})", chunk)
+                texts.update((row_id, zlib.decompress(blob).decode("utf-8")) for row_id, blob in rows)
+        return texts
+
+    def get(self, chunk_id: str) -> Optional[str]:
+        return self.get_many([chunk_id]).get(chunk_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunk_text").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[ChunkTextStore] = None
+_store_lock = threading.Lock()
+_missing_logged = False
+
+
+def get_chunk_text_store(create: bool = False) -> Optional[ChunkTextStore]:
+    """
+    Returns the configured chunk-text store, or None if it has not been built.
+
+    A missing store is not remembered, so one built or first written after
+    startup is picked up by the next call.
+
+    Args:
+        create: Create an empty store if there is none (for writers)
+    """
+    global _store, _missing_logged
+    with _store_lock:
+        if _store is None:
+            if not create and not os.path.exists(settings.CHUNK_TEXT_STORE_PATH):
+                if not _missing_logged:
+                    logger.warning(f"Chunk text store not found at {settings.CHUNK_TEXT_STORE_PATH}; "
+                                   f"slim Pinecone matches will have no text")
+                    _missing_logged = True
+                return None
+            _store = ChunkTextStore(settings.CHUNK_TEXT_STORE_PATH)
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local chunk-text store from shamela_robust.db.")
+    parser.add_argument("db_path", help="Path to shamela_robust.db")
+    parser.add_argument("--output", default=settings.CHUNK_TEXT_STORE_PATH, help="SQLite file to write")
+    parser.add_argument("--book_id", type=int, action="append", help="Book ID to process (repeatable, default: all)")
+    parser.add_argument("--max_tokens", type=int, default=None,
+                        help="Token budget per chunk (must match the one used for embedding)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from app.core.ingestion.section_chunker import iter_dataset_chunks
+    store = ChunkTextStore(args.output)
+    written = store.write(iter_dataset_chunks(args.db_path, args.book_id, args.max_tokens))
+    logger.info(f"Wrote {written} chunk texts to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
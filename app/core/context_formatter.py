@@ -1,29 +1,99 @@
 # app/core/context_formatter.py
 import logging
-from typing import List, Dict, Tuple, Any
-from app.models.schemas import DocumentMatch, Message
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Tuple, Any, Optional
+from app.models.schemas import DocumentMatch, HistoryMessage, Message
 from app.config.settings import settings
+from app.core.compression import compress_documents
+from app.core.context_merge import merge_overlapping_documents
+from app.core.page_store import resolve_chunk_text
+from app.utils.helpers import BYTES_PER_TOKEN, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 CONTEXT_SNIPPET_MAX_LENGTH = 300 # Max characters per document snippet in context
 HISTORY_MAX_MESSAGES = 6 # Max number of recent messages to include
+MIN_PASSAGE_TOKENS = 64 # A passage is only truncated to fit the budget if at least this much of it remains
+NO_HISTORY_TEXT = "No previous conversation history."
+NO_CONTEXT_TEXT = "No relevant context found."
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Cached token estimate: passages and history lines recur across turns of a conversation."""
+    return estimate_tokens(text)
 
 # --- New History Formatter ---
+def history_lines(messages: List[Message]) -> List[str]:
+    """One "Role: content" line per message, oldest first."""
+    return [f"{'User' if msg.message_type == 'user' else 'Assistant'}: {msg.content}" for msg in messages]
+
+def frontend_history_lines(history: List[HistoryMessage]) -> List[str]:
+    """One "Role: content" line per frontend history message, oldest first."""
+    return [f"{'Human' if msg.role == 'user' else 'Assistant'}: {msg.content}" for msg in history or []]
+
 def format_history(messages: List[Message]) -> str:
     """Formats recent conversation messages into a string for the LLM prompt."""
     if not messages:
-        return "No previous conversation history."
+        return NO_HISTORY_TEXT
 
-    history_lines = []
     # Take the most recent messages up to the limit
-    recent_messages = messages[-HISTORY_MAX_MESSAGES:]
-    for msg in recent_messages:
-        role = "User" if msg.message_type == "user" else "Assistant"
-        history_lines.append(f"{role}: {msg.content}")
+    return "\n".join(history_lines(messages[-HISTORY_MAX_MESSAGES:]))
+
+# --- Shared passage helpers ---
+def _document_book_id(doc: DocumentMatch) -> Optional[str]:
+    return doc.metadata.book_id or (doc.id.split('_')[0] if '_' in doc.id else None)
+
+def _format_passage(doc: DocumentMatch, content: str) -> str:
+    metadata = doc.metadata
+    return (
+        f"Source Document [ID: {doc.id}]\n"
+        f"Book: {metadata.book_name or 'Unknown'}\n"
+        f"Section: {metadata.section_title or 'Unknown'}\n"
+        f"Content: {content}\n---\n"
+    )
 
-    return "\n".join(history_lines)
+def _source_entry(doc: DocumentMatch, content: str) -> Dict[str, Any]:
+    book_id = _document_book_id(doc)
+    source = {
+        "document_id": doc.id,
+        "book_id": book_id,
+        "book_name": doc.metadata.book_name,
+        "title": doc.metadata.section_title,
+        "score": doc.score,
+        "url": f"https://shamela.ws/book/{book_id}" if book_id else None,
+        "content": content
+    }
+    if doc.merged_ids:
+        source["merged_document_ids"] = doc.merged_ids  # Every chunk cited by a merged passage
+    if doc.metadata.page_row_start is not None and doc.metadata.page_row_end is not None:
+        # Page rows in the page store, for fetching the passage's neighbouring pages
+        source["page_rows"] = [doc.metadata.page_row_start, doc.metadata.page_row_end]
+    return source
+
+def _resolve_texts(documents: List[DocumentMatch]) -> List[DocumentMatch]:
+    """Fill in the text of matches that carry none (slim metadata) from the page store."""
+    resolved = []
+    for doc in documents:
+        metadata = doc.metadata
+        if metadata and not metadata.text:
+            text = resolve_chunk_text(metadata.book_id, metadata.page_row_start, metadata.page_row_end)
+            if text:
+                doc = doc.model_copy(update={"metadata": metadata.model_copy(update={"text": text})})
+        resolved.append(doc)
+    return resolved
+
+def _merge_documents(documents: List[DocumentMatch]) -> List[DocumentMatch]:
+    """Merge overlapping/adjacent chunks of a section when CONTEXT_MERGE_CHUNKS is on."""
+    if not settings.CONTEXT_MERGE_CHUNKS:
+        return documents
+    return merge_overlapping_documents(documents)
+
+def _snippet(text: str) -> str:
+    if len(text) > CONTEXT_SNIPPET_MAX_LENGTH:
+        return text[:CONTEXT_SNIPPET_MAX_LENGTH] + "..."
+    return text
 
 # --- Updated Context Formatter ---
 def format_context_and_extract_sources(
@@ -31,17 +101,19 @@ def format_context_and_extract_sources(
 ) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Formats retrieved documents into context text for LLM and extracts source info,
-    including the text snippet for storage and API response.
+    including the text snippet for storage and API response. Documents without
+    text (slim metadata) are resolved from the page store first.
     """
     context_parts = []
     sources = []
 
     if not documents:
         logger.warning("No documents provided for context formatting.")
-        return "No relevant context found.", []
+        return NO_CONTEXT_TEXT, []
 
-    logger.debug(f"Formatting context from {len(documents)} documents.")
+    logger.debug("Formatting context from %d documents.", len(documents))
     try:
+        documents = _merge_documents(_resolve_texts(documents))
         for i, doc in enumerate(documents):
             metadata = doc.metadata
             doc_id = doc.id
@@ -51,41 +123,21 @@ def format_context_and_extract_sources(
                 logger.warning(f"Skipping document {doc_id} due to missing metadata or text.")
                 continue # Skip this document
 
-            logger.debug(f"Processing doc ID: {doc_id}, Metadata Text (first 100 chars): '{metadata.text[:100]}'")
-
-            # Extract book_id and generate URL
-            book_id = metadata.book_id or (doc_id.split('_')[0] if '_' in doc_id else None)
-            source_url = f"https://shamela.ws/book/{book_id}" if book_id else None
+            logger.debug("Processing doc ID: %s, Metadata Text (first 100 chars): '%.100s'", doc_id, metadata.text)
 
             # Limit the text snippet length
-            raw_text = metadata.text
-            text_snippet = raw_text[:CONTEXT_SNIPPET_MAX_LENGTH]
-            if len(raw_text) > CONTEXT_SNIPPET_MAX_LENGTH:
-                text_snippet += "..."
+            text_snippet = _snippet(metadata.text)
 
             # Format for the prompt context (context_parts)
-            context_parts.append(
-                f"Source Document [ID: {doc_id}]\n"
-                f"Book: {metadata.book_name or 'Unknown'}\n"
-                f"Section: {metadata.section_title or 'Unknown'}\n"
-                f"Content: {text_snippet}\n---\n"
-            )
+            context_parts.append(_format_passage(doc, text_snippet))
 
             # Store structured source info for storage/API (sources list)
-            sources.append({
-                "document_id": doc_id,
-                "book_id": book_id,
-                "book_name": metadata.book_name,
-                "title": metadata.section_title,
-                "score": doc.score,
-                "url": source_url,
-                "content": text_snippet
-            })
+            sources.append(_source_entry(doc, text_snippet))
 
         context_text = "\n".join(context_parts)
         logger.debug("Successfully formatted context and extracted sources.")
         if sources:
-            logger.debug(f"Sample source item structure: {sources[0]}")
+            logger.debug("Sample source item structure: %s", sources[0])
         return context_text, sources
 
     except AttributeError as e:
@@ -95,6 +147,134 @@ def format_context_and_extract_sources(
         logger.exception(f"Unexpected error during context formatting: {e}")
         return "Error formatting context.", []
 
+# --- Token-budgeted Context Packer ---
+@dataclass
+class PackedContext:
+    """Prompt sections chosen by pack_context, with the token counts they use."""
+    context_text: str
+    history_text: str
+    sources: List[Dict[str, Any]]
+    token_counts: Dict[str, int]
+
+def _clip_highlights(highlights: List[Tuple[int, int]], content_length: int) -> List[List[int]]:
+    """Keep the part of each highlight that falls inside the (possibly snippeted) source content."""
+    limit = min(content_length, CONTEXT_SNIPPET_MAX_LENGTH)
+    return [[start, min(end, limit)] for start, end in highlights if start < limit]
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens at a UTF-8 character boundary, preferring a word break."""
+    max_bytes = max(max_tokens * BYTES_PER_TOKEN - len("...".encode("utf-8")), 0)
+    cut = text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut + "..."
+
+def pack_context(
+    query: str,
+    documents: List[DocumentMatch],
+    history: Optional[List[str]] = None,
+    token_budget: Optional[int] = None,
+    history_share: Optional[float] = None,
+    compress: Optional[bool] = None
+) -> PackedContext:
+    """
+    Fill the prompt's token budget with history and passages instead of fixed
+    snippet and message limits.
+
+    The template and query are counted first. The most recent history lines
+    are then kept, up to history_share of what remains. Whole passages are
+    added greedily by relevance score; a passage that doesn't fit is skipped,
+    unless it can be truncated to at least MIN_PASSAGE_TOKENS, which fills the
+    rest of the budget. With compression, each passage is first cut down to its
+    sentences that best match the query (see app.core.compression), and its
+    source lists the kept sentences' offsets within its "content" as
+    "highlights". Passages without text (slim metadata) are resolved from the
+    page store, and sources of whole-page passages carry their "page_rows".
+
+    Args:
+        query: The user's question
+        documents: Retrieved documents
+        history: History lines, oldest first (see history_lines)
+        token_budget: Input tokens for the whole prompt (defaults to settings.CONTEXT_TOKEN_BUDGET)
+        history_share: Maximum fraction of the remaining budget given to history
+            (defaults to settings.CONTEXT_HISTORY_MAX_SHARE)
+        compress: Compress passages before packing (defaults to settings.CONTEXT_COMPRESSION_ENABLED)
+
+    Returns:
+        PackedContext with context text, history text, sources of the included
+        passages and the token counts used
+    """
+    budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+    share = settings.CONTEXT_HISTORY_MAX_SHARE if history_share is None else history_share
+    template_tokens = count_tokens(settings.PROMPT_TEMPLATE.format(history="", context_text="", query=""))
+    query_tokens = count_tokens(query)
+    available = max(budget - template_tokens - query_tokens, 0)
+
+    # History: newest lines first, stopping at the first that doesn't fit
+    kept_lines: List[str] = []
+    history_tokens = 0
+    history_cap = int(available * share)
+    for line in reversed(history or []):
+        cost = count_tokens(line) + 1
+        if history_tokens + cost > history_cap:
+            break
+        kept_lines.append(line)
+        history_tokens += cost
+    kept_lines.reverse()
+
+    # Passages: greedily by relevance
+    remaining = available - history_tokens
+    context_parts: List[str] = []
+    sources: List[Dict[str, Any]] = []
+    dropped = 0
+    candidates = [doc for doc in _merge_documents(_resolve_texts(documents or []))
+                  if doc.metadata and doc.metadata.text]
+    candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+    use_compression = settings.CONTEXT_COMPRESSION_ENABLED if compress is None else compress
+    compressed = compress_documents(query, candidates) if use_compression and candidates else None
+    saved = 0
+    for position, doc in enumerate(candidates):
+        content = compressed[position].text if compressed else doc.metadata.text
+        passage = _format_passage(doc, content)
+        cost = count_tokens(passage) + 1
+        if cost > remaining:
+            room = remaining - count_tokens(_format_passage(doc, "")) - 1
+            if room < MIN_PASSAGE_TOKENS:
+                dropped += 1
+                continue
+            content = _truncate_to_tokens(content, room)
+            passage = _format_passage(doc, content)
+            cost = count_tokens(passage) + 1
+        context_parts.append(passage)
+        source = _source_entry(doc, _snippet(doc.metadata.text))
+        if compressed:
+            saved += compressed[position].original_tokens - compressed[position].compressed_tokens
+            source["highlights"] = _clip_highlights(compressed[position].highlights, len(source["content"]))
+        sources.append(source)
+        remaining -= cost
+
+    context_tokens = available - history_tokens - remaining
+    token_counts = {
+        "budget": budget,
+        "template": template_tokens,
+        "query": query_tokens,
+        "history": history_tokens,
+        "context": context_tokens,
+        "total": template_tokens + query_tokens + history_tokens + context_tokens,
+        "history_messages": len(kept_lines),
+        "passages": len(context_parts),
+        "passages_dropped": dropped,
+        "compression_saved": saved,
+    }
+    logger.info(f"Packed prompt context: {token_counts}")
+    return PackedContext(
+        context_text="\n".join(context_parts) if context_parts else NO_CONTEXT_TEXT,
+        history_text="\n".join(kept_lines) if kept_lines else NO_HISTORY_TEXT,
+        sources=sources,
+        token_counts=token_counts,
+    )
+
 # --- Updated Prompt Constructor ---
 def construct_llm_prompt(history_text: str, context_text: str, query: str) -> str:
     """
@@ -105,5 +285,5 @@ def construct_llm_prompt(history_text: str, context_text: str, query: str) -> st
         context_text=context_text,
         query=query
     )
-    logger.debug(f"Constructed LLM Prompt (start): {prompt[:300]}...")
+    logger.debug("Constructed LLM Prompt (start): %.300s...", prompt)
     return prompt
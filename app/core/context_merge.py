@@ -0,0 +1,163 @@
+# app/core/context_merge.py
+"""
+Context post-processing: merge overlapping and adjacent chunks.
+
+Chunks are cut with CHUNK_OVERLAP characters of overlap, and neighbouring
+chunks of the same section are often retrieved together, so the prompt would
+repeat the same text two or three times. merge_overlapping_documents() joins
+chunks of the same book and section that overlap, contain one another or are
+consecutive (by the chunk_index in their metadata) into one passage,
+drops exact duplicate passages, and records every merged chunk id in
+DocumentMatch.merged_ids so no citation is lost.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.models.schemas import DocumentMatch
+from app.utils.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+MIN_OVERLAP_CHARS = 20  # Shorter suffix/prefix matches are treated as coincidence
+
+
+def _split_chunk_id(doc: DocumentMatch) -> Tuple[str, Optional[int]]:
+    """
+    Split a chunked id ("{book}_{section}_{index}", "text_{hash}_{index:03d}")
+    into (prefix, index), using the chunk_index recorded at ingestion.
+
+    Ids whose last part merely looks numeric, such as the legacy
+    "{category}_{book}_{section}" ids, have no chunk_index and are not split.
+    """
+    index = doc.metadata.chunk_index
+    prefix, _, suffix = doc.id.rpartition("_")
+    if index is not None and prefix and suffix.isdigit() and int(suffix) == index:
+        return prefix, index
+    return doc.id, None
+
+
+def suffix_prefix_overlap(first: str, second: str) -> int:
+    """
+    Length of the longest suffix of first that is also a prefix of second
+    (0 if shorter than MIN_OVERLAP_CHARS).
+    """
+    limit = min(len(first), len(second))
+    if limit < MIN_OVERLAP_CHARS:
+        return 0
+    # Any qualifying overlap starts with these characters of second
+    probe = second[:MIN_OVERLAP_CHARS]
+    position = first.find(probe, len(first) - limit)
+    while position != -1:
+        # The earliest match is the longest overlap
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+def _merge_texts(first: str, second: str, consecutive: bool) -> Optional[str]:
+    """Join two chunk texts, or return None if they are neither overlapping nor consecutive."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap = suffix_prefix_overlap(first, second)
+    if overlap:
+        return first + second[overlap:]
+    if consecutive:
+        return f"{first} {second}"
+    return None
+
+
+def _combine(run: List[Tuple[int, DocumentMatch]], text: str) -> Tuple[int, DocumentMatch]:
+    rank = min(position for position, _ in run)
+    lead = run[0][1]
+    ids: List[str] = []
+    for _, doc in run:
+        for chunk_id in doc.merged_ids or [doc.id]:
+            if chunk_id not in ids:
+                ids.append(chunk_id)
+    # The passage covers the page rows of its first to last chunk, if all are whole pages
+    rows = [(doc.metadata.page_row_start, doc.metadata.page_row_end) for _, doc in run]
+    whole_pages = all(start is not None and end is not None for start, end in rows)
+    merged = lead.model_copy(update={
+        "score": max(doc.score for _, doc in run),
+        "metadata": lead.metadata.model_copy(update={
+            "text": text,
+            "page_row_start": rows[0][0] if whole_pages else None,
+            "page_row_end": rows[-1][1] if whole_pages else None,
+        }),
+        "merged_ids": ids if len(ids) > 1 else lead.merged_ids,
+    })
+    return rank, merged
+
+
+def merge_overlapping_documents(documents: List[DocumentMatch]) -> List[DocumentMatch]:
+    """
+    Merge overlapping, contained and consecutive chunks of the same book and
+    section, and drop exact duplicates.
+
+    Args:
+        documents: Retrieved documents, most relevant first
+
+    Returns:
+        Passages in the order of their most relevant chunk. A merged passage
+        keeps its first chunk's id and metadata, the best score of its chunks,
+        and lists all chunk ids in merged_ids.
+    """
+    if not documents or len(documents) < 2:
+        return list(documents or [])
+
+    groups: Dict[Tuple, List[Tuple[int, DocumentMatch, Optional[int]]]] = {}
+    for position, doc in enumerate(documents):
+        if not doc.metadata or not doc.metadata.text:
+            groups[("unmergeable", position)] = [(position, doc, None)]
+            continue
+        prefix, index = _split_chunk_id(doc)
+        if index is None:  # Not a chunk of a known section: only exact duplicates are merged
+            groups[("unindexed", position)] = [(position, doc, None)]
+            continue
+        key = (doc.metadata.book_id, doc.metadata.section_title, prefix)
+        groups.setdefault(key, []).append((position, doc, index))
+
+    passages: List[Tuple[int, DocumentMatch]] = []
+    for members in groups.values():
+        if len(members) == 1:
+            passages.append((members[0][0], members[0][1]))
+            continue
+        members.sort(key=lambda member: member[2])
+        run = [(members[0][0], members[0][1])]
+        text, last_index = members[0][1].metadata.text, members[0][2]
+        for position, doc, index in members[1:]:
+            consecutive = index is not None and last_index is not None and index == last_index + 1
+            merged_text = _merge_texts(text, doc.metadata.text, consecutive)
+            if merged_text is None:
+                passages.append(_combine(run, text))
+                run, text = [(position, doc)], doc.metadata.text
+            else:
+                run.append((position, doc))
+                text = merged_text
+            last_index = index
+        passages.append(_combine(run, text))
+
+    passages.sort(key=lambda passage: passage[0])
+
+    # Exact duplicates across books or sections (same text after normalization)
+    unique: List[DocumentMatch] = []
+    seen: Dict[str, int] = {}
+    for _, doc in passages:
+        key = normalize_text(doc.metadata.text) if doc.metadata and doc.metadata.text else None
+        if key is None or key not in seen:
+            if key is not None:
+                seen[key] = len(unique)
+            unique.append(doc)
+            continue
+        kept = unique[seen[key]]
+        ids = list(kept.merged_ids or [kept.id])
+        ids.extend(chunk_id for chunk_id in doc.merged_ids or [doc.id] if chunk_id not in ids)
+        unique[seen[key]] = kept.model_copy(update={"merged_ids": ids})
+
+    if len(unique) < len(documents):
+        logger.info(f"Merged {len(documents)} retrieved chunks into {len(unique)} passages")
+    return unique
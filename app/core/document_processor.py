@@ -1,21 +1,78 @@
 # app/core/document_processor.py (new file)
 """Module for processing documents from the Shamela Library."""
 
+import asyncio
 import requests
 import re
 import hashlib
+import threading
+from collections import OrderedDict
 from urllib.parse import urlparse
+import httpx
 from bs4 import BeautifulSoup
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional, Union
 import logging
-# ... other imports ...
+
+from app.utils.helpers import BYTES_PER_TOKEN
+
+try:
+    import lxml  # noqa: F401  Optional: several times faster than html.parser
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
 logger = logging.getLogger(__name__)
 
+FETCH_TIMEOUT_SECONDS = 30
+MAX_CONNECTIONS = 32
+PER_HOST_CONCURRENCY = 4
+VALIDATOR_CACHE_SIZE = 512  # Documents kept with their ETag/Last-Modified for conditional GETs
+
+# url -> (etag, last_modified, body), shared by the sync and async fetchers
+_validator_cache: "OrderedDict[str, Tuple[Optional[str], Optional[str], str]]" = OrderedDict()
+_validator_lock = threading.Lock()
+_session = requests.Session()  # Pooled connections for synchronous fetches
+
+
+def _conditional_headers(url: str) -> Dict[str, str]:
+    with _validator_lock:
+        cached = _validator_cache.get(url)
+    headers = {}
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _cached_body(url: str) -> Optional[str]:
+    with _validator_lock:
+        cached = _validator_cache.get(url)
+        if cached:
+            _validator_cache.move_to_end(url)
+    return cached[2] if cached else None
+
+
+def _remember(url: str, headers, body: str) -> None:
+    etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    with _validator_lock:
+        _validator_cache[url] = (etag, last_modified, body)
+        _validator_cache.move_to_end(url)
+        while len(_validator_cache) > VALIDATOR_CACHE_SIZE:
+            _validator_cache.popitem(last=False)
+
+
 def fetch_document(url: str) -> Optional[str]:
     """
     Fetch document content from URL.
     
+    Uses a pooled session and a conditional GET when the document was fetched
+    before with an ETag or Last-Modified header.
+    
     Args:
         url: URL of the document to fetch
         
@@ -23,24 +80,99 @@ def fetch_document(url: str) -> Optional[str]:
         Document content as text or None if fetch fails
     """
     try:
-        response = requests.get(url, timeout=30)
+        response = _session.get(url, timeout=FETCH_TIMEOUT_SECONDS, headers=_conditional_headers(url))
+        if response.status_code == 304:
+            return _cached_body(url)
         response.raise_for_status()
+        _remember(url, response.headers, response.text)
         return response.text
     except Exception as e:
         logger.error(f"Failed to fetch document from {url}: {e}")
         return None
 
-def extract_shamela_metadata(content: str) -> Dict[str, str]:
+
+class DocumentFetcher:
+    """
+    Async document fetcher with connection pooling, a per-host concurrency
+    limit and conditional GETs (ETag/Last-Modified).
+
+    Use as an async context manager:
+        async with DocumentFetcher() as fetcher:
+            pages = await fetcher.fetch_many(urls)
+    """
+
+    def __init__(self,
+                 max_connections: int = MAX_CONNECTIONS,
+                 per_host_concurrency: int = PER_HOST_CONCURRENCY,
+                 timeout: float = FETCH_TIMEOUT_SECONDS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.per_host_concurrency = per_host_concurrency
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "DocumentFetcher":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_semaphores[host]
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """Fetch one document; returns None on failure."""
+        try:
+            async with self._semaphore(url):
+                response = await self._client.get(url, headers=_conditional_headers(url))
+            if response.status_code == 304:
+                return _cached_body(url)
+            response.raise_for_status()
+            _remember(url, response.headers, response.text)
+            return response.text
+        except Exception as e:
+            logger.error(f"Failed to fetch document from {url}: {e}")
+            return None
+
+    async def fetch_many(self, urls: List[str]) -> List[Optional[str]]:
+        """Fetch documents concurrently; results are aligned with urls."""
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+
+def fetch_documents(urls: List[str]) -> List[Optional[str]]:
+    """
+    Fetch documents concurrently from synchronous code (e.g. a job worker thread).
+
+    Returns:
+        Document contents aligned with urls (None where a fetch failed)
+    """
+    async def fetch_all():
+        async with DocumentFetcher() as fetcher:
+            return await fetcher.fetch_many(urls)
+    return asyncio.run(fetch_all())
+
+
+def extract_shamela_metadata(content: Union[str, BeautifulSoup]) -> Dict[str, str]:
     """
     Extract metadata specific to Shamela Library documents.
     
     Args:
-        content: HTML content of the document
+        content: HTML content of the document, or an already parsed soup
         
     Returns:
         Dictionary of metadata
     """
-    soup = BeautifulSoup(content, 'html.parser')
+    soup = BeautifulSoup(content, HTML_PARSER) if isinstance(content, str) else content
     metadata = {}
     
     # Extract book name
@@ -68,6 +200,92 @@ def extract_shamela_metadata(content: str) -> Dict[str, str]:
     
     return metadata
 
+# One pass over each search window finds candidate cut points: sentence ends
+# (Latin and Arabic) and paragraph breaks, else clause marks; whitespace is the fallback.
+# The pattern opens with a single character class so the regex engine can skip
+# ahead to candidates instead of trying each alternative at every position.
+_WEAK_BOUNDARY_CHARS = "\u060C\u061B;:,"
+_BOUNDARY_RE = re.compile(
+    r"[.!?\u061F\u06D4\u2026\u060C\u061B;:,\n]"
+    r"(?:(?<=\n)(?=[^\S\n]*\n)|(?<!\n)[\"'\u00BB\u201D)\]]*(?=\s))"
+)
+_NON_SPACE_RE = re.compile(r"\S")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _window_end(text: str, start: int, max_size: int, unit: str) -> int:
+    """Furthest end offset such that text[start:end] fits max_size chars or estimated tokens."""
+    if unit == "chars":
+        return min(len(text), start + max_size)
+    byte_budget = max_size * BYTES_PER_TOKEN
+    size = min(len(text) - start, byte_budget)  # A character is at least one UTF-8 byte
+    while size > 1:
+        nbytes = len(text[start:start + size].encode("utf-8"))
+        if nbytes <= byte_budget:
+            break
+        size = min(size - 1, size * byte_budget // nbytes)
+    return start + max(size, 1)
+
+
+def iter_chunk_spans(text: str, max_size: int = 1000, overlap: int = 200,
+                     unit: str = "chars") -> Iterator[Tuple[int, int]]:
+    """
+    Split text into overlapping chunks, yielding (start, end) offsets into text.
+
+    Cuts prefer sentence ends (". ! ? ؟ ۔ …" and paragraph breaks), then clause
+    marks ("، ؛ ; : ,"), then a space or newline, searched in the back half of each
+    window. Nothing is copied, so chunks can be sliced lazily, and every chunk
+    starts after the previous one (overlap is capped at half a chunk).
+
+    Args:
+        text: Text to split
+        max_size: Chunk budget, in characters or estimated tokens
+        overlap: Overlap between consecutive chunks, in the same unit
+        unit: "chars" or "tokens" (see app.utils.helpers.estimate_tokens)
+
+    Yields:
+        (start, end) offsets with leading and trailing whitespace excluded
+    """
+    if unit not in ("chars", "tokens"):
+        raise ValueError(f"Unknown chunk unit: {unit}")
+    match = _NON_SPACE_RE.search(text)
+    start = match.start() if match else len(text)
+    while start < len(text):
+        limit = _window_end(text, start, max_size, unit)
+        end = limit
+        if limit < len(text):
+            search_from = start + (limit - start) // 2
+            strong = weak = -1
+            for boundary in _BOUNDARY_RE.finditer(text, search_from, limit):
+                if text[boundary.start()] in _WEAK_BOUNDARY_CHARS:
+                    weak = boundary.end()
+                else:
+                    strong = boundary.end()
+            if strong > 0 or weak > 0:
+                end = strong if strong > 0 else weak
+            else:
+                space = max(text.rfind(" ", search_from, limit), text.rfind("\n", search_from, limit))
+                if space > start:
+                    end = space
+
+        trimmed_end = end
+        while trimmed_end > start and text[trimmed_end - 1].isspace():
+            trimmed_end -= 1
+        yield start, trimmed_end
+
+        if end >= len(text):
+            return
+        # Overlap in characters, capped at half the chunk so every chunk moves forward
+        overlap_chars = overlap if unit == "chars" else overlap * (end - start) // max(max_size, 1)
+        next_start = end - min(overlap_chars, (end - start) // 2)
+        if next_start < end:
+            space = _WHITESPACE_RE.search(text, next_start, end)  # Don't start mid-word
+            if space:
+                next_start = space.end()
+        match = _NON_SPACE_RE.search(text, max(next_start, start + 1))
+        start = match.start() if match else len(text)
+
+
 def chunk_text(text: str, max_chunk_size: int = 1000, overlap: int = 200) -> List[str]:
     """
     Split text into overlapping chunks of approximately max_chunk_size characters.
@@ -78,49 +296,9 @@ def chunk_text(text: str, max_chunk_size: int = 1000, overlap: int = 200) -> Lis
         overlap: Number of characters to overlap between chunks
         
     Returns:
-        List of text chunks
+        List of text chunks with whitespace collapsed
     """
-    # Clean text - remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # If text is short, return it as is
-    if len(text) <= max_chunk_size:
-        return [text]
-    
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        # Get chunk of max_chunk_size or remainder
-        end = min(start + max_chunk_size, len(text))
-        
-        # Try to find a sentence boundary to end on
-        if end < len(text):
-            # Look for sentence ending punctuation followed by space
-            # within the last 200 characters of the chunk
-            search_from = max(end - 200, start + 200)  # Don't search too close to start
-            search_text = text[search_from:end]
-            
-            # Find last occurrence of sentence boundary
-            sentence_end = max(
-                search_text.rfind('. '),
-                search_text.rfind('! '),
-                search_text.rfind('? '),
-                search_text.rfind('.\n'),
-                search_text.rfind('!\n'),
-                search_text.rfind('?\n')
-            )
-            
-            if sentence_end != -1:
-                end = search_from + sentence_end + 2  # Include the punctuation and space
-        
-        # Add chunk
-        chunks.append(text[start:end].strip())
-        
-        # Move to next chunk with overlap
-        start = end - overlap
-    
-    return chunks
+    return [" ".join(text[start:end].split()) for start, end in iter_chunk_spans(text, max_chunk_size, overlap)]
 
 def generate_stable_document_id(url: str, metadata: Dict[str, str]) -> str:
     """
@@ -148,26 +326,23 @@ def generate_stable_document_id(url: str, metadata: Dict[str, str]) -> str:
     id_string = "_".join([part for part in id_parts if part])
     return f"shamela_{hashlib.sha256(id_string.encode()).hexdigest()[:24]}"
 
-def process_document(url: str) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+def parse_document(url: str, content: str) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
     """
-    Process a document from URL to chunks with embeddings.
+    Parse a fetched document once and split it into chunks.
     
     Args:
-        url: Document URL
+        url: Document URL (used for IDs and metadata)
+        content: HTML content of the document
         
     Returns:
-        Tuple of (document_chunks, metadata) or (None, None) if processing fails
+        Tuple of (document_chunks, metadata) or (None, None) if parsing fails
     """
-    # Fetch document
-    content = fetch_document(url)
-    if not content:
-        return None, None
+    soup = BeautifulSoup(content, HTML_PARSER)
     
     # Extract metadata
-    metadata = extract_shamela_metadata(content)
+    metadata = extract_shamela_metadata(soup)
     
     # Extract main text
-    soup = BeautifulSoup(content, 'html.parser')
     main_content = soup.select_one('.main-content')
     if not main_content:
         logger.error(f"Could not find main content in document: {url}")
@@ -197,4 +372,21 @@ def process_document(url: str) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
             "metadata": chunk_metadata
         })
     
-    return result, metadata
\ No newline at end of file
+    return result, metadata
+
+def process_document(url: str, content: Optional[str] = None) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+    """
+    Process a document from URL to chunks.
+    
+    Args:
+        url: Document URL
+        content: Already fetched HTML (e.g. from DocumentFetcher); fetched if omitted
+        
+    Returns:
+        Tuple of (document_chunks, metadata) or (None, None) if processing fails
+    """
+    if content is None:
+        content = fetch_document(url)
+    if not content:
+        return None, None
+    return parse_document(url, content)
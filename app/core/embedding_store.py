@@ -0,0 +1,326 @@
+# app/core/embedding_store.py
+"""
+Binary, sharded embedding store.
+
+Embeddings are kept as float32 (or float16) ``.npy`` shards that are
+memory-mapped on read, instead of CSV cells holding stringified Python lists.
+Each shard has a JSON-lines sidecar mapping its rows to a chunk id, a content
+hash and optional vector metadata, and ``manifest.json`` lists the shards in
+order. A store directory looks like::
+
+    manifest.json
+    shard_00000.npy
+    shard_00000.jsonl
+    shard_00001.npy
+    ...
+
+Appends first fill the last shard up to shard_rows, then start new ones, so
+frequent small flushes don't leave thousands of tiny shards. New shards and
+the manifest are written to temporary files and renamed into place; a shard
+is extended in place (rows appended, then its fixed-size .npy header
+rewritten). The manifest row count is authoritative: readers ignore rows past
+it, and the next append truncates them, so an interrupted append never
+exposes half-written rows.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+NPY_HEADER_BYTES = 128  # Fixed .npy header size, so the row count can be rewritten in place
+
+
+def _npy_header(dtype: str, rows: int, dim: int, size: int = NPY_HEADER_BYTES) -> bytes:
+    """A version 1.0 .npy header of exactly size bytes for a C-ordered (rows, dim) array."""
+    prefix = b"\x93NUMPY\x01\x00"
+    body_size = size - len(prefix) - 2
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                   "shape": (rows, dim)})
+    if len(header) + 1 > body_size:
+        raise ValueError(f"Header for {rows} rows does not fit in {size} bytes")
+    return prefix + body_size.to_bytes(2, "little") + (header.ljust(body_size - 1) + "\n").encode("latin1")
+
+
+def _atomic_write_bytes(path: str, write) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class EmbeddingStore:
+    """Append-only store of embedding vectors in memory-mapped .npy shards."""
+
+    def __init__(self,
+                 path: str,
+                 dim: Optional[int] = None,
+                 dtype: Optional[str] = None,
+                 shard_rows: Optional[int] = None):
+        """
+        Open (or prepare) a store directory.
+
+        Args:
+            path: Store directory; created on first append
+            dim: Vector dimension; required for a new store, checked against an existing one
+            dtype: "float32" or "float16" (defaults to settings.EMBEDDING_STORE_DTYPE)
+            shard_rows: Maximum rows per shard (defaults to settings.EMBEDDING_STORE_SHARD_ROWS)
+        """
+        self.path = path
+        self.shard_rows = shard_rows or settings.EMBEDDING_STORE_SHARD_ROWS
+        self._row_cache: Dict[str, List[Dict[str, Any]]] = {}
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            if dim is not None and dim != self.manifest["dim"]:
+                raise ValueError(f"Store {path} has dimension {self.manifest['dim']}, not {dim}")
+            if dtype is not None and dtype != self.manifest["dtype"]:
+                raise ValueError(f"Store {path} has dtype {self.manifest['dtype']}, not {dtype}")
+        else:
+            dtype = dtype or settings.EMBEDDING_STORE_DTYPE
+            if dtype not in SUPPORTED_DTYPES:
+                raise ValueError(f"Unsupported embedding dtype: {dtype}")
+            self.manifest = {"version": MANIFEST_VERSION, "dim": dim, "dtype": dtype, "shards": []}
+
+    # --- Properties ---
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.manifest["dim"]
+
+    @property
+    def dtype(self) -> str:
+        return self.manifest["dtype"]
+
+    @property
+    def shard_names(self) -> List[str]:
+        return [shard["name"] for shard in self.manifest["shards"]]
+
+    def __len__(self) -> int:
+        return sum(shard["rows"] for shard in self.manifest["shards"])
+
+    # --- Validation ---
+
+    def check_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Vectorised validation of a block of vectors.
+
+        Returns:
+            Boolean mask of rows containing NaN or infinite values
+
+        Raises:
+            ValueError: If the block is not 2-D with the store's dimension
+        """
+        if vectors.ndim != 2 or (self.dim is not None and vectors.shape[1] != self.dim):
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}")
+        return ~np.isfinite(vectors).all(axis=1)
+
+    def validate(self) -> Dict[str, Any]:
+        """
+        Check every shard for dimension mismatches, non-finite values and
+        row-count drift between the .npy file and its sidecar.
+
+        Returns:
+            Report with total rows, per-shard problems and global indices of bad rows
+        """
+        report = {"rows": 0, "bad_shards": [], "bad_rows": [], "duplicate_ids": 0}
+        seen_ids: Set[str] = set()
+        offset = 0
+        for name, rows, vectors in self.iter_shards():
+            problems = []
+            if vectors.shape[0] != len(rows):
+                problems.append(f"{vectors.shape[0]} vectors but {len(rows)} manifest rows")
+            try:
+                bad = np.flatnonzero(self.check_vectors(vectors))
+                report["bad_rows"].extend((bad + offset).tolist())
+            except ValueError as e:
+                problems.append(str(e))
+            for row in rows:
+                if row["id"] in seen_ids:
+                    report["duplicate_ids"] += 1
+                seen_ids.add(row["id"])
+            if problems:
+                report["bad_shards"].append({"shard": name, "problems": problems})
+            offset += len(rows)
+        report["rows"] = offset
+        return report
+
+    # --- Writing ---
+
+    def append(self,
+               ids: Sequence[str],
+               hashes: Sequence[str],
+               vectors: Any,
+               metadata: Optional[Sequence[Optional[Dict[str, Any]]]] = None) -> int:
+        """
+        Append vectors with their chunk ids, content hashes and optional metadata.
+
+        Args:
+            ids: Chunk id of each vector
+            hashes: Content hash of each vector's source text
+            vectors: Array-like of shape (n, dim)
+            metadata: Optional per-row metadata (e.g. the Pinecone metadata)
+
+        Returns:
+            Number of rows appended
+
+        Raises:
+            ValueError: On length mismatches, wrong dimension or non-finite values
+        """
+        array = np.asarray(vectors, dtype=self.dtype)
+        if len(array) == 0:
+            return 0
+        if self.dim is None and array.ndim == 2:
+            self.manifest["dim"] = int(array.shape[1])
+        if not (len(ids) == len(hashes) == len(array)) or (metadata is not None and len(metadata) != len(array)):
+            raise ValueError("ids, hashes, vectors and metadata must have the same length")
+        bad_rows = self.check_vectors(array)
+        if bad_rows.any():
+            raise ValueError(f"{int(bad_rows.sum())} vectors contain NaN or infinite values")
+
+        os.makedirs(self.path, exist_ok=True)
+        records = [
+            {"id": str(ids[i]), "hash": hashes[i], **({"metadata": metadata[i]} if metadata and metadata[i] else {})}
+            for i in range(len(array))
+        ]
+        start = 0
+        last = self.manifest["shards"][-1] if self.manifest["shards"] else None
+        if last is not None and last["rows"] < self.shard_rows:
+            take = min(self.shard_rows - last["rows"], len(array))
+            if self._extend_shard(last, array[:take], records[:take]):
+                start = take
+                self._write_manifest()
+
+        for start in range(start, len(array), self.shard_rows):
+            end = min(start + self.shard_rows, len(array))
+            name = f"shard_{len(self.manifest['shards']):05d}"
+            rows = records[start:end]
+            block = np.ascontiguousarray(array[start:end])
+            payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+            _atomic_write_bytes(os.path.join(self.path, f"{name}.npy"),
+                                lambda f: (f.write(_npy_header(self.dtype, len(block), self.dim)),
+                                           f.write(block.tobytes())))
+            _atomic_write_bytes(os.path.join(self.path, f"{name}.jsonl"), lambda f: f.write(payload))
+            self.manifest["shards"].append({"name": name, "rows": end - start, "jsonl_bytes": len(payload)})
+            self._row_cache[name] = rows
+            self._write_manifest()
+
+        logger.debug("Appended %d vectors to embedding store %s", len(array), self.path)
+        return len(array)
+
+    def _jsonl_bytes(self, shard: Dict[str, Any]) -> int:
+        """Size of the sidecar up to the shard's committed rows (older manifests don't record it)."""
+        if "jsonl_bytes" in shard:
+            return shard["jsonl_bytes"]
+        size = 0
+        with open(os.path.join(self.path, f"{shard['name']}.jsonl"), "rb") as f:
+            for _ in range(shard["rows"]):
+                size += len(f.readline())
+        return size
+
+    def _extend_shard(self, shard: Dict[str, Any], block: np.ndarray, rows: List[Dict[str, Any]]) -> bool:
+        """
+        Append rows to an existing shard in place and update its manifest entry.
+
+        Returns:
+            False (nothing written) if the shard's .npy header cannot be rewritten in place
+        """
+        name = shard["name"]
+        npy_path = os.path.join(self.path, f"{name}.npy")
+        new_rows = shard["rows"] + len(block)
+        with open(npy_path, "r+b") as f:
+            if np.lib.format.read_magic(f) != (1, 0):
+                return False
+            np.lib.format.read_array_header_1_0(f)
+            data_offset = f.tell()
+            try:
+                header = _npy_header(self.dtype, new_rows, self.dim, data_offset)
+            except ValueError:
+                return False
+            row_bytes = self.dim * np.dtype(self.dtype).itemsize
+            f.truncate(data_offset + shard["rows"] * row_bytes)  # Drop rows of an interrupted append
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(block).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+
+        jsonl_bytes = self._jsonl_bytes(shard)
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        with open(os.path.join(self.path, f"{name}.jsonl"), "r+b") as f:
+            f.truncate(jsonl_bytes)
+            f.seek(0, os.SEEK_END)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if name in self._row_cache:
+            self._row_cache[name].extend(rows)
+        shard["rows"] = new_rows
+        shard["jsonl_bytes"] = jsonl_bytes + len(payload)
+        return True
+
+    def _write_manifest(self) -> None:
+        payload = json.dumps(self.manifest, indent=2).encode("utf-8")
+        _atomic_write_bytes(os.path.join(self.path, MANIFEST_FILE), lambda f: f.write(payload))
+
+    # --- Reading ---
+
+    def _committed_rows(self, name: str) -> int:
+        for shard in self.manifest["shards"]:
+            if shard["name"] == name:
+                return shard["rows"]
+        raise KeyError(f"No shard {name} in store {self.path}")
+
+    def load_vectors(self, name: str) -> np.ndarray:
+        """Memory-map a shard's committed vectors (zero-copy, read-only)."""
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")[:self._committed_rows(name)]
+
+    def load_rows(self, name: str) -> List[Dict[str, Any]]:
+        """Load a shard's committed row records (id, hash, optional metadata)."""
+        if name not in self._row_cache:
+            committed = self._committed_rows(name)
+            rows = []
+            with open(os.path.join(self.path, f"{name}.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(rows) == committed:
+                        break
+                    if line.strip():
+                        rows.append(json.loads(line))
+            self._row_cache[name] = rows
+        return self._row_cache[name]
+
+    def iter_shards(self) -> Iterator[Tuple[str, List[Dict[str, Any]], np.ndarray]]:
+        """Yield (shard name, row records, memory-mapped vectors) for every shard in order."""
+        for name in self.shard_names:
+            yield name, self.load_rows(name), self.load_vectors(name)
+
+    def iter_rows(self) -> Iterator[Tuple[Dict[str, Any], np.ndarray]]:
+        """Yield (row record, vector) pairs across all shards."""
+        for _, rows, vectors in self.iter_shards():
+            for row, vector in zip(rows, vectors):
+                yield row, vector
+
+    def ids(self) -> Set[str]:
+        """Chunk ids present in the store."""
+        return {row["id"] for name in self.shard_names for row in self.load_rows(name)}
+
+    def hashes(self) -> Set[str]:
+        """Content hashes present in the store."""
+        return {row["hash"] for name in self.shard_names for row in self.load_rows(name)}
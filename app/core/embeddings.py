@@ -15,10 +15,23 @@ The module is separated from API endpoints to:
 - Provide a clean abstraction over the embedding API
 """
 
+import asyncio
+import bisect
 import logging
+import queue
+import random
+import threading
 import time
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 from app.config.settings import settings
+from app.core.metrics import UPSTREAM_ERRORS, UPSTREAM_RETRIES
+from app.core.timing import timed
+from app.core.tracing import CLIENT, current_span, propagate, span, traced
+from app.utils.helpers import estimate_tokens
+from app.utils.normalization import normalize_batch, normalize_text
 from mistralai import Mistral  # Import Mistral client directly
 
 logger = logging.getLogger(__name__)
@@ -59,7 +72,8 @@ def get_text_embedding(text: str) -> Optional[List[float]]:
 
     Note:
         This function handles a single text. For batch processing,
-        use get_embeddings_in_chunks
+        use get_embeddings_in_chunks. The text is normalized with the
+        configured profile, exactly as ingested chunks are.
     """
     client = ensure_mistral_client()
     if not client:
@@ -67,13 +81,16 @@ def get_text_embedding(text: str) -> Optional[List[float]]:
         return None
 
     try:
+        text = normalize_text(text)
         # The Mistral client expects inputs as a list, even for single items
-        logger.debug(f"Generating embedding for text: {text[:50]}...")
+        logger.debug("Generating embedding for text: %.50s...", text)
 
-        response = client.embeddings.create(
-            model="mistral-embed",
-            inputs=[text]
-        )
+        with span("mistral.embed", kind=CLIENT, model=settings.EMBEDDING_MODEL, inputs=1,
+                  tokens=estimate_tokens(text)):
+            response = client.embeddings.create(
+                model=settings.EMBEDDING_MODEL,
+                inputs=[text]
+            )
 
         # Extract the embedding from the response
         embedding = response.data[0].embedding
@@ -113,7 +130,7 @@ def get_embeddings_in_chunks(text_list: List[str],
             logger.info(f"Attempt {attempt+1} to get embeddings for batch")
 
             response = mistral_client.embeddings.create(
-                model="mistral-embed",
+                model=settings.EMBEDDING_MODEL,
                 inputs=text_list
             )
 
@@ -127,4 +144,357 @@ def get_embeddings_in_chunks(text_list: List[str],
             attempt += 1
 
     logger.error("Failed to process batch after multiple retries")
-    return [None] * len(text_list)  # Return a list of None values matching input length
\ No newline at end of file
+    return [None] * len(text_list)  # Return a list of None values matching input length
+
+# --- Token-aware batching ---
+
+RATE_LIMIT_WINDOW_SECONDS = 60.0
+
+class EmbeddingRateLimiter:
+    """
+    Sliding one-minute window limiting both requests and tokens per minute.
+
+    Thread-safe, so concurrent batch workers share a single budget. A limit
+    of zero or less disables that limit.
+    """
+
+    def __init__(self,
+                 requests_per_minute: int,
+                 tokens_per_minute: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._condition = threading.Condition()
+
+    def _prune(self, now: float) -> None:
+        while self._events and now - self._events[0][0] >= RATE_LIMIT_WINDOW_SECONDS:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def try_acquire(self, tokens: int) -> float:
+        """
+        Reserve budget for one request if possible.
+
+        Returns:
+            0.0 if the request may proceed, otherwise the seconds to wait before retrying
+        """
+        with self._condition:
+            now = self._clock()
+            self._prune(now)
+            within_requests = self.requests_per_minute <= 0 or len(self._events) < self.requests_per_minute
+            # An oversized request is let through on an empty window rather than blocking forever
+            within_tokens = (self.tokens_per_minute <= 0
+                             or self._tokens_in_window + tokens <= self.tokens_per_minute
+                             or not self._events)
+            if within_requests and within_tokens:
+                self._events.append((now, tokens))
+                self._tokens_in_window += tokens
+                return 0.0
+            return max(self._events[0][0] + RATE_LIMIT_WINDOW_SECONDS - now, 0.01)
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of the given token size fits in the window."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            with self._condition:
+                self._condition.wait(wait)
+
+@lru_cache()
+def get_embedding_rate_limiter() -> EmbeddingRateLimiter:
+    """Process-wide limiter so every embedding job shares the account quota."""
+    return EmbeddingRateLimiter(
+        requests_per_minute=settings.EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.EMBEDDING_TOKENS_PER_MINUTE,
+    )
+
+@lru_cache()
+def get_query_rate_limiter() -> EmbeddingRateLimiter:
+    """
+    Process-wide limiter for interactive query embeddings, separate from the
+    ingestion limiter so queries never wait behind a running ingestion job.
+    """
+    return EmbeddingRateLimiter(
+        requests_per_minute=settings.QUERY_EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.QUERY_EMBEDDING_TOKENS_PER_MINUTE,
+    )
+
+def pack_batches(token_counts: Sequence[int],
+                 max_tokens: int,
+                 max_items: int) -> List[List[int]]:
+    """
+    Greedily pack texts, in order, into batches that respect the request limits.
+
+    Args:
+        token_counts: Estimated token count of each text
+        max_tokens: Maximum total tokens per batch
+        max_items: Maximum number of texts per batch
+
+    Returns:
+        List of batches, each a list of indices into the input. A text larger
+        than max_tokens gets a batch of its own.
+    """
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _error_status_code(error: Exception) -> Optional[int]:
+    """Extract an HTTP status code from a Mistral SDK (or HTTP client) exception."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) and status_code > 0 else None
+
+@traced("mistral.embed", kind=CLIENT)
+def _embed_batch(client,
+                 texts: Sequence[str],
+                 token_counts: Sequence[int],
+                 indices: List[int],
+                 results: List[Optional[List[float]]],
+                 limiter: EmbeddingRateLimiter,
+                 max_retries: int,
+                 base_delay: float) -> None:
+    """
+    Embed one batch, writing vectors into results at their original indices.
+
+    Rate limits (429) and connection errors retry the same batch with backoff.
+    Other 4xx/5xx errors split the batch in half and retry each half, so a
+    single bad input only costs its own embedding.
+    """
+    batch_tokens = sum(token_counts[i] for i in indices)
+    current_span().set_attributes(model=settings.EMBEDDING_MODEL, inputs=len(indices), tokens=batch_tokens)
+    for attempt in range(max_retries):
+        limiter.acquire(batch_tokens)
+        current_span().set_attribute("attempts", attempt + 1)
+        try:
+            response = client.embeddings.create(
+                model=settings.EMBEDDING_MODEL,
+                inputs=[texts[i] for i in indices]
+            )
+            for i, data in zip(indices, response.data):
+                results[i] = data.embedding
+            return
+        except Exception as e:
+            status_code = _error_status_code(e)
+            UPSTREAM_ERRORS.inc(service="mistral_embed", status=status_code or "connection")
+            if status_code is not None and status_code != 429 and len(indices) > 1:
+                middle = len(indices) // 2
+                logger.warning(f"Embedding batch of {len(indices)} failed with {status_code}; splitting")
+                for half in (indices[:middle], indices[middle:]):
+                    _embed_batch(client, texts, token_counts, half, results,
+                                 limiter, max_retries, base_delay)
+                return
+            if status_code is not None and 400 <= status_code < 500 and status_code != 429:
+                logger.error(f"Embedding input {indices[0]} rejected with {status_code}: {e}")
+                current_span().set_status("error", f"HTTP {status_code}")
+                return
+            delay = base_delay * (2 ** attempt) + random.uniform(0, base_delay)
+            logger.warning(f"Embedding batch of {len(indices)} failed ({status_code or e}); "
+                           f"retrying in {delay:.1f} seconds")
+            UPSTREAM_RETRIES.inc(service="mistral_embed", status=status_code or "connection")
+            time.sleep(delay)
+
+    logger.error(f"Giving up on embedding batch of {len(indices)} texts after {max_retries} attempts")
+    current_span().set_status("error", f"Gave up after {max_retries} attempts")
+
+def embed_texts_batched(text_list: List[str],
+                        max_workers: Optional[int] = None,
+                        max_retries: int = 5,
+                        base_delay: float = 1.0,
+                        limiter: Optional[EmbeddingRateLimiter] = None) -> List[Optional[List[float]]]:
+    """
+    Generate embeddings for any number of texts with token-aware batching.
+
+    Texts are normalized with the configured profile, packed into requests up to
+    EMBEDDING_MAX_BATCH_TOKENS using a local token estimate, and up to max_workers
+    requests run concurrently under a shared requests/tokens-per-minute limiter.
+
+    Args:
+        text_list: Texts to embed
+        max_workers: Concurrent requests (defaults to settings.EMBEDDING_CONCURRENCY)
+        max_retries: Attempts per batch before giving up on it
+        base_delay: Base delay for exponential backoff in seconds
+        limiter: Rate limiter to use (defaults to the process-wide ingestion
+            limiter; interactive callers pass get_query_rate_limiter())
+
+    Returns:
+        List of embeddings aligned with text_list (None for texts that failed)
+    """
+    results: List[Optional[List[float]]] = [None] * len(text_list)
+    if not text_list:
+        return results
+
+    client = ensure_mistral_client()
+    if not client:
+        logger.error("Mistral client not available")
+        return results
+
+    limiter = limiter or get_embedding_rate_limiter()
+    max_workers = max_workers or settings.EMBEDDING_CONCURRENCY
+    text_list = normalize_batch(text_list)
+    token_counts = [estimate_tokens(text) for text in text_list]
+    batches = pack_batches(token_counts, settings.EMBEDDING_MAX_BATCH_TOKENS,
+                           settings.EMBEDDING_MAX_BATCH_SIZE)
+
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed") as executor:
+        futures = [
+            executor.submit(propagate(_embed_batch), client, text_list, token_counts, batch, results,
+                            limiter, max_retries, base_delay)
+            for batch in batches
+        ]
+        for future in futures:
+            future.result()
+
+    elapsed = time.monotonic() - start_time
+    failed = sum(1 for embedding in results if embedding is None)
+    logger.info(f"Embedded {len(text_list) - failed}/{len(text_list)} texts in {len(batches)} batches "
+                f"({elapsed:.1f}s, {sum(token_counts) / max(elapsed, 1e-6):.0f} est. tokens/s)")
+    return results
+
+# --- Query micro-batching ---
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+class QueryEmbeddingBatcher:
+    """
+    Collects concurrent single-text embedding requests into one embeddings call.
+
+    The first request of a batch waits up to max_wait_ms for others to join;
+    the batch is sent as soon as it holds max_batch_size texts or
+    EMBEDDING_MAX_BATCH_TOKENS estimated tokens. Batches are sent from a small
+    thread pool, so while one request is in flight the next batch keeps filling.
+    Usable from threads (embed) and from the event loop (embed_async). Batches
+    use the query limiter (get_query_rate_limiter), not the ingestion one.
+    """
+
+    def __init__(self,
+                 max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None,
+                 max_workers: Optional[int] = None,
+                 max_retries: int = 3,
+                 base_delay: float = 0.5,
+                 limiter: Optional[EmbeddingRateLimiter] = None):
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MICROBATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_MICROBATCH_MAX_WAIT_MS) / 1000
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._limiter = limiter
+        self._queue: "queue.Queue[Tuple[str, int, Future]]" = queue.Queue()
+        self._carry: Optional[Tuple[str, int, Future]] = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or settings.EMBEDDING_CONCURRENCY,
+                                            thread_name_prefix="query-embed")
+        self._stats_lock = threading.Lock()
+        self._bucket_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)  # Last bucket is +Inf
+        self._batches = 0
+        self._items = 0
+        self._collector = threading.Thread(target=self._collect, name="query-embed-batcher", daemon=True)
+        self._collector.start()
+
+    def submit(self, text: str) -> "Future[Optional[List[float]]]":
+        """Queue a text; the future resolves to its embedding, or None if embedding failed."""
+        future: Future = Future()
+        text = normalize_text(text)
+        self._queue.put((text, estimate_tokens(text), future))
+        return future
+
+    def embed(self, text: str) -> Optional[List[float]]:
+        """Blocking single-text embedding through the batcher."""
+        return self.submit(text).result()
+
+    async def embed_async(self, text: str) -> Optional[List[float]]:
+        """Awaitable single-text embedding through the batcher."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self) -> None:
+        while True:
+            first = self._carry or self._queue.get()
+            self._carry = None
+            batch = [first]
+            batch_tokens = first[1]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if batch_tokens + item[1] > settings.EMBEDDING_MAX_BATCH_TOKENS:
+                    self._carry = item  # Starts the next batch
+                    break
+                batch.append(item)
+                batch_tokens += item[1]
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[Tuple[str, int, Future]]) -> None:
+        texts = [text for text, _, _ in batch]
+        token_counts = [tokens for _, tokens, _ in batch]
+        results: List[Optional[List[float]]] = [None] * len(batch)
+        try:
+            client = ensure_mistral_client()
+            if client:
+                _embed_batch(client, texts, token_counts, list(range(len(batch))), results,
+                             self._limiter or get_query_rate_limiter(), self.max_retries, self.base_delay)
+            else:
+                logger.error("Mistral client not available")
+        except Exception as e:
+            logger.exception(f"Query embedding batch of {len(batch)} failed: {e}")
+        finally:
+            self._observe(len(batch))
+            for (_, _, future), embedding in zip(batch, results):
+                if not future.done():  # Awaiting request may have been cancelled
+                    future.set_result(embedding)
+
+    def _observe(self, size: int) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._bucket_counts[bisect.bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Batch-size histogram in Prometheus form: cumulative counts per upper
+        bound ("le"), plus the number of batches and of texts embedded.
+        """
+        with self._stats_lock:
+            counts = list(self._bucket_counts)
+            batches, items = self._batches, self._items
+        cumulative, buckets = 0, {}
+        for bound, count in zip([str(bound) for bound in BATCH_SIZE_BUCKETS] + ["+Inf"], counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"batches": batches, "items": items, "buckets": buckets,
+                "mean_batch_size": items / batches if batches else 0.0}
+
+@lru_cache()
+def get_query_embedding_batcher() -> QueryEmbeddingBatcher:
+    """Process-wide query embedding batcher (only used when EMBEDDING_MICROBATCH_ENABLED)."""
+    return QueryEmbeddingBatcher()
+
+async def embed_query(text: str,
+                      embed: Callable[[str], Optional[List[float]]] = get_text_embedding) -> Optional[List[float]]:
+    """
+    Embed a query without blocking the event loop.
+
+    Goes through the micro-batcher when EMBEDDING_MICROBATCH_ENABLED, otherwise
+    calls embed (get_text_embedding by default) in a worker thread.
+    """
+    with timed("embed"), span("embed.query", microbatch=settings.EMBEDDING_MICROBATCH_ENABLED):
+        if settings.EMBEDDING_MICROBATCH_ENABLED:
+            return await get_query_embedding_batcher().embed_async(text)
+        return await asyncio.to_thread(embed, text)
@@ -0,0 +1,228 @@
+"""
+Duplicate Chunk Elimination
+===========================
+Shamela holds many editions, abridgements and commentaries that repeat the same
+passages. This stage finds duplicate chunks before embedding so that each
+duplicate cluster is embedded and stored once:
+
+- Exact duplicates share a hash of their normalised text.
+- Near duplicates are found with MinHash signatures over word shingles of
+  normalised Arabic text, bucketed with LSH banding and confirmed by their
+  estimated Jaccard similarity.
+
+Signatures are computed in parallel across cores. Only signatures (a few hundred
+bytes per chunk) are kept in memory, so the stage runs in two streaming passes:
+find_duplicate_clusters() over the chunks, then apply_deduplication() over the
+same chunks again. The canonical chunk of each cluster (the longest text) is
+kept and carries the other locations as metadata.
+
+Usage:
+    python -m app.core.ingestion.dedup shamela_robust.db --threshold 0.8
+"""
+
+import argparse
+import hashlib
+import logging
+import zlib
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands x 8 rows: candidates start around 0.7 Jaccard
+SHINGLE_SIZE = 3  # Words per shingle
+DEFAULT_THRESHOLD = 0.8
+MAX_DUPLICATE_LOCATIONS = 50  # Keeps the canonical vector's metadata well under Pinecone's limit
+SIGNATURE_CHUNKSIZE = 256
+
+_MASK_32 = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(1)
+# Odd multipliers make (a * x + b) mod 2**32 a permutation of the 32-bit hash space
+_PERM_A = (_rng.randint(0, 2 ** 31, NUM_PERMUTATIONS).astype(np.uint64) * np.uint64(2) + np.uint64(1))
+_PERM_B = _rng.randint(0, 2 ** 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+def normalize_for_dedup(text: str) -> str:
+    """Strip diacritics, tatweel and punctuation and fold letter variants before shingling."""
+    return normalize_text(text, profile="dedup")
+
+
+def minhash_signature(normalized_text: str) -> Optional[np.ndarray]:
+    """
+    Compute the MinHash signature of a normalised text.
+
+    Returns:
+        uint32 array of NUM_PERMUTATIONS values, or None for empty text
+    """
+    words = normalized_text.split()
+    if not words:
+        return None
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    # crc32 is deterministic across worker processes, unlike hash()
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in set(shingles)), dtype=np.uint64)
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) & _MASK_32
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def _signature_worker(text: str) -> Tuple[str, Optional[np.ndarray]]:
+    normalized = normalize_for_dedup(text)
+    exact_key = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+    return exact_key, minhash_signature(normalized)
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def find_duplicate_clusters(
+    chunks: Iterable[Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+    processes: Optional[int] = None,
+) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+    """
+    First pass: group chunks into exact and near-duplicate clusters.
+
+    Args:
+        chunks: Chunk dictionaries with "id" and "text"
+        threshold: Minimum estimated Jaccard similarity for near duplicates
+        processes: Worker processes for signatures (None = all cores, 1 = in-process)
+
+    Returns:
+        (clusters, stats) where clusters maps each canonical chunk id to the ids
+        of its duplicates; chunks without duplicates are not listed
+    """
+    ids: List[str] = []
+    lengths: List[int] = []
+
+    def texts() -> Iterator[str]:
+        for chunk in chunks:
+            ids.append(str(chunk["id"]))
+            lengths.append(len(chunk["text"]))
+            yield chunk["text"]
+
+    if processes == 1:
+        results = [_signature_worker(text) for text in texts()]
+    else:
+        with Pool(processes) as pool:
+            results = list(pool.imap(_signature_worker, texts(), chunksize=SIGNATURE_CHUNKSIZE))
+
+    union_find = _UnionFind(len(ids))
+    stats = {"chunks": len(ids), "exact_duplicates": 0, "near_duplicates": 0, "clusters": 0}
+
+    # Exact duplicates
+    first_by_key: Dict[str, int] = {}
+    for i, (exact_key, _) in enumerate(results):
+        if exact_key in first_by_key:
+            union_find.union(first_by_key[exact_key], i)
+            stats["exact_duplicates"] += 1
+        else:
+            first_by_key[exact_key] = i
+
+    # Near duplicates: LSH candidates over the exact-unique chunks, confirmed on the full signature
+    unique = [i for i in first_by_key.values() if results[i][1] is not None]
+    if unique:
+        signatures = np.vstack([results[i][1] for i in unique])
+        rows_per_band = NUM_PERMUTATIONS // LSH_BANDS
+        for band in range(LSH_BANDS):
+            buckets: Dict[bytes, List[int]] = {}
+            band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            for position, key in enumerate(map(bytes, band_values)):
+                buckets.setdefault(key, []).append(position)
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                head = members[0]
+                similarity = (signatures[members[1:]] == signatures[head]).mean(axis=1)
+                for member, score in zip(members[1:], similarity):
+                    if score >= threshold and union_find.find(unique[member]) != union_find.find(unique[head]):
+                        union_find.union(unique[head], unique[member])
+                        stats["near_duplicates"] += 1
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(ids)):
+        groups.setdefault(union_find.find(i), []).append(i)
+
+    clusters = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        canonical = max(members, key=lambda i: (lengths[i], -i))
+        clusters[ids[canonical]] = [ids[i] for i in members if i != canonical]
+    stats["clusters"] = len(clusters)
+    logger.info(f"Duplicate detection: {stats}")
+    return clusters, stats
+
+
+def apply_deduplication(
+    chunks: Iterable[Dict[str, Any]],
+    clusters: Dict[str, List[str]],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Second pass: drop duplicate chunks and annotate each canonical chunk.
+
+    Canonical chunks get ``duplicate_ids`` (capped at MAX_DUPLICATE_LOCATIONS),
+    ``duplicate_count`` and ``duplicate_book_ids`` in their metadata, so the
+    other locations stay citable and filterable.
+
+    Args:
+        chunks: The same chunks passed to find_duplicate_clusters
+        clusters: Clusters returned by find_duplicate_clusters
+
+    Yields:
+        Unique and canonical chunks
+    """
+    duplicates = {dup_id for dup_ids in clusters.values() for dup_id in dup_ids}
+    for chunk in chunks:
+        chunk_id = str(chunk["id"])
+        if chunk_id in duplicates:
+            continue
+        dup_ids = clusters.get(chunk_id)
+        if dup_ids:
+            metadata = dict(chunk.get("metadata") or {})
+            metadata["duplicate_ids"] = dup_ids[:MAX_DUPLICATE_LOCATIONS]
+            metadata["duplicate_count"] = len(dup_ids)
+            # Chunk ids start with the book id (see section_chunker)
+            metadata["duplicate_book_ids"] = sorted({dup_id.split("_")[0] for dup_id in dup_ids})
+            chunk = {**chunk, "metadata": metadata}
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report duplicate chunks in shamela_robust.db.")
+    parser.add_argument("db_path", help="Path to shamela_robust.db")
+    parser.add_argument("--book_id", type=int, action="append", help="Book ID to process (repeatable, default: all)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Near-duplicate Jaccard threshold")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from app.core.ingestion.section_chunker import iter_dataset_chunks
+    clusters, stats = find_duplicate_clusters(
+        iter_dataset_chunks(args.db_path, args.book_id), args.threshold, args.processes
+    )
+    saved = stats["exact_duplicates"] + stats["near_duplicates"]
+    logger.info(f"{saved} of {stats['chunks']} chunks are duplicates in {stats['clusters']} clusters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Document Ingestion
+==================
+Turns one ingestion request (a Shamela URL or raw text) into Pinecone vectors:
+chunk, embed with token-aware batching, then upsert through the upsert engine.
+
+Shared by the single-document endpoint and the background job workers
+(app/core/jobs.py).
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.document_processor import chunk_text, fetch_documents, process_document
+from app.core.embeddings import embed_texts_batched
+from app.core.vector_upsert import VectorUpserter
+
+logger = logging.getLogger(__name__)
+
+PREFETCHED_HTML_KEY = "prefetched_html"
+
+
+class DocumentIngestionError(Exception):
+    """Raised when a document cannot be fetched, parsed, embedded or upserted."""
+
+
+def build_text_chunks(text: str, metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Chunk raw text with ids derived from its content, so re-ingesting the same
+    text overwrites its vectors instead of duplicating them.
+
+    Args:
+        text: Raw document text
+        metadata: Metadata attached to every chunk
+
+    Returns:
+        Chunk dictionaries with id, text and metadata
+    """
+    base_id = f"text_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:24]}"
+    chunks = chunk_text(text)
+    return [
+        {
+            "id": f"{base_id}_{i:03d}",
+            "text": chunk,
+            "metadata": {**(metadata or {}), "chunk_index": i, "total_chunks": len(chunks), "text": chunk},
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def prefetch_documents(items: List[Dict[str, Any]]) -> None:
+    """
+    Fetch the source URLs of several items concurrently and attach the HTML to
+    each item, so ingest_document() only parses and embeds them.
+
+    Args:
+        items: IngestionRequest dicts; modified in place
+    """
+    with_urls = [item for item in items if item.get("source_url") and PREFETCHED_HTML_KEY not in item]
+    if not with_urls:
+        return
+    contents = fetch_documents([str(item["source_url"]) for item in with_urls])
+    for item, content in zip(with_urls, contents):
+        if content is not None:
+            item[PREFETCHED_HTML_KEY] = content
+
+
+def ingest_document(item: Dict[str, Any], index, max_workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Ingest one document into the vector index.
+
+    Args:
+        item: An IngestionRequest as a dict (source_url or text_content, plus metadata)
+        index: Pinecone index client
+        max_workers: Concurrent embedding requests (defaults to settings.EMBEDDING_CONCURRENCY)
+
+    Returns:
+        Counts of chunks and vectors
+
+    Raises:
+        DocumentIngestionError: If any stage fails for this document
+    """
+    extra_metadata = item.get("metadata") or {}
+    if item.get("source_url"):
+        chunks, _ = process_document(str(item["source_url"]), item.get(PREFETCHED_HTML_KEY))
+        if not chunks:
+            raise DocumentIngestionError(f"Could not process document from {item['source_url']}")
+        for chunk in chunks:
+            chunk["metadata"].update(extra_metadata)
+    elif item.get("text_content"):
+        chunks = build_text_chunks(item["text_content"], extra_metadata)
+    else:
+        raise DocumentIngestionError("Either source_url or text_content must be provided")
+
+    embeddings = embed_texts_batched([chunk["text"] for chunk in chunks], max_workers=max_workers)
+    missing = sum(1 for embedding in embeddings if embedding is None)
+    if missing:
+        raise DocumentIngestionError(f"Failed to generate embeddings for {missing} of {len(chunks)} chunks")
+
+    vectors = [{"id": chunk["id"], "values": embedding, "metadata": chunk["metadata"]}
+               for chunk, embedding in zip(chunks, embeddings)]
+    stats = VectorUpserter(index).upsert(vectors)
+    if stats["failed"]:
+        raise DocumentIngestionError(f"Failed to upsert {stats['failed']} of {len(vectors)} chunks")
+
+    logger.info(f"Ingested document with {len(vectors)} chunks ({stats['vectors_per_second']} vectors/sec)")
+    return {"chunks": len(chunks), "vectors": len(vectors)}
@@ -0,0 +1,194 @@
+"""
+Idempotent Embedding Job
+========================
+Embeds chunks into the binary embedding store (app/core/embedding_store.py),
+keyed on a content hash of each chunk's normalised text and the embedding model.
+
+- A chunk whose (id, hash) pair is already stored is skipped.
+- A chunk whose hash is stored under another id reuses that vector without an API call.
+- Everything else is embedded with token-aware batching and appended in flushes.
+
+Each flush is persisted atomically, so after a crash or partial failure the
+job is simply re-run: it resumes where it stopped and only pays for missing work.
+
+Usage:
+    python -m app.core.ingestion.embedding_job shamela_robust.db --store data/embeddings --book_id 123
+"""
+
+import argparse
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config.settings import settings
+from app.core.embedding_store import EmbeddingStore
+from app.core.embeddings import embed_texts_batched
+from app.core.tracing import configure_tracing, shutdown_tracing, span
+from app.utils.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 1000  # Chunks embedded and persisted per flush
+
+def normalize_for_hash(text: str) -> str:
+    """
+    Normalise text so that formatting-only differences hash identically.
+    Uses the same profile as the embedding input, so equal hashes mean equal vectors.
+    """
+    return normalize_text(text)
+
+
+def content_hash(text: str, model: Optional[str] = None) -> str:
+    """
+    Hash a chunk's normalised text together with the embedding model name.
+
+    Args:
+        text: Chunk text
+        model: Embedding model (defaults to settings.EMBEDDING_MODEL)
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    model = model or settings.EMBEDDING_MODEL
+    return hashlib.sha256(f"{model}\n{normalize_for_hash(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingJob:
+    """Resumable job that fills an EmbeddingStore from an iterable of chunks."""
+
+    def __init__(self, store: EmbeddingStore, flush_size: int = FLUSH_SIZE, max_workers: Optional[int] = None):
+        self.store = store
+        self.flush_size = flush_size
+        self.max_workers = max_workers
+        self.stats = {"seen": 0, "skipped": 0, "reused": 0, "embedded": 0, "failed": 0}
+
+        # (id, hash) pairs already stored, and where each hash's vector lives
+        self._stored_pairs: Set[Tuple[str, str]] = set()
+        self._hash_locations: Dict[str, Tuple[str, int]] = {}
+        for name in store.shard_names:
+            for row_index, row in enumerate(store.load_rows(name)):
+                self._stored_pairs.add((row["id"], row["hash"]))
+                self._hash_locations.setdefault(row["hash"], (name, row_index))
+        logger.info(f"Embedding store {store.path} already holds {len(self._hash_locations)} distinct hashes")
+
+    def run(self, chunks: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Embed every chunk that is not already in the store.
+
+        Args:
+            chunks: Chunk dictionaries with "id", "text" and optional "metadata"
+
+        Returns:
+            Counts of seen, skipped, reused, embedded and failed chunks
+        """
+        start_time = time.monotonic()
+        pending: List[Tuple[Dict[str, Any], str]] = []
+        pending_hashes: Set[str] = set()
+        reused: List[Tuple[Dict[str, Any], str]] = []
+
+        for chunk in chunks:
+            self.stats["seen"] += 1
+            chunk_hash = content_hash(chunk["text"])
+            if (str(chunk["id"]), chunk_hash) in self._stored_pairs:
+                self.stats["skipped"] += 1
+            elif chunk_hash in self._hash_locations:
+                reused.append((chunk, chunk_hash))
+            elif chunk_hash in pending_hashes:
+                # Same text twice in this run: embed once, copy after the flush
+                reused.append((chunk, chunk_hash))
+            else:
+                pending.append((chunk, chunk_hash))
+                pending_hashes.add(chunk_hash)
+
+            if len(pending) >= self.flush_size or len(reused) >= self.flush_size:
+                # Pending first, so in-run twins find their vector when copied
+                self._flush(pending)
+                self._copy_reused(reused)
+                pending, pending_hashes, reused = [], set(), []
+
+        self._flush(pending)
+        self._copy_reused(reused)
+
+        elapsed = time.monotonic() - start_time
+        logger.info(f"Embedding job finished in {elapsed:.1f}s: {self.stats}")
+        return self.stats
+
+    def _flush(self, pending: List[Tuple[Dict[str, Any], str]]) -> None:
+        if not pending:
+            return
+        embeddings = embed_texts_batched([chunk["text"] for chunk, _ in pending], max_workers=self.max_workers)
+        done = [(chunk, chunk_hash, embedding)
+                for (chunk, chunk_hash), embedding in zip(pending, embeddings)
+                if embedding is not None]
+        self.stats["failed"] += len(pending) - len(done)
+        if not done:
+            return
+
+        self._append(done)
+        self.stats["embedded"] += len(done)
+
+    def _copy_reused(self, reused: List[Tuple[Dict[str, Any], str]]) -> None:
+        done = []
+        for chunk, chunk_hash in reused:
+            location = self._hash_locations.get(chunk_hash)
+            if location is None:  # Its twin failed to embed in this run
+                self.stats["failed"] += 1
+                continue
+            shard_name, row_index = location
+            done.append((chunk, chunk_hash, self.store.load_vectors(shard_name)[row_index]))
+        if done:
+            self._append(done)
+            self.stats["reused"] += len(done)
+
+    def _append(self, done: List[Tuple[Dict[str, Any], str, Any]]) -> None:
+        # Rows land at the end of the last shard first, then in new shards
+        rows_before = {shard["name"]: shard["rows"] for shard in self.store.manifest["shards"]}
+        self.store.append(
+            ids=[str(chunk["id"]) for chunk, _, _ in done],
+            hashes=[chunk_hash for _, chunk_hash, _ in done],
+            vectors=[vector for _, _, vector in done],
+            metadata=[chunk.get("metadata") for chunk, _, _ in done],
+        )
+        # Record where the new rows landed so later chunks can reuse them
+        new_rows = [(name, row_index, row)
+                    for name in self.store.shard_names
+                    for row_index, row in enumerate(self.store.load_rows(name))
+                    if row_index >= rows_before.get(name, 0)]
+        for name, row_index, row in new_rows:
+            self._stored_pairs.add((row["id"], row["hash"]))
+            self._hash_locations.setdefault(row["hash"], (name, row_index))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed shamela_robust.db chunks into the binary embedding store.")
+    parser.add_argument("db_path", help="Path to shamela_robust.db")
+    parser.add_argument("--store", default=settings.EMBEDDING_STORE_PATH, help="Embedding store directory")
+    parser.add_argument("--book_id", type=int, action="append", help="Book ID to process (repeatable, default: all)")
+    parser.add_argument("--max_tokens", type=int, default=None, help="Token budget per chunk")
+    parser.add_argument("--flush_size", type=int, default=FLUSH_SIZE, help="Chunks persisted per flush")
+    parser.add_argument("--dedup", action="store_true", help="Embed one canonical chunk per duplicate cluster")
+    parser.add_argument("--trace_file", default=None, help="Write trace spans to this JSON-lines file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from app.core.ingestion.section_chunker import iter_dataset_chunks
+    chunks = iter_dataset_chunks(args.db_path, args.book_id, args.max_tokens)
+    if args.dedup:
+        from app.core.ingestion.dedup import apply_deduplication, find_duplicate_clusters
+        clusters, _ = find_duplicate_clusters(chunks)
+        # Second streaming pass over the (deterministic) chunker
+        chunks = apply_deduplication(iter_dataset_chunks(args.db_path, args.book_id, args.max_tokens), clusters)
+
+    job = EmbeddingJob(EmbeddingStore(args.store), flush_size=args.flush_size)
+    configure_tracing(enabled=True if args.trace_file else None, jsonl_path=args.trace_file)
+    try:
+        with span("ingestion.embedding_job", db_path=args.db_path, dedup=args.dedup):
+            job.run(chunks)
+    finally:
+        shutdown_tracing()
+
+
+if __name__ == "__main__":
+    main()
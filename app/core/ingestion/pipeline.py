@@ -0,0 +1,256 @@
+"""
+Streaming Ingestion Pipeline
+============================
+Streams shamela_robust.db straight into Pinecone in constant memory:
+
+    reader ──chunk queue──> embedder ──vector queue──> upsert workers
+
+- The reader pulls section-bounded chunks (section_chunker) on a dedicated thread.
+- The embedder fills token-sized windows and embeds them with embed_texts_batched,
+  which packs requests to the token budget and runs them concurrently.
+- Upsert workers send byte-sized batches through the upsert engine (vector_upsert).
+
+The queues are bounded, so a slow stage blocks the stages before it instead of
+letting work pile up: memory is bounded by the queue sizes, not the corpus.
+Per-stage throughput and queue depths are logged periodically; the stage that is
+busy nearly all of the time, with a full queue before it, is the bottleneck.
+
+Completed ids are recorded in an upsert manifest with each chunk's content
+hash, so an interrupted run is resumed by running the same command again and
+chunks whose text changed are re-embedded and upserted. This replaces
+data_send_pincone.process_category, which loaded whole categories into memory.
+
+Usage:
+    python -m app.core.ingestion.pipeline shamela_robust.db --book_id 123 --manifest data/upsert_manifest.sqlite
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config.settings import settings
+from app.core.embeddings import embed_texts_batched
+from app.core.ingestion.embedding_job import content_hash
+from app.core.tracing import configure_tracing, shutdown_tracing, span
+from app.core.vector_upsert import VectorUpserter
+from app.utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+READ_BATCH_SIZE = 256  # Chunks per item on the chunk queue
+CHUNK_QUEUE_SIZE = 8
+VECTOR_QUEUE_SIZE = 8
+UPSERT_WORKERS = 4
+STATS_LOG_INTERVAL_SECONDS = 15.0
+
+_DONE = None  # Queue sentinel
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def snapshot(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "items_per_second": round(self.items / max(elapsed, 1e-6), 1),
+            "busy_ratio": round(min(self.busy_seconds / max(elapsed, 1e-6), 1.0), 3),
+        }
+
+
+class IngestionPipeline:
+    """Bounded-queue pipeline from chunks to Pinecone vectors."""
+
+    def __init__(self,
+                 chunks: Iterable[Dict[str, Any]],
+                 upserter: VectorUpserter,
+                 read_batch_size: int = READ_BATCH_SIZE,
+                 embed_window_tokens: Optional[int] = None,
+                 chunk_queue_size: int = CHUNK_QUEUE_SIZE,
+                 vector_queue_size: int = VECTOR_QUEUE_SIZE,
+                 upsert_workers: int = UPSERT_WORKERS,
+                 stats_interval: float = STATS_LOG_INTERVAL_SECONDS):
+        """
+        Args:
+            chunks: Chunk dictionaries with "id", "text" and "metadata"; consumed
+                lazily on a single dedicated thread (SQLite-backed generators are safe)
+            upserter: Upsert engine; its manifest (if any) is used to skip finished chunks
+            read_batch_size: Chunks per item on the chunk queue
+            embed_window_tokens: Tokens embedded per embed_texts_batched call (defaults to
+                EMBEDDING_MAX_BATCH_TOKENS x EMBEDDING_CONCURRENCY, enough to keep every
+                embedding worker busy)
+            chunk_queue_size: Bound on the chunk queue, in read batches
+            vector_queue_size: Bound on the vector queue, in embed windows
+            upsert_workers: Concurrent upsert workers
+            stats_interval: Seconds between progress log lines
+        """
+        self.chunks = chunks
+        self.upserter = upserter
+        self.read_batch_size = read_batch_size
+        self.embed_window_tokens = (embed_window_tokens or
+                                    settings.EMBEDDING_MAX_BATCH_TOKENS * settings.EMBEDDING_CONCURRENCY)
+        self.chunk_queue_size = chunk_queue_size
+        self.vector_queue_size = vector_queue_size
+        self.upsert_workers = upsert_workers
+        self.stats_interval = stats_interval
+
+        self.stages = {name: StageStats(name) for name in ("read", "embed", "upsert")}
+        self.skipped = 0
+        self.embed_failed = 0
+        self._chunk_queue: Optional[asyncio.Queue] = None
+        self._vector_queue: Optional[asyncio.Queue] = None
+        self._start_time = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current per-stage throughput and queue depths."""
+        elapsed = time.monotonic() - self._start_time if self._start_time else 0.0
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "stages": {name: stage.snapshot(elapsed) for name, stage in self.stages.items()},
+            "queues": {
+                "chunks": f"{self._chunk_queue.qsize() if self._chunk_queue else 0}/{self.chunk_queue_size}",
+                "vectors": f"{self._vector_queue.qsize() if self._vector_queue else 0}/{self.vector_queue_size}",
+            },
+            "skipped": self.skipped,
+            "embed_failed": self.embed_failed,
+            "upsert_failed": self.upserter.stats["failed"],
+        }
+
+    async def _read(self, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        iterator = iter(self.chunks)
+        while True:
+            started = time.monotonic()
+            batch = await loop.run_in_executor(
+                executor, lambda: list(itertools.islice(iterator, self.read_batch_size))
+            )
+            self.stages["read"].busy_seconds += time.monotonic() - started
+            if not batch:
+                break
+            self.stages["read"].items += len(batch)
+            await self._chunk_queue.put(batch)
+        await self._chunk_queue.put(_DONE)
+
+    async def _embed(self) -> None:
+        window: List[Dict[str, Any]] = []
+        window_tokens = 0
+        while True:
+            batch = await self._chunk_queue.get()
+            if batch is _DONE:
+                break
+            for chunk in batch:
+                chunk["metadata"] = {**(chunk.get("metadata") or {}), "content_hash": content_hash(chunk["text"])}
+            # Skip chunks a previous run already upserted unchanged, before paying for their embeddings
+            pending = await asyncio.to_thread(self.upserter.pending_vectors, batch)
+            self.skipped += len(batch) - len(pending)
+            for chunk in pending:
+                window.append(chunk)
+                window_tokens += (chunk.get("metadata") or {}).get("token_count") or estimate_tokens(chunk["text"])
+                if window_tokens >= self.embed_window_tokens:
+                    await self._embed_window(window)
+                    window, window_tokens = [], 0
+        await self._embed_window(window)
+        for _ in range(self.upsert_workers):
+            await self._vector_queue.put(_DONE)
+
+    async def _embed_window(self, window: List[Dict[str, Any]]) -> None:
+        if not window:
+            return
+        started = time.monotonic()
+        embeddings = await asyncio.to_thread(embed_texts_batched, [chunk["text"] for chunk in window])
+        self.stages["embed"].busy_seconds += time.monotonic() - started
+
+        vectors = [{"id": str(chunk["id"]), "values": embedding, "metadata": chunk.get("metadata") or {}}
+                   for chunk, embedding in zip(window, embeddings) if embedding is not None]
+        self.embed_failed += len(window) - len(vectors)
+        self.stages["embed"].items += len(vectors)
+        if vectors:
+            await self._vector_queue.put(vectors)
+
+    async def _upsert(self) -> None:
+        while True:
+            vectors = await self._vector_queue.get()
+            if vectors is _DONE:
+                return
+            for batch in self.upserter.iter_batches(vectors):
+                started = time.monotonic()
+                if await asyncio.to_thread(self.upserter.send_batch, batch):
+                    self.stages["upsert"].items += len(batch)
+                # Averaged over workers: busy_ratio is the share of upsert capacity in use
+                self.stages["upsert"].busy_seconds += (time.monotonic() - started) / self.upsert_workers
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            logger.info(f"Ingestion pipeline: {self.snapshot()}")
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run the pipeline to completion.
+
+        Returns:
+            Final snapshot (see snapshot())
+        """
+        self._start_time = time.monotonic()
+        self._chunk_queue = asyncio.Queue(maxsize=self.chunk_queue_size)
+        self._vector_queue = asyncio.Queue(maxsize=self.vector_queue_size)
+
+        reporter = asyncio.create_task(self._report())
+        # One thread for the reader: SQLite connections must stay on the thread that opened them
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-reader") as reader_executor:
+            tasks = [asyncio.create_task(self._read(reader_executor)), asyncio.create_task(self._embed())]
+            tasks += [asyncio.create_task(self._upsert()) for _ in range(self.upsert_workers)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            finally:
+                reporter.cancel()
+
+        snapshot = self.snapshot()
+        logger.info(f"Ingestion pipeline finished: {snapshot}")
+        return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream shamela_robust.db into Pinecone in constant memory.")
+    parser.add_argument("db_path", help="Path to shamela_robust.db")
+    parser.add_argument("--book_id", type=int, action="append", help="Book ID to process (repeatable, default: all)")
+    parser.add_argument("--max_tokens", type=int, default=None, help="Token budget per chunk")
+    parser.add_argument("--manifest", default=None, help="SQLite manifest of upserted ids, for resumable runs")
+    parser.add_argument("--upsert_workers", type=int, default=UPSERT_WORKERS, help="Concurrent upsert workers")
+    parser.add_argument("--queue_size", type=int, default=CHUNK_QUEUE_SIZE, help="Bound on each stage queue")
+    parser.add_argument("--trace_file", default=None, help="Write trace spans to this JSON-lines file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from app.core.clients import get_pinecone_index
+    from app.core.ingestion.section_chunker import iter_dataset_chunks
+    pipeline = IngestionPipeline(
+        iter_dataset_chunks(args.db_path, args.book_id, args.max_tokens),
+        VectorUpserter(get_pinecone_index(), manifest_path=args.manifest),
+        chunk_queue_size=args.queue_size,
+        vector_queue_size=args.queue_size,
+        upsert_workers=args.upsert_workers,
+    )
+    configure_tracing(enabled=True if args.trace_file else None, jsonl_path=args.trace_file)
+    try:
+        with span("ingestion.pipeline", db_path=args.db_path, books=len(args.book_id or [])):
+            asyncio.run(pipeline.run())
+    finally:
+        shutdown_tracing()
+
+
+if __name__ == "__main__":
+    main()
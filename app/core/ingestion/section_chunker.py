@@ -0,0 +1,297 @@
+"""
+Section-Aware Chunker for the Shamela Robust Dataset
+====================================================
+Builds embedding inputs from ``shamela_robust.db`` (see prepare_robust_dataset.py)
+using the section hierarchy stored in the ``t{book_id}`` tables.
+
+Pages from ``b{book_id}`` are walked in reading order and joined to the section
+that starts at or before their row: Shamela's title table stores the id of the
+page row a section starts on (not the printed page number, which restarts in
+every volume of a multi-volume book). Consecutive pages of a section are
+packed into a chunk until the token budget is reached, so a chunk never spans
+two sections and carries its full section title path (e.g. "كتاب الطهارة > باب المياه").
+
+Everything is a generator: only one book's section index and one chunk buffer
+are held in memory, whatever the size of the dataset.
+
+Usage:
+    python -m app.core.ingestion.section_chunker shamela_robust.db --book_id 123 --output chunks.jsonl
+"""
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.config.settings import settings
+from app.utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SECTION_PATH_SEPARATOR = " > "
+PAGE_SEPARATOR = "\n"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?؟۔])\s+")
+
+
+def _table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
+    cursor = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)
+    )
+    return cursor.fetchone() is not None
+
+
+def load_book_info(conn: sqlite3.Connection, book_id: int) -> Dict[str, Any]:
+    """
+    Load the book, author and category names for a book.
+
+    Args:
+        conn: Connection to shamela_robust.db
+        book_id: ID of the book
+
+    Returns:
+        Dictionary with book_name, author_name and category_name (values may be None)
+    """
+    row = conn.execute(
+        """
+        SELECT b.book_name, a.author_name, c.category_name
+        FROM books b
+        LEFT JOIN authors a ON a.author_id = b.main_author
+        LEFT JOIN categories c ON c.category_id = b.category_id
+        WHERE b.book_id = ?
+        """,
+        (book_id,),
+    ).fetchone()
+    if not row:
+        return {"book_name": None, "author_name": None, "category_name": None}
+    return {"book_name": row[0], "author_name": row[1], "category_name": row[2]}
+
+
+def load_sections(conn: sqlite3.Connection, book_id: int) -> List[Dict[str, Any]]:
+    """
+    Load the section index of a book with the title path of every section.
+
+    The ``parent_section_id`` column holds Shamela's ``lvl`` nesting level
+    (see extract_structure_tables), so the path is rebuilt with a level stack.
+
+    Args:
+        conn: Connection to shamela_robust.db
+        book_id: ID of the book
+
+    Returns:
+        Sections in reading order, each with section_id, title, page (the id of
+        the b{book_id} row the section starts on) and path
+    """
+    table_name = f"t{book_id}"
+    if not _table_exists(conn, table_name):
+        return []
+
+    sections = []
+    stack: List[str] = []
+    cursor = conn.execute(
+        f"SELECT section_id, section_title, page, parent_section_id FROM {table_name} "
+        f"WHERE COALESCE(is_deleted, 0) = 0 ORDER BY section_id"
+    )
+    for section_id, title, page, level in cursor:
+        title = _WHITESPACE_RE.sub(" ", title or "").strip()
+        try:
+            depth = max(int(level), 1)
+        except (TypeError, ValueError):
+            depth = 1
+        stack = stack[:depth - 1] + [title]
+        sections.append({
+            "section_id": section_id,
+            "title": title,
+            "page": page,
+            "path": SECTION_PATH_SEPARATOR.join(part for part in stack if part),
+        })
+    return sections
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Split a page that exceeds the budget on sentence ends, hard-cutting long sentences."""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text):
+        candidate = f"{current} {sentence}" if current else sentence
+        if estimate_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        # A single sentence over budget is cut at a proportional character length
+        while estimate_tokens(sentence) > max_tokens:
+            cut = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        current = sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def iter_book_chunks(
+    conn: sqlite3.Connection,
+    book_id: int,
+    max_tokens: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield section-bounded chunks for one book.
+
+    Pages are joined to sections by page row id: a page belongs to the last
+    section (in reading order) that starts at or before its row, so volumes
+    whose printed page numbers restart are joined correctly. Pages that
+    precede the first section are grouped under section 0 with an empty path.
+
+    Args:
+        conn: Connection to shamela_robust.db
+        book_id: ID of the book
+        max_tokens: Token budget per chunk (defaults to settings.SECTION_CHUNK_MAX_TOKENS)
+
+    Yields:
+        Chunk dictionaries with "id", "text" and "metadata", in the same shape as
+        document_processor.process_document
+    """
+    max_tokens = max_tokens or settings.SECTION_CHUNK_MAX_TOKENS
+    content_table = f"b{book_id}"
+    if not _table_exists(conn, content_table):
+        logger.warning(f"Book {book_id} has no content table, skipping")
+        return
+
+    book_info = load_book_info(conn, book_id)
+    sections = load_sections(conn, book_id)
+    front_matter = {"section_id": 0, "title": "", "page": None, "path": ""}
+
+    section_idx = -1
+    buffer: List[str] = []
+    buffer_tokens = 0
+    page_start = page_end = part_start = part_end = None
+    row_start = row_end = None
+    whole_pages = True  # False once the buffer holds part of a split page
+    chunk_counts: Dict[Any, int] = {}
+
+    def make_chunk(section: Dict[str, Any]) -> Dict[str, Any]:
+        index = chunk_counts.get(section["section_id"], 0)
+        chunk_counts[section["section_id"]] = index + 1
+        text = PAGE_SEPARATOR.join(buffer)
+        return {
+            "id": f"{book_id}_{section['section_id']}_{index}",
+            "text": text,
+            "metadata": {
+                "book_id": book_id,
+                **book_info,
+                "section_id": section["section_id"],
+                "section_title": section["title"],
+                "section_path": section["path"],
+                "page_start": page_start,
+                "page_end": page_end,
+                "part_start": part_start,  # Volume of page_start (multi-volume books)
+                "part_end": part_end,
+                # b{book_id} rows of a chunk made of whole pages, for the page store
+                **({"page_row_start": row_start, "page_row_end": row_end} if whole_pages else {}),
+                "chunk_index": index,
+                "token_count": estimate_tokens(text),
+                "text": text,
+            },
+        }
+
+    pages = conn.execute(
+        f"SELECT chunk_id, content, part, page FROM {content_table} "
+        f"WHERE COALESCE(is_deleted, 0) = 0 ORDER BY chunk_id"
+    )
+    for row_id, content, part, page in pages:
+        text = _WHITESPACE_RE.sub(" ", content or "").strip()
+        if not text:
+            continue
+
+        # Advance to the section this page belongs to
+        next_idx = section_idx
+        while (
+            next_idx + 1 < len(sections)
+            and sections[next_idx + 1]["page"] is not None
+            and sections[next_idx + 1]["page"] <= row_id
+        ):
+            next_idx += 1
+        current_section = sections[section_idx] if section_idx >= 0 else front_matter
+        if next_idx != section_idx:
+            if buffer:
+                yield make_chunk(current_section)
+                buffer, buffer_tokens = [], 0
+            section_idx = next_idx
+            current_section = sections[section_idx]
+
+        page_tokens = estimate_tokens(text)
+        pieces = [text] if page_tokens <= max_tokens else _split_oversized(text, max_tokens)
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if buffer and buffer_tokens + piece_tokens > max_tokens:
+                yield make_chunk(current_section)
+                buffer, buffer_tokens = [], 0
+            if not buffer:
+                page_start, part_start, row_start = page, part, row_id
+                whole_pages = True
+            buffer.append(piece)
+            buffer_tokens += piece_tokens
+            page_end, part_end, row_end = page, part, row_id
+            whole_pages = whole_pages and len(pieces) == 1
+
+    if buffer:
+        yield make_chunk(sections[section_idx] if section_idx >= 0 else front_matter)
+
+
+def iter_dataset_chunks(
+    db_path: str,
+    book_ids: Optional[Iterable[int]] = None,
+    max_tokens: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream section-bounded chunks for every book in shamela_robust.db.
+
+    Args:
+        db_path: Path to shamela_robust.db
+        book_ids: Restrict to these books (defaults to all books in the books table)
+        max_tokens: Token budget per chunk (defaults to settings.SECTION_CHUNK_MAX_TOKENS)
+
+    Yields:
+        Chunk dictionaries, book by book
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if book_ids is None:
+            book_ids = (row[0] for row in conn.execute("SELECT book_id FROM books ORDER BY book_id"))
+        for book_id in book_ids:
+            yield from iter_book_chunks(conn, book_id, max_tokens)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build section-bounded chunks from shamela_robust.db.")
+    parser.add_argument("db_path", help="Path to shamela_robust.db")
+    parser.add_argument("--book_id", type=int, action="append", help="Book ID to process (repeatable, default: all)")
+    parser.add_argument("--max_tokens", type=int, default=None, help="Token budget per chunk")
+    parser.add_argument("--output", default=None, help="Write chunks as JSON lines to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    total_chunks = total_tokens = 0
+    try:
+        for chunk in iter_dataset_chunks(args.db_path, args.book_id, args.max_tokens):
+            total_chunks += 1
+            total_tokens += chunk["metadata"]["token_count"]
+            if output:
+                output.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    finally:
+        if output:
+            output.close()
+
+    logger.info(f"Produced {total_chunks} chunks ({total_tokens} estimated tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Upload an Embedding Store to Pinecone
+=====================================
+Reads vectors directly from the binary embedding store (app/core/embedding_store.py)
+and upserts them with the metadata recorded next to each row. This replaces
+pairing stringified-CSV embeddings with JSON texts by position.
+
+Uploads go through the concurrent upsert engine (app/core/vector_upsert.py);
+completed ids are recorded in the store directory with each row's content
+hash, so an interrupted upload is resumed by running the same command again
+and rows re-embedded under an existing id are uploaded again.
+
+Usage:
+    python -m app.core.ingestion.upload_embedding_store data/embeddings --validate
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterator, Optional
+
+from app.config.settings import settings
+from app.core.embedding_store import EmbeddingStore
+from app.core.tracing import configure_tracing, shutdown_tracing, span
+from app.core.vector_upsert import VectorUpserter
+
+logger = logging.getLogger(__name__)
+
+UPSERT_MANIFEST_NAME = "upsert_manifest.sqlite"
+
+
+def iter_store_vectors(store: EmbeddingStore) -> Iterator[Dict[str, Any]]:
+    """
+    Yield Pinecone vector records straight from the store's memory-mapped shards.
+
+    Args:
+        store: The embedding store to read
+
+    Yields:
+        Dictionaries with id, values and metadata
+    """
+    for _, rows, vectors in store.iter_shards():
+        for row, vector in zip(rows, vectors):
+            yield {
+                "id": row["id"],
+                "values": vector.astype("float32").tolist(),
+                "metadata": {**row.get("metadata", {}), "content_hash": row["hash"]},
+            }
+
+
+def upload_store(store: EmbeddingStore, index, concurrency: Optional[int] = None, resume: bool = True) -> Dict[str, Any]:
+    """
+    Upsert every vector in the store into a Pinecone index.
+
+    Args:
+        store: The embedding store to upload
+        index: Pinecone index client
+        concurrency: Upsert batches in flight (defaults to settings.UPSERT_CONCURRENCY)
+        resume: Record completed (id, hash) pairs in the store directory and skip them on re-runs
+
+    Returns:
+        Upsert stats (see VectorUpserter.upsert)
+    """
+    manifest_path = os.path.join(store.path, UPSERT_MANIFEST_NAME) if resume else None
+    upserter = VectorUpserter(index, concurrency=concurrency, manifest_path=manifest_path)
+    stats = upserter.upsert(iter_store_vectors(store))
+    logger.info(f"Uploaded {stats['upserted']} of {len(store)} vectors to Pinecone index "
+                f"'{settings.PINECONE_INDEX_NAME}' ({stats['skipped']} already uploaded, "
+                f"{stats['failed']} failed, {stats['vectors_per_second']} vectors/sec)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload a binary embedding store to Pinecone.")
+    parser.add_argument("store_path", nargs="?", default=settings.EMBEDDING_STORE_PATH,
+                        help="Embedding store directory")
+    parser.add_argument("--validate", action="store_true", help="Validate the store before uploading")
+    parser.add_argument("--concurrency", type=int, default=None, help="Upsert batches in flight")
+    parser.add_argument("--no_resume", action="store_true", help="Re-upload vectors recorded as already uploaded")
+    parser.add_argument("--trace_file", default=None, help="Write trace spans to this JSON-lines file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    store = EmbeddingStore(args.store_path)
+    if args.validate:
+        report = store.validate()
+        if report["bad_shards"] or report["bad_rows"]:
+            logger.error(f"Embedding store failed validation: {report['bad_shards']} "
+                         f"({len(report['bad_rows'])} bad rows)")
+            sys.exit(1)
+        logger.info(f"Embedding store validated: {report['rows']} rows")
+
+    from app.core.clients import get_pinecone_index
+    configure_tracing(enabled=True if args.trace_file else None, jsonl_path=args.trace_file)
+    try:
+        with span("ingestion.upload_store", store_path=args.store_path, vectors=len(store)):
+            stats = upload_store(store, get_pinecone_index(), args.concurrency, resume=not args.no_resume)
+    finally:
+        shutdown_tracing()
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+# app/core/jobs.py
+"""
+Background ingestion jobs.
+
+This module provides:
+1. JobStore - persistent job and item records in a local SQLite file
+2. JobManager - a small dedicated worker pool that runs jobs item by item,
+   with progress counts, cancellation and retry of failed items
+
+Jobs run on their own threads, never on the event loop or the request
+threadpool, and the pool is kept small (INGESTION_JOB_WORKERS) so large batch
+ingests cannot crowd out chat requests on the same host. Jobs left unfinished
+by a shutdown are resumed on the next start.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config.settings import settings
+from app.core.tracing import current_span, propagate, traced
+
+logger = logging.getLogger(__name__)
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"  # Finished, but some items failed; retry() re-runs them
+CANCELLED = "cancelled"
+
+# Item statuses
+PENDING = "pending"
+DONE = "done"
+ITEM_FAILED = "failed"
+
+MAX_REPORTED_ERRORS = 10
+PREFETCH_WINDOW = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    total_items INTEGER NOT NULL,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    vectors INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    item_index INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    vectors INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, item_index)
+);
+"""
+
+
+class JobStore:
+    """SQLite-backed job and item records, safe to share across threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def create_job(self, items: List[Dict[str, Any]]) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, created_at, updated_at, total_items) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, now, now, len(items)),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, item_index, payload, status) VALUES (?, ?, ?, ?)",
+                [(job_id, i, json.dumps(item, ensure_ascii=False, default=str), PENDING)
+                 for i, item in enumerate(items)],
+            )
+            self._conn.commit()
+        return job_id
+
+    def set_status(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                               (status, time.time(), job_id))
+            self._conn.commit()
+
+    def pending_items(self, job_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_index, payload FROM job_items WHERE job_id = ? AND status = ? ORDER BY item_index",
+                (job_id, PENDING),
+            ).fetchall()
+        return [{"index": row["item_index"], "payload": json.loads(row["payload"])} for row in rows]
+
+    def finish_item(self, job_id: str, item_index: int, chunks: int = 0, vectors: int = 0,
+                    error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, chunks = ?, vectors = ?, error = ? "
+                "WHERE job_id = ? AND item_index = ?",
+                (ITEM_FAILED if error else DONE, chunks, vectors, error, job_id, item_index),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET chunks = chunks + ?, vectors = vectors + ?, updated_at = ? WHERE job_id = ?",
+                (chunks, vectors, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def reset_failed_items(self, job_id: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE job_items SET status = ?, error = NULL WHERE job_id = ? AND status = ?",
+                (PENDING, job_id, ITEM_FAILED),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def job_ids_with_status(self, *statuses: str) -> List[str]:
+        placeholders = ",".join("?" * len(statuses))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at", statuses
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job record with per-status item counts and the first item errors."""
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            errors = self._conn.execute(
+                "SELECT item_index, error FROM job_items WHERE job_id = ? AND status = ? "
+                "ORDER BY item_index LIMIT ?",
+                (job_id, ITEM_FAILED, MAX_REPORTED_ERRORS),
+            ).fetchall()
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "total_documents": job["total_items"],
+            "processed_documents": counts.get(DONE, 0),
+            "failed_documents": counts.get(ITEM_FAILED, 0),
+            "chunks": job["chunks"],
+            "vectors": job["vectors"],
+            "errors": [f"Document {row['item_index']}: {row['error']}" for row in errors],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """Runs ingestion jobs on a bounded pool of dedicated worker threads."""
+
+    def __init__(self,
+                 db_path: str,
+                 handler: Callable[[Dict[str, Any], Any], Dict[str, int]],
+                 index_factory: Callable[[], Any],
+                 workers: Optional[int] = None,
+                 prefetch: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 prefetch_window: int = PREFETCH_WINDOW):
+        """
+        Args:
+            db_path: SQLite file holding job records
+            handler: Processes one item given (payload, index); returns chunk and vector counts
+            index_factory: Returns the Pinecone index client, called once per job run
+            workers: Jobs processed at once (defaults to settings.INGESTION_JOB_WORKERS)
+            prefetch: Optional hook given each window of payloads before they are
+                processed, e.g. to fetch their documents concurrently
+            prefetch_window: Payloads per prefetch call
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.index_factory = index_factory
+        self.workers = workers or settings.INGESTION_JOB_WORKERS
+        self.prefetch = prefetch
+        self.prefetch_window = prefetch_window
+        self._store: Optional[JobStore] = None
+        self._store_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cancelled: set = set()
+        self._active: set = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @property
+    def store(self) -> JobStore:
+        # Opened on first use, so importing the app never creates the database
+        with self._store_lock:
+            if self._store is None:
+                self._store = JobStore(self.db_path)
+            return self._store
+
+    def start(self) -> None:
+        """Start the worker pool and resume jobs a previous process left unfinished."""
+        if self._executor is not None:
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest-job")
+        if os.path.exists(self.db_path):
+            for job_id in self.store.job_ids_with_status(QUEUED, RUNNING):
+                logger.info(f"Resuming ingestion job {job_id}")
+                self._enqueue(job_id)
+        logger.info(f"Ingestion job manager started with {self.workers} worker(s)")
+
+    def stop(self) -> None:
+        """Stop after the current item of each running job; unfinished jobs resume on next start."""
+        self._stopping.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        logger.info("Ingestion job manager stopped")
+
+    def submit(self, items: List[Dict[str, Any]]) -> str:
+        """Record a new job and queue it. Returns the job ID."""
+        job_id = self.store.create_job(items)
+        logger.info(f"Queued ingestion job {job_id} with {len(items)} document(s)")
+        self._enqueue(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get_job(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a job; a running job stops before its next item."""
+        job = self.store.get_job(job_id)
+        if job is None or job["status"] in (COMPLETED, CANCELLED):
+            return job
+        with self._lock:
+            self._cancelled.add(job_id)
+            active = job_id in self._active
+        if not active:
+            self.store.set_status(job_id, CANCELLED)
+        return self.store.get_job(job_id)
+
+    def retry(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Re-queue a finished job's failed (and, for cancelled jobs, unprocessed) items.
+
+        Raises:
+            ValueError: If the job is still queued or running
+        """
+        job = self.store.get_job(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job_id in self._active or job["status"] in (QUEUED, RUNNING):
+                raise ValueError(f"Job {job_id} is still {job['status']}")
+            self._cancelled.discard(job_id)
+        self.store.reset_failed_items(job_id)
+        self.store.set_status(job_id, QUEUED)
+        self._enqueue(job_id)
+        return self.store.get_job(job_id)
+
+    def _enqueue(self, job_id: str) -> None:
+        if self._executor is None:
+            logger.warning(f"Job manager not started; job {job_id} stays queued until start()")
+            return
+        self._executor.submit(propagate(self._run_job), job_id)  # The job span joins the submitting request's trace
+
+    @traced("ingestion.job")
+    def _run_job(self, job_id: str) -> None:
+        current_span().set_attribute("job_id", job_id)
+        with self._lock:
+            if job_id in self._active:  # Queued twice (e.g. retried while still queued)
+                return
+            if job_id in self._cancelled:
+                self._cancelled.discard(job_id)
+                self.store.set_status(job_id, CANCELLED)
+                return
+            self._active.add(job_id)
+        final_status = FAILED
+        try:
+            self.store.set_status(job_id, RUNNING)
+            index = self.index_factory()
+            pending = self.store.pending_items(job_id)
+            for position, item in enumerate(pending):
+                if self.prefetch and position % self.prefetch_window == 0:
+                    # At the start of each window, fetch all of its documents concurrently (blocking);
+                    # the window's items are then processed one by one from what was fetched
+                    try:
+                        self.prefetch([next_item["payload"]
+                                       for next_item in pending[position:position + self.prefetch_window]])
+                    except Exception as e:  # Items fall back to fetching on their own
+                        logger.warning(f"Prefetch for ingestion job {job_id} failed: {e}")
+                if self._stopping.is_set():
+                    final_status = QUEUED  # Resumed on next start
+                    return
+                with self._lock:
+                    if job_id in self._cancelled:
+                        self._cancelled.discard(job_id)
+                        final_status = CANCELLED
+                        logger.info(f"Ingestion job {job_id} cancelled")
+                        return
+                try:
+                    counts = self.handler(item["payload"], index)
+                    self.store.finish_item(job_id, item["index"], counts.get("chunks", 0), counts.get("vectors", 0))
+                except Exception as e:
+                    logger.error(f"Ingestion job {job_id} document {item['index']} failed: {e}")
+                    self.store.finish_item(job_id, item["index"], error=str(e))
+
+            job = self.store.get_job(job_id)
+            final_status = FAILED if job["failed_documents"] else COMPLETED
+            logger.info(f"Ingestion job {job_id} finished: {job['processed_documents']} processed, "
+                        f"{job['failed_documents']} failed, {job['vectors']} vectors")
+        except Exception as e:
+            logger.exception(f"Ingestion job {job_id} aborted: {e}")
+        finally:
+            # Together, so a retry() that sees the final status never finds the job still active
+            with self._lock:
+                try:
+                    self.store.set_status(job_id, final_status)
+                finally:
+                    self._active.discard(job_id)
+
+
+@lru_cache()
+def get_job_manager() -> JobManager:
+    """Returns the process-wide ingestion job manager."""
+    from app.core.clients import get_pinecone_index
+    from app.core.ingestion.documents import ingest_document, prefetch_documents
+    return JobManager(
+        settings.INGESTION_JOB_DB_PATH,
+        handler=lambda payload, index: ingest_document(payload, index, max_workers=settings.INGESTION_JOB_EMBED_WORKERS),
+        index_factory=get_pinecone_index,
+        prefetch=prefetch_documents,
+    )
@@ -8,9 +8,29 @@ import asyncio # <<< Add asyncio import
 from typing import Dict, List, Any, Optional, Tuple, Union, AsyncGenerator # <<< Add AsyncGenerator
 
 from app.config.settings import settings
+from app.core.metrics import UPSTREAM_ERRORS, UPSTREAM_RETRIES
+from app.core.tracing import CLIENT, current_span, traced
 # ... other imports ...
 logger = logging.getLogger(__name__)
 
+def _trace_mistral_response(response: requests.Response, attempt: int) -> None:
+    """Record status, attempts and token usage of a Mistral response on the current span."""
+    span = current_span()
+    if not span.recording:
+        return
+    span.set_attributes(status_code=response.status_code, attempts=attempt + 1)
+    if response.status_code != 200:
+        span.set_status("error", f"HTTP {response.status_code}")
+        return
+    span.set_status("ok")
+    try:
+        usage = response.json().get("usage") or {}
+    except (ValueError, AttributeError):
+        return
+    span.set_attributes(prompt_tokens=usage.get("prompt_tokens"),
+                        completion_tokens=usage.get("completion_tokens"))
+
+@traced("mistral.chat", kind=CLIENT)
 def call_mistral_with_retry(prompt: str, max_retries: int = 3, base_delay: float = 1.0) -> requests.Response:
     """
     Call Mistral API with exponential backoff retry logic.
@@ -47,21 +67,26 @@ def call_mistral_with_retry(prompt: str, max_retries: int = 3, base_delay: float
         "temperature": settings.MISTRAL_TEMPERATURE, # Use setting
         "max_tokens": settings.MISTRAL_MAX_TOKENS   # Use setting
     }
-    logger.debug(f"Mistral Request Payload (first 200 chars): {json.dumps(payload)[:200]}...")
+    if logger.isEnabledFor(logging.DEBUG):  # Don't serialise the whole prompt just to drop the line
+        logger.debug("Mistral Request Payload (first 200 chars): %.200s...", json.dumps(payload))
+    current_span().set_attributes(model=settings.MISTRAL_MODEL, prompt_chars=len(prompt),
+                                  max_tokens=settings.MISTRAL_MAX_TOKENS)
 
     for attempt in range(max_retries):
         try:
-            logger.debug(f"Mistral API attempt {attempt+1}/{max_retries}")
+            logger.debug("Mistral API attempt %d/%d", attempt + 1, max_retries)
             response = requests.post(
                 settings.MISTRAL_API_ENDPOINT, # Use setting
                 headers=headers,
                 json=payload,
                 timeout=settings.LLM_TIMEOUT # Use setting
             )
-            logger.debug(f"Mistral Response Status: {response.status_code}")
+            logger.debug("Mistral Response Status: %s", response.status_code)
+            _trace_mistral_response(response, attempt)
 
             # Log non-200 responses for debugging
             if response.status_code != 200:
+                UPSTREAM_ERRORS.inc(service="mistral", status=response.status_code)
                 try:
                     # Limit logging potentially large/sensitive response bodies
                     response_text = response.text[:500] + ('...' if len(response.text) > 500 else '')
@@ -85,6 +110,7 @@ def call_mistral_with_retry(prompt: str, max_retries: int = 3, base_delay: float
                     except (TypeError, ValueError):
                         sleep_time = (2 ** attempt) * base_delay + random.uniform(0, 1) # Exponential backoff + jitter
                         logger.warning(f"Rate limit (429) hit. Retrying in {sleep_time:.2f} seconds (calculated)...")
+                    UPSTREAM_RETRIES.inc(service="mistral", status=429)
                     time.sleep(sleep_time)
                     continue # Go to the next attempt
                 else:
@@ -98,9 +124,11 @@ def call_mistral_with_retry(prompt: str, max_retries: int = 3, base_delay: float
 
         except requests.exceptions.Timeout:
             logger.warning(f"Mistral API call timed out (attempt {attempt+1}/{max_retries}).")
+            UPSTREAM_ERRORS.inc(service="mistral", status="timeout")
             if attempt < max_retries - 1:
                 sleep_time = (2 ** attempt) * base_delay + random.uniform(0, 1)
                 logger.warning(f"Retrying after timeout in {sleep_time:.2f} seconds...")
+                UPSTREAM_RETRIES.inc(service="mistral", status="timeout")
                 time.sleep(sleep_time)
             else:
                 logger.error("Maximum retry attempts reached after timeouts.")
@@ -114,9 +142,11 @@ def call_mistral_with_retry(prompt: str, max_retries: int = 3, base_delay: float
         except requests.exceptions.RequestException as e:
             # Catch other connection errors, DNS errors, etc.
             logger.error(f"Mistral API request failed (attempt {attempt+1}/{max_retries}): {str(e)}")
+            UPSTREAM_ERRORS.inc(service="mistral", status="connection")
             if attempt < max_retries - 1:
                 sleep_time = (2 ** attempt) * base_delay + random.uniform(0, 1)
                 logger.warning(f"Retrying after request exception in {sleep_time:.2f} seconds...")
+                UPSTREAM_RETRIES.inc(service="mistral", status="connection")
                 time.sleep(sleep_time)
             else:
                 logger.error("Maximum retry attempts reached after request exceptions.")
@@ -136,6 +166,7 @@ def call_mistral_with_retry(prompt: str, max_retries: int = 3, base_delay: float
     return final_error_response
 
 
+@traced("gemini.chat", kind=CLIENT)
 def call_gemini_api(prompt: str) -> Dict[str, any]:
     """
     Call Google Gemini API as a fallback.
@@ -165,21 +196,22 @@ def call_gemini_api(prompt: str) -> Dict[str, any]:
         genai.configure(api_key=settings.API_KEY_GOOGLE)
         model = genai.GenerativeModel(settings.GEMINI_MODEL) # Use setting
 
-        logger.debug(f"Gemini Prompt (first 200 chars): {prompt[:200]}...")
+        logger.debug("Gemini Prompt (first 200 chars): %.200s...", prompt)
+        current_span().set_attributes(model=settings.GEMINI_MODEL, prompt_chars=len(prompt))
 
         # Add safety settings if needed
         # safety_settings = [...]
         # response = model.generate_content(prompt, safety_settings=safety_settings)
         response = model.generate_content(prompt)
 
-        logger.debug(f"Gemini Raw Response Object: {response}")
+        logger.debug("Gemini Raw Response Object: %s", response)
 
         generated_text = None
         # Handle potential blocking or errors in the response
         try:
             # Accessing response.text can raise ValueError if blocked
             generated_text = response.text
-            logger.debug(f"Gemini Generated Text (via .text): {generated_text[:200]}...")
+            logger.debug("Gemini Generated Text (via .text): %.200s...", generated_text)
         except ValueError as e:
             # Check if the response was blocked due to safety settings or other reasons
             logger.warning(f"Gemini response.text raised ValueError: {e}. Checking prompt_feedback.")
@@ -197,7 +229,7 @@ def call_gemini_api(prompt: str) -> Dict[str, any]:
             if response and hasattr(response, 'parts') and response.parts:
                 # Concatenate text from all parts
                 generated_text = "".join(part.text for part in response.parts if hasattr(part, 'text'))
-                logger.debug(f"Gemini Generated Text (via .parts): {generated_text[:200]}...")
+                logger.debug("Gemini Generated Text (via .parts): %.200s...", generated_text)
             else:
                 # If no .text and no .parts, the response is unusable
                 logger.error(f"Gemini API returned an unexpected response structure: {response}")
@@ -206,6 +238,9 @@ def call_gemini_api(prompt: str) -> Dict[str, any]:
         # Final check if text was successfully extracted
         if generated_text is not None:
             logger.info("Successfully received and parsed response from Gemini API")
+            usage = getattr(response, "usage_metadata", None)
+            current_span().set_attributes(prompt_tokens=getattr(usage, "prompt_token_count", None),
+                                          completion_tokens=getattr(usage, "candidates_token_count", None))
             return {"success": True, "content": generated_text}
         else:
             # Should not happen if logic above is correct, but as a safeguard
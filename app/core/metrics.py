@@ -0,0 +1,387 @@
+# app/core/metrics.py
+"""
+Prometheus-compatible metrics without external dependencies.
+
+Counters, gauges and histograms live in one in-process registry and are
+rendered in the Prometheus text exposition format by GET /metrics. Recording
+a sample is a dict lookup and a few additions under a per-metric lock that is
+held for well under a microsecond, so instrumentation stays on the hot path.
+
+Multi-worker deployments (gunicorn/uvicorn workers) set METRICS_MULTIPROC_DIR:
+every worker then writes a snapshot of its registry to
+``{dir}/metrics_{pid}.json`` every METRICS_FLUSH_SECONDS from a background
+thread, and whichever worker serves /metrics merges its live registry with the
+other workers' snapshots. Only live workers count: a worker removes its file
+when it stops, and files of dead processes (crashed workers, earlier deploys,
+or a PID now reused) are deleted at startup and when /metrics finds them. A
+worker's exit therefore lowers the summed counters, which Prometheus treats
+as a counter reset.
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serialisable copy of the current values."""
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"kind": self.kind, "help": self.documentation, "labelnames": list(self.labelnames),
+                "values": values}
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: Any) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds) over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)  # len(buckets) is the +Inf bucket
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+        return {"kind": self.kind, "help": self.documentation, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "values": values}
+
+
+class MetricsRegistry:
+    """Named metrics of this process, rendered together (with other workers' snapshots)."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render(self, others: Iterable[Dict[str, Dict[str, Any]]] = ()) -> str:
+        """Prometheus text format of this registry merged with other processes' snapshots."""
+        merged = merge_snapshots([self.snapshot(), *others])
+        lines: List[str] = []
+        for name, metric in merged.items():
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            labelnames = metric["labelnames"]
+            for key, value in sorted(metric["values"].items()):
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_number(value)}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip([*metric["buckets"], math.inf], counts):
+                    cumulative += count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_number(total)}")
+                lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Sum the values of several registry snapshots, keyed by metric name and label values."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "values": {}})
+            if metric["kind"] == "histogram" and metric.get("buckets") != target.get("buckets"):
+                continue  # Bucket layout changed between deploys; can't be added up
+            for key, value in metric["values"]:
+                key = tuple(key)
+                current = target["values"].get(key)
+                if metric["kind"] == "histogram":
+                    counts, total = value
+                    if current is None:
+                        target["values"][key] = [list(counts), total]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], counts)]
+                        current[1] += total
+                else:
+                    target["values"][key] = (current or 0.0) + value
+    return merged
+
+
+# --- Multi-worker snapshots ---
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _snapshot_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"metrics_{pid}.json")
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove metrics snapshot {path}: {e}")
+
+
+def _snapshot_files(directory: str) -> Iterator[Tuple[int, str]]:
+    """(pid, path) of every snapshot file in directory, including unfinished .tmp files."""
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        stem = filename[:-len(".tmp")] if filename.endswith(".tmp") else filename
+        if not (stem.startswith("metrics_") and stem.endswith(".json")):
+            continue
+        try:
+            pid = int(stem[len("metrics_"):-len(".json")])
+        except ValueError:
+            continue
+        yield pid, os.path.join(directory, filename)
+
+
+def remove_stale_snapshots(directory: str) -> int:
+    """
+    Delete snapshot files of processes that are no longer running, and this
+    process's own file if an earlier process with the same PID left one.
+
+    Returns:
+        Number of files removed
+    """
+    removed = 0
+    for pid, path in list(_snapshot_files(directory)):
+        if pid == os.getpid() or not _pid_alive(pid):
+            _remove(path)
+            removed += 1
+    return removed
+
+
+def write_snapshot(registry: "MetricsRegistry", directory: str) -> None:
+    """Atomically replace this process's snapshot file."""
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory, os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def read_other_snapshots(directory: str) -> List[Dict[str, Dict[str, Any]]]:
+    """Snapshots written by other live workers; files of dead processes are deleted."""
+    snapshots = []
+    for pid, path in list(_snapshot_files(directory)):
+        if pid == os.getpid() or path.endswith(".tmp"):
+            continue
+        if not _pid_alive(pid):
+            _remove(path)
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except FileNotFoundError:
+            continue  # The worker stopped while we were listing
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+    return snapshots
+
+
+class SnapshotWriter:
+    """Background thread writing this worker's snapshot every METRICS_FLUSH_SECONDS."""
+
+    def __init__(self, registry: "MetricsRegistry", directory: str, interval: float):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop writing and remove this worker's snapshot, so it is no longer summed."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+        _remove(_snapshot_path(self.directory, os.getpid()))
+
+    def _write(self) -> None:
+        try:
+            write_snapshot(self.registry, self.directory)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot to {self.directory}: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._write()
+
+
+REGISTRY = MetricsRegistry()
+_writer: Optional[SnapshotWriter] = None
+
+
+def start_metrics() -> None:
+    """Start writing snapshots for other workers (only with METRICS_MULTIPROC_DIR)."""
+    global _writer
+    if settings.METRICS_ENABLED and settings.METRICS_MULTIPROC_DIR and _writer is None:
+        removed = remove_stale_snapshots(settings.METRICS_MULTIPROC_DIR)
+        if removed:
+            logger.info(f"Removed {removed} stale metrics snapshot(s) from {settings.METRICS_MULTIPROC_DIR}")
+        _writer = SnapshotWriter(REGISTRY, settings.METRICS_MULTIPROC_DIR, settings.METRICS_FLUSH_SECONDS)
+        _writer.start()
+        logger.info(f"Metrics snapshots enabled in {settings.METRICS_MULTIPROC_DIR}")
+
+
+def stop_metrics() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def render_metrics() -> str:
+    """Exposition text for GET /metrics, including other workers when configured."""
+    return REGISTRY.render(read_other_snapshots(settings.METRICS_MULTIPROC_DIR))
+
+
+# --- Application metrics ---
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until response headers are sent, by method and route template.",
+    ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests being handled.")
+STAGE_DURATION = REGISTRY.histogram(
+    "stage_duration_seconds",
+    "Duration of instrumented stages: auth, embed, vector_search, llm, llm_first_token, appwrite_read, "
+    "appwrite_write and the RAG pipeline stages.", ("stage",))
+RAG_IN_FLIGHT = REGISTRY.gauge("rag_requests_in_flight", "RAG pipeline runs in progress, by mode.", ("mode",))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "upstream_errors_total", "Failed calls to upstream services, by service and status code.", ("service", "status"))
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "upstream_retries_total", "Retried calls to upstream services, by service and the status that caused the retry.",
+    ("service", "status"))
+LLM_FALLBACKS = REGISTRY.counter("llm_fallbacks_total", "Answers that fell back from Mistral to Gemini.", ("mode",))
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    "rate_limit_rejections_total", "Requests rejected with 429 by our own limiters.", ("limiter",))
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran the lag probe's timer.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+EVENT_LOOP_STALLS = REGISTRY.counter(
+    "event_loop_stalls_total", "Times a callback blocked the event loop for longer than LOOP_LAG_THRESHOLD_MS.")
@@ -0,0 +1,375 @@
+# app/core/page_store.py
+"""
+Read-only, random-access compressed page store.
+
+Serves page text from shamela_robust.db by (book_id, chunk_id) without SQLite
+or Pinecone, for context formatting, source snippets and neighbouring-page
+expansion. Section chunks made of whole pages record their first and last
+page row (page_row_start, page_row_end), so their text is resolved here
+when the index only holds slim metadata (see resolve_chunk_text). Layout of
+the store directory:
+
+    manifest.json   codec, counts and format version
+    dictionary.bin  shared compression dictionary trained on sampled pages
+    blocks.bin      compressed blocks of consecutive pages (memory-mapped)
+    blocks.npy      (offset, size) of each block in blocks.bin
+    pages.npy       (block, start, length, page) per page slot
+    books.npy       (book_id, first_slot, first_chunk_id, slot_count) per book
+
+Pages of a book occupy dense slots by chunk_id (deleted rows leave empty
+slots), so a lookup is a dict hit plus an array index: O(1). Blocks use zstd
+with the shared dictionary when the optional ``zstandard`` package is
+installed, and zlib with a preset dictionary otherwise.
+
+Build with:
+    python -m app.core.page_store shamela_robust.db --output data/page_store
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+from app.core.ingestion.section_chunker import PAGE_SEPARATOR
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+BLOCK_BYTES = 32 * 1024  # Raw bytes per compressed block
+ZSTD_DICT_BYTES = 112 * 1024
+ZLIB_DICT_BYTES = 32 * 1024  # zlib only uses the last 32KB of a preset dictionary
+DICT_SAMPLE_PAGES_PER_BOOK = 4
+DICT_SAMPLE_BYTES = 8 * 1024 * 1024
+BLOCK_CACHE_SIZE = 256
+EMPTY_SLOT = np.iinfo(np.uint32).max
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _clean(content: Optional[str]) -> str:
+    return _WHITESPACE_RE.sub(" ", content or "").strip()
+
+
+def _book_ids(conn: sqlite3.Connection, book_ids: Optional[Iterable[int]]) -> List[int]:
+    if book_ids is not None:
+        return list(book_ids)
+    return [row[0] for row in conn.execute("SELECT book_id FROM books ORDER BY book_id")]
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+class _Codec:
+    """Dictionary compression with zstd when available, zlib otherwise."""
+
+    def __init__(self, name: str, dictionary: bytes):
+        self.name = name
+        self.dictionary = dictionary
+        if name == "zstd":
+            if zstandard is None:
+                raise RuntimeError("This page store uses zstd; install the 'zstandard' package to read it")
+            zstd_dict = zstandard.ZstdCompressionDict(dictionary)
+            self._compressor = zstandard.ZstdCompressor(level=19, dict_data=zstd_dict)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+        elif name != "zlib":
+            raise ValueError(f"Unknown page store codec: {name}")
+
+    @classmethod
+    def train(cls, samples: List[bytes]) -> "_Codec":
+        if zstandard is not None and len(samples) >= 8:
+            try:
+                trained = zstandard.train_dictionary(ZSTD_DICT_BYTES, samples)
+                return cls("zstd", trained.as_bytes())
+            except Exception as e:  # Too few or too uniform samples
+                logger.warning(f"zstd dictionary training failed ({e}); falling back to zlib")
+        return cls("zlib", b"".join(samples)[-ZLIB_DICT_BYTES:])
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._compressor.compress(data)
+        compressor = zlib.compressobj(level=9, zdict=self.dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._decompressor.decompress(data)
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+def build_page_store(db_path: str, output_dir: str, book_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    Build a page store from shamela_robust.db.
+
+    Args:
+        db_path: Path to shamela_robust.db
+        output_dir: Store directory to create or overwrite
+        book_ids: Restrict to these books (defaults to all books)
+
+    Returns:
+        Counts of books, pages, blocks and raw/compressed bytes
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        ids = [book_id for book_id in _book_ids(conn, book_ids) if _has_table(conn, f"b{book_id}")]
+
+        # Pass 1: sample pages across books to train the shared dictionary
+        samples: List[bytes] = []
+        sampled_bytes = 0
+        for book_id in ids:
+            rows = conn.execute(f"SELECT content FROM b{book_id} WHERE COALESCE(is_deleted, 0) = 0 "
+                                f"ORDER BY chunk_id LIMIT ?", (DICT_SAMPLE_PAGES_PER_BOOK,))
+            for (content,) in rows:
+                sample = _clean(content).encode("utf-8")
+                if sample:
+                    samples.append(sample)
+                    sampled_bytes += len(sample)
+            if sampled_bytes >= DICT_SAMPLE_BYTES:
+                break
+        codec = _Codec.train(samples)
+
+        # Pass 2: pack each book's pages into compressed blocks
+        books: List[Tuple[int, int, int, int]] = []
+        slots: List[Tuple[int, int, int, int]] = []
+        block_index: List[Tuple[int, int]] = []
+        stats = {"books": 0, "pages": 0, "blocks": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        with open(os.path.join(output_dir, "blocks.bin.tmp"), "wb") as blocks_file:
+            offset = 0
+            block = bytearray()
+
+            def flush_block() -> None:
+                nonlocal offset, block
+                if not block:
+                    return
+                compressed = codec.compress(bytes(block))
+                blocks_file.write(compressed)
+                block_index.append((offset, len(compressed)))
+                offset += len(compressed)
+                stats["raw_bytes"] += len(block)
+                stats["compressed_bytes"] += len(compressed)
+                block = bytearray()
+
+            for book_id in ids:
+                rows = conn.execute(f"SELECT chunk_id, page, content FROM b{book_id} "
+                                    f"WHERE COALESCE(is_deleted, 0) = 0 ORDER BY chunk_id").fetchall()
+                if not rows:
+                    continue
+                first_chunk_id = rows[0][0]
+                slot_count = rows[-1][0] - first_chunk_id + 1
+                first_slot = len(slots)
+                slots.extend([(EMPTY_SLOT, 0, 0, 0)] * slot_count)
+                for chunk_id, page, content in rows:
+                    data = _clean(content).encode("utf-8")
+                    if len(block) + len(data) > BLOCK_BYTES:
+                        flush_block()
+                    slots[first_slot + chunk_id - first_chunk_id] = (len(block_index), len(block), len(data), page or 0)
+                    block.extend(data)
+                    stats["pages"] += 1
+                flush_block()  # Blocks never span books
+                books.append((book_id, first_slot, first_chunk_id, slot_count))
+                stats["books"] += 1
+            stats["blocks"] = len(block_index)
+            blocks_file.flush()
+            os.fsync(blocks_file.fileno())
+    finally:
+        conn.close()
+
+    np.save(os.path.join(output_dir, "blocks.npy"), np.array(block_index, dtype=np.int64).reshape(-1, 2))
+    np.save(os.path.join(output_dir, "pages.npy"), np.array(slots, dtype=np.uint32).reshape(-1, 4))
+    np.save(os.path.join(output_dir, "books.npy"), np.array(books, dtype=np.int64).reshape(-1, 4))
+    with open(os.path.join(output_dir, "dictionary.bin"), "wb") as f:
+        f.write(codec.dictionary)
+    os.replace(os.path.join(output_dir, "blocks.bin.tmp"), os.path.join(output_dir, "blocks.bin"))
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": FORMAT_VERSION, "codec": codec.name, **stats}, f)
+    logger.info(f"Built page store at {output_dir}: {stats} (codec {codec.name})")
+    return stats
+
+
+class PageStore:
+    """Memory-mapped reader for a store built by build_page_store()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported page store version {self.manifest.get('version')} in {path}")
+        with open(os.path.join(path, "dictionary.bin"), "rb") as f:
+            self._codec = _Codec(self.manifest["codec"], f.read())
+
+        self._blocks = np.load(os.path.join(path, "blocks.npy"), mmap_mode="r")
+        self._pages = np.load(os.path.join(path, "pages.npy"), mmap_mode="r")
+        self._books = {int(book_id): (int(first_slot), int(first_chunk_id), int(slot_count))
+                       for book_id, first_slot, first_chunk_id, slot_count
+                       in np.load(os.path.join(path, "books.npy"))}
+        self._file = open(os.path.join(path, "blocks.bin"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        logger.info(f"Page store {path} opened: {self.manifest['pages']} pages in "
+                    f"{self.manifest['blocks']} blocks ({self.manifest['codec']})")
+
+    def __len__(self) -> int:
+        return int(self.manifest["pages"])
+
+    def _block(self, block_id: int) -> bytes:
+        with self._cache_lock:
+            cached = self._cache.get(block_id)
+            if cached is not None:
+                self._cache.move_to_end(block_id)
+                return cached
+        offset, size = self._blocks[block_id]
+        raw = self._codec.decompress(self._data[int(offset):int(offset) + int(size)])
+        with self._cache_lock:
+            self._cache[block_id] = raw
+            while len(self._cache) > BLOCK_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return raw
+
+    def _slot(self, book_id: int, chunk_id: int) -> Optional[np.ndarray]:
+        book = self._books.get(int(book_id))
+        if book is None:
+            return None
+        first_slot, first_chunk_id, slot_count = book
+        position = int(chunk_id) - first_chunk_id
+        if not 0 <= position < slot_count:
+            return None
+        slot = self._pages[first_slot + position]
+        return None if slot[0] == EMPTY_SLOT else slot
+
+    def get(self, book_id: int, chunk_id: int) -> Optional[str]:
+        """Text of one page, or None if the page does not exist or was deleted."""
+        slot = self._slot(book_id, chunk_id)
+        if slot is None:
+            return None
+        block_id, start, length, _ = (int(value) for value in slot)
+        return self._block(block_id)[start:start + length].decode("utf-8")
+
+    def page_number(self, book_id: int, chunk_id: int) -> Optional[int]:
+        """Printed page number of a page, or None if it does not exist."""
+        slot = self._slot(book_id, chunk_id)
+        return None if slot is None else int(slot[3])
+
+    def pages(self, book_id: int, first_chunk_id: int, last_chunk_id: int) -> List[Tuple[int, str]]:
+        """
+        Pages of a book between two chunk ids (inclusive), in reading order,
+        skipping deleted rows.
+
+        Returns:
+            (chunk_id, text) pairs
+        """
+        book = self._books.get(int(book_id))
+        if book is None:
+            return []
+        first_slot, first_chunk_id_of_book, slot_count = book
+        pages = []
+        for candidate in range(max(int(first_chunk_id), first_chunk_id_of_book),
+                               min(int(last_chunk_id), first_chunk_id_of_book + slot_count - 1) + 1):
+            text = self.get(book_id, candidate)
+            if text is not None:
+                pages.append((candidate, text))
+        return pages
+
+    def neighbours(self, book_id: int, chunk_id: int, before: int = 1, after: int = 1) -> List[Tuple[int, str]]:
+        """
+        Pages around a page, in reading order, skipping deleted rows.
+
+        Returns:
+            (chunk_id, text) pairs including the page itself when it exists
+        """
+        return self.pages(book_id, int(chunk_id) - before, int(chunk_id) + after)
+
+    def chunk_text(self, book_id: int, first_chunk_id: int, last_chunk_id: int) -> Optional[str]:
+        """
+        Text of a section chunk made of whole pages, joined as the section chunker
+        joins them (empty pages are skipped). None if none of its pages exist.
+        """
+        texts = [text for _, text in self.pages(book_id, first_chunk_id, last_chunk_id) if text]
+        return PAGE_SEPARATOR.join(texts) if texts else None
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+_store: Optional[PageStore] = None
+_store_lock = threading.Lock()
+_missing_logged = False
+
+
+def get_page_store() -> Optional[PageStore]:
+    """
+    Returns the configured page store, or None if it has not been built.
+
+    A missing store is not remembered, so one built after startup is picked
+    up by the next call.
+    """
+    global _store, _missing_logged
+    with _store_lock:
+        if _store is None:
+            if not os.path.exists(os.path.join(settings.PAGE_STORE_PATH, "manifest.json")):
+                if not _missing_logged:
+                    logger.info(f"No page store at {settings.PAGE_STORE_PATH}")
+                    _missing_logged = True
+                return None
+            _store = PageStore(settings.PAGE_STORE_PATH)
+        return _store
+
+
+def resolve_chunk_text(book_id: Any, page_row_start: Any, page_row_end: Any) -> Optional[str]:
+    """
+    Text of a chunk from the page store, by its book and page row range
+    (numeric metadata may come back from Pinecone as floats or strings).
+
+    Returns:
+        None if there is no page store or the chunk has no page row range
+        (chunks holding part of a split page, or indexed before ranges were recorded)
+    """
+    if book_id is None or page_row_start is None or page_row_end is None:
+        return None
+    store = get_page_store()
+    if store is None:
+        return None
+    try:
+        return store.chunk_text(int(float(book_id)), int(float(page_row_start)), int(float(page_row_end)))
+    except (TypeError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the compressed page store from shamela_robust.db.")
+    parser.add_argument("db_path", help="Path to shamela_robust.db")
+    parser.add_argument("--output", default=settings.PAGE_STORE_PATH, help="Store directory")
+    parser.add_argument("--book_id", type=int, action="append", help="Book ID to process (repeatable, default: all)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    stats = build_page_store(args.db_path, args.output, args.book_id)
+    ratio = stats["compressed_bytes"] / max(stats["raw_bytes"], 1)
+    logger.info(f"Compressed {stats['raw_bytes'] / 1e6:.1f} MB of page text to "
+                f"{stats['compressed_bytes'] / 1e6:.1f} MB ({ratio:.1%})")
+
+
+if __name__ == "__main__":
+    main()
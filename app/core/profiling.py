@@ -0,0 +1,215 @@
+# app/core/profiling.py
+"""
+Finding what blocks the event loop: a loop-lag monitor and a sampling profiler.
+
+LoopLagMonitor runs a probe task that sleeps LOOP_LAG_INTERVAL_SECONDS and
+observes how late it wakes up in the event_loop_lag_seconds histogram. A
+watchdog thread checks the probe's heartbeat; when the loop has not run it
+for LOOP_LAG_THRESHOLD_MS, the callback holding the loop is still on the
+stack, so the watchdog logs the loop thread's stack (once per stall) and
+counts the stall. Blocking SDK calls made from async handlers show up there
+by file and line.
+
+sample_stacks() is a wall-clock sampling profiler built on
+sys._current_frames(): every interval it records the stack of every thread
+(or of selected threads) without tracing hooks, so it can run against a live
+worker. Results render as collapsed stacks (flamegraph.pl, speedscope) or
+speedscope JSON. Only one profile runs at a time and its length is capped by
+PROFILE_MAX_SECONDS; neither tool costs anything while idle.
+"""
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.core.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 128
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+StackSamples = Dict[Tuple[str, Tuple[Frame, ...]], int]  # (thread name, root-first frames) -> samples
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+# --- Event loop lag ---
+
+class LoopLagMonitor:
+    """Measures event loop lag and logs the stack of callbacks that block it."""
+
+    def __init__(self, interval: Optional[float] = None, threshold_ms: Optional[float] = None):
+        self.interval = interval or settings.LOOP_LAG_INTERVAL_SECONDS
+        self.threshold = (threshold_ms or settings.LOOP_LAG_THRESHOLD_MS) / 1000
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        """Start probing the running event loop (call from a coroutine)."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop lag monitor started (interval {self.interval}s, "
+                    f"stall threshold {self.threshold * 1000:.0f}ms)")
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=2 * self.threshold + self.interval)
+            self._watchdog = None
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self._heartbeat = time.monotonic()
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopping.wait(self.threshold / 4):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat  # One report per stall
+            self.stalls += 1
+            EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(loop thread not found)\n"
+            logger.warning("Event loop blocked for %.0fms; loop thread stack:\n%s", blocked_for * 1000, stack)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self._task is not None, "stalls": self.stalls, "max_lag_ms": round(self.max_lag * 1000, 2)}
+
+
+@lru_cache()
+def get_loop_lag_monitor() -> LoopLagMonitor:
+    """Process-wide monitor, started with the app when LOOP_LAG_MONITOR_ENABLED."""
+    return LoopLagMonitor()
+
+
+def start_loop_monitor() -> None:
+    if settings.LOOP_LAG_MONITOR_ENABLED:
+        get_loop_lag_monitor().start()
+
+
+def stop_loop_monitor() -> None:
+    get_loop_lag_monitor().stop()
+
+
+# --- Sampling profiler ---
+
+_profile_lock = threading.Lock()
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    frames: List[Frame] = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        frames.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+
+def sample_stacks(seconds: float, interval: float = 0.01,
+                  thread_ids: Optional[Iterable[int]] = None) -> StackSamples:
+    """
+    Sample the stacks of running threads for a while (blocking; run it in a worker thread).
+
+    Args:
+        seconds: How long to sample (capped at PROFILE_MAX_SECONDS)
+        interval: Seconds between samples
+        thread_ids: Only sample these threads (default: every thread but the sampler's)
+
+    Returns:
+        Sample counts per (thread name, stack)
+
+    Raises:
+        ProfilerBusy: If another profile is running
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        own_id = threading.get_ident()
+        wanted = set(thread_ids) if thread_ids is not None else None
+        samples: StackSamples = collections.Counter()
+        deadline = time.monotonic() + min(seconds, settings.PROFILE_MAX_SECONDS)
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (wanted is not None and thread_id not in wanted):
+                    continue
+                samples[(names.get(thread_id, str(thread_id)), _stack(frame))] += 1
+            time.sleep(interval)
+        return dict(samples)
+    finally:
+        _profile_lock.release()
+
+
+def _frame_label(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({filename}:{line})"
+
+
+def to_collapsed(samples: StackSamples) -> str:
+    """Collapsed stacks, one "thread;outer;...;inner count" line per stack, most sampled first."""
+    lines = []
+    for (thread_name, stack), count in sorted(samples.items(), key=lambda item: -item[1]):
+        labels = [thread_name] + [_frame_label(frame).replace(";", ":") for frame in stack]
+        lines.append(f"{';'.join(labels)} {count}")
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def to_speedscope(samples: StackSamples, interval: float, name: str = "profile") -> Dict[str, Any]:
+    """speedscope file format: one sampled profile per thread, weights in seconds."""
+    frame_index: Dict[Frame, int] = {}
+    frames: List[Dict[str, Any]] = []
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for (thread_name, stack), count in samples.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            indices.append(frame_index[frame])
+        profile = profiles.setdefault(thread_name, {
+            "type": "sampled", "name": thread_name, "unit": "seconds",
+            "startValue": 0, "endValue": 0.0, "samples": [], "weights": [],
+        })
+        profile["samples"].append(indices)
+        profile["weights"].append(count * interval)
+        profile["endValue"] += count * interval
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": settings.API_TITLE,
+        "shared": {"frames": frames},
+        "profiles": list(profiles.values()),
+    }
@@ -0,0 +1,429 @@
+# app/core/rag_pipeline.py
+"""
+Staged RAG pipeline shared by every endpoint that answers questions.
+
+A request is a PipelineContext run through a fixed sequence of stages:
+
+    history -> store_query -> retrieve -> rerank -> pack -> generate -> persist
+
+Each stage is an async function that reads and updates the context. The
+pipeline times every stage and records its status and any cache statistics
+in ctx.stages, so an optimisation made in one stage applies to the chat,
+streaming and /rag/query endpoints alike.
+
+Output goes to a sink. run() uses no sink: the answer is generated in one LLM
+call and read from the context afterwards. stream() attaches a queue sink and
+yields ("chunk" | "sources" | "message_id" | "error", data) events while the
+stages run.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from appwrite.query import Query
+from appwrite.services.databases import Databases
+
+from app.config.settings import settings
+from app.core.context_formatter import (
+    PackedContext, construct_llm_prompt, count_tokens, frontend_history_lines, history_lines, pack_context
+)
+from app.core.llm_service import call_gemini_api, call_gemini_streaming, call_mistral_streaming, call_mistral_with_retry
+from app.core.retrieval import get_retriever
+from app.core.storage import store_message, update_conversation_timestamp
+from app.core.metrics import LLM_FALLBACKS, RAG_IN_FLIGHT, UPSTREAM_ERRORS
+from app.core.timing import record, timed
+from app.core.tracing import CLIENT, current_span, span
+from app.models.schemas import DocumentMatch, HistoryMessage, Message, RetrievalFilter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE = "Error: Could not generate response."
+RETRIEVAL_ERROR_RESPONSE = "I'm having trouble finding relevant information right now."
+NO_DOCUMENTS_RESPONSE = "I couldn't find any relevant information to answer your question."
+STREAM_ERROR_DETAIL = "An error occurred during streaming."
+
+
+@dataclass
+class StageRecord:
+    """Outcome of one stage for one request."""
+    name: str
+    duration_ms: float
+    status: str  # "ok", "failed" or "skipped"
+    cache: Dict[str, Any] = field(default_factory=dict)
+
+
+class ResponseSink:
+    """Receives pipeline events. The base sink discards them (non-streaming requests)."""
+
+    streaming = False
+
+    async def emit(self, event: str, data: Any) -> None:
+        pass
+
+
+class QueueSink(ResponseSink):
+    """Forwards events to an asyncio.Queue read by RagPipeline.stream()."""
+
+    streaming = True
+
+    def __init__(self):
+        self.queue: "asyncio.Queue[Optional[Tuple[str, Any]]]" = asyncio.Queue()
+
+    async def emit(self, event: str, data: Any) -> None:
+        await self.queue.put((event, data))
+
+    async def close(self) -> None:
+        await self.queue.put(None)
+
+
+@dataclass
+class PipelineContext:
+    """Inputs of one RAG request and the state the stages build up."""
+    query: str
+    top_k: Optional[int] = None  # Defaults to settings.RETRIEVAL_TOP_K
+    filters: Optional[RetrievalFilter] = None
+    compress: Optional[bool] = None
+    rerank: bool = True
+    require_documents: bool = False  # Stop with NO_DOCUMENTS_RESPONSE instead of answering without context
+    # Conversation; persistence happens only for authenticated users with a db
+    db: Optional[Databases] = None
+    user_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+    is_anonymous: bool = True
+    frontend_history: Optional[List[HistoryMessage]] = None
+    sink: ResponseSink = field(default_factory=ResponseSink)
+
+    # Filled in by the stages
+    prompt_history: List[str] = field(default_factory=list)
+    documents: List[DocumentMatch] = field(default_factory=list)
+    packed: Optional[PackedContext] = None
+    prompt: str = ""
+    response: str = DEFAULT_RESPONSE
+    model_used: str = "none"
+    fallback_used: bool = False
+    error_detail: Optional[str] = None
+    stopped: bool = False  # Set when a stage ends the request early
+    user_message_id: Optional[str] = None
+    ai_message_id: Optional[str] = None
+    stages: List[StageRecord] = field(default_factory=list)
+
+    @property
+    def sources(self) -> List[Dict[str, Any]]:
+        return self.packed.sources if self.packed else []
+
+    def stop(self, response: str) -> None:
+        """Answer with response and skip the remaining (non-final) stages."""
+        self.response = response
+        self.stopped = True
+
+    def timings(self) -> Dict[str, float]:
+        """Milliseconds spent in each stage that ran."""
+        return {record.name: record.duration_ms for record in self.stages if record.status != "skipped"}
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One pipeline step.
+
+    required: a failure stops the pipeline (optional stages log and continue).
+    always: runs even after the pipeline was stopped, like a finally block.
+    failure_response: answer given to the user when this stage fails.
+    """
+    name: str
+    run: Callable[[PipelineContext], Awaitable[Optional[Dict[str, Any]]]]
+    required: bool = True
+    always: bool = False
+    failure_response: Optional[str] = None
+
+
+# --- Stages ---
+
+def _fetch_history_messages(db: Databases, conversation_id: str) -> List[Message]:
+    result = db.list_documents(
+        database_id=settings.APPWRITE_DATABASE_ID,
+        collection_id=settings.APPWRITE_MESSAGES_COLLECTION_ID,
+        queries=[
+            Query.equal("conversation_id", conversation_id),
+            Query.order_desc("timestamp"),
+        ]
+    )
+    messages = []
+    for doc in result.get('documents', [])[::-1]:  # Oldest first
+        try:
+            messages.append(Message(
+                message_id=doc.get('$id'),
+                conversation_id=doc.get('conversation_id'),
+                user_id=doc.get('user_id'),
+                content=doc.get('content'),
+                message_type=doc.get('message_type'),
+                timestamp=doc.get('timestamp'),
+                sources=doc.get('sources', [])
+            ))
+        except Exception as pydantic_error:
+            logger.warning(f"Pydantic validation failed for history doc ID {doc.get('$id')}: {pydantic_error}")
+    return messages
+
+
+async def history_stage(ctx: PipelineContext) -> Dict[str, Any]:
+    """Load stored history for authenticated conversations, or use the frontend's for anonymous users."""
+    if not ctx.is_anonymous and ctx.db and ctx.conversation_id:
+        with timed("appwrite_read"), span("appwrite.list_documents", kind=CLIENT,
+                                          collection="messages") as fetch_span:
+            messages = await asyncio.to_thread(_fetch_history_messages, ctx.db, ctx.conversation_id)
+            fetch_span.set_attribute("result_count", len(messages))
+        ctx.prompt_history = history_lines(messages)
+        return {"source": "appwrite", "messages": len(messages)}
+    if ctx.is_anonymous and ctx.frontend_history:
+        ctx.prompt_history = frontend_history_lines(ctx.frontend_history)
+        return {"source": "frontend", "messages": len(ctx.prompt_history)}
+    return {"source": "none", "messages": 0}
+
+
+async def store_query_stage(ctx: PipelineContext) -> None:
+    """
+    Store the user message before any slow work, so it is saved even if
+    retrieval or generation fails or a streaming client disconnects.
+    """
+    if ctx.is_anonymous or not ctx.db or not ctx.conversation_id:
+        return None
+    user_message = await asyncio.to_thread(
+        store_message, db=ctx.db, user_id=ctx.user_id, content=ctx.query, message_type="user",
+        conversation_id=ctx.conversation_id, is_anonymous=False
+    )
+    ctx.user_message_id = user_message.get("message_id")
+    await asyncio.to_thread(update_conversation_timestamp, ctx.db, ctx.conversation_id)
+    return None
+
+
+async def retrieve_stage(ctx: PipelineContext) -> Dict[str, Any]:
+    """Retrieve the top_k documents for the query."""
+    ctx.documents = await get_retriever().retrieve(query=ctx.query, top_k=ctx.top_k or settings.RETRIEVAL_TOP_K,
+                                                   filters=ctx.filters) or []
+    logger.info(f"Retrieved {len(ctx.documents)} documents for query: {ctx.query[:50]}...")
+    if not ctx.documents and ctx.require_documents:
+        ctx.stop(NO_DOCUMENTS_RESPONSE)
+    return {"documents": len(ctx.documents)}
+
+
+async def rerank_stage(ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+    """
+    Order documents for packing. Currently by retriever score; a cross-encoder
+    reranker would replace this stage.
+    """
+    if not ctx.rerank:
+        return None
+    ctx.documents = sorted(ctx.documents, key=lambda doc: doc.score, reverse=True)
+    return None
+
+
+async def pack_stage(ctx: PipelineContext) -> Dict[str, Any]:
+    """Pack history and passages into the token budget and build the prompt."""
+    before = count_tokens.cache_info()
+    ctx.packed = pack_context(ctx.query, ctx.documents, ctx.prompt_history, compress=ctx.compress)
+    ctx.prompt = construct_llm_prompt(ctx.packed.history_text, ctx.packed.context_text, ctx.query)
+    after = count_tokens.cache_info()
+    current_span().set_attributes(sources=len(ctx.packed.sources),
+                                  **{f"tokens.{part}": count for part, count in ctx.packed.token_counts.items()})
+    logger.info(f"Context packed. Sources: {len(ctx.packed.sources)}, "
+                f"tokens: {ctx.packed.token_counts['total']}/{ctx.packed.token_counts['budget']}")
+    return {"token_count_hits": after.hits - before.hits, "token_count_misses": after.misses - before.misses}
+
+
+def _mistral_content(prompt: str) -> Optional[str]:
+    """Call Mistral and return the answer text, or None if the call or its response is unusable."""
+    response = call_mistral_with_retry(prompt)
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except json.JSONDecodeError as json_err:
+        logger.error(f"Failed to decode Mistral JSON response: {json_err}")
+        return None
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        logger.error(f"Invalid Mistral response structure: {data}")
+        return None
+
+
+async def _generate_complete(ctx: PipelineContext) -> None:
+    with timed("llm"):
+        content = await asyncio.to_thread(_mistral_content, ctx.prompt)
+    if content is not None:
+        ctx.response, ctx.model_used = content, settings.MISTRAL_MODEL
+        return
+    logger.warning("Mistral call failed. Attempting fallback to Gemini.")
+    ctx.fallback_used = True
+    LLM_FALLBACKS.inc(mode="complete")
+    with timed("llm"):
+        gemini_result = await asyncio.to_thread(call_gemini_api, ctx.prompt)
+    if gemini_result.get("success"):
+        ctx.response, ctx.model_used = gemini_result["content"], settings.GEMINI_MODEL
+    else:
+        UPSTREAM_ERRORS.inc(service="gemini", status="error")
+        logger.error(f"Gemini fallback also failed. Error: {gemini_result.get('error', 'Unknown Gemini error')}")
+        ctx.error_detail = f"Primary LLM failed. Fallback LLM error: {gemini_result.get('error', 'Unknown')}"
+
+
+async def _generate_streamed(ctx: PipelineContext) -> None:
+    providers = (("mistral", settings.MISTRAL_MODEL, call_mistral_streaming),
+                 ("gemini", settings.GEMINI_MODEL, call_gemini_streaming))
+    for service, model, call in providers:
+        tokens: List[str] = []
+        start = time.perf_counter()
+        try:
+            with timed("llm"), span(f"{service}.chat_stream", kind=CLIENT, model=model,
+                                    prompt_chars=len(ctx.prompt)) as stream_span:
+                async for chunk in call(ctx.prompt):
+                    if chunk:
+                        if not tokens:
+                            first_token_ms = (time.perf_counter() - start) * 1000
+                            record("llm_first_token", first_token_ms)
+                            stream_span.set_attribute("first_token_ms", round(first_token_ms, 2))
+                        tokens.append(chunk)
+                        await ctx.sink.emit("chunk", {"token": chunk})
+                stream_span.set_attribute("chunks", len(tokens))
+        except Exception as stream_err:
+            logger.error(f"{model} stream failed: {stream_err}")
+            UPSTREAM_ERRORS.inc(service=service, status="stream_error")
+            if tokens:
+                raise  # Part of the answer was already sent; don't splice in another model's
+            if service == "mistral":
+                ctx.fallback_used = True
+                LLM_FALLBACKS.inc(mode="stream")
+            continue
+        ctx.response, ctx.model_used = "".join(tokens), model
+        break
+    else:
+        ctx.error_detail = "LLM is unavailable."
+        await ctx.sink.emit("error", {"detail": ctx.error_detail})
+        return
+    await ctx.sink.emit("sources", ctx.sources)
+
+
+async def generate_stage(ctx: PipelineContext) -> Dict[str, Any]:
+    """Generate the answer: one call for plain requests, token events for streaming sinks (Mistral, then Gemini)."""
+    if ctx.sink.streaming:
+        await _generate_streamed(ctx)
+    else:
+        await _generate_complete(ctx)
+    return {"model": ctx.model_used, "fallback": ctx.fallback_used}
+
+
+async def persist_stage(ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+    """
+    Store the answer for authenticated conversations, if the client received it.
+
+    Streaming clients only receive generated answers; a fallback response set
+    by a failed stage reached them as an error event and is not stored.
+    """
+    if ctx.is_anonymous or not ctx.db or not ctx.conversation_id:
+        return None
+    delivered = not ctx.sink.streaming or ctx.model_used != "none"
+    if delivered and ctx.response and not ctx.response.startswith("Error:"):
+        try:
+            ai_message = await asyncio.to_thread(
+                store_message, db=ctx.db, user_id="ai", content=ctx.response, message_type="ai",
+                conversation_id=ctx.conversation_id, is_anonymous=False, sources=ctx.sources
+            )
+            ctx.ai_message_id = ai_message.get("message_id")
+            logger.info(f"Stored AI message {ctx.ai_message_id} for conversation {ctx.conversation_id}")
+            await ctx.sink.emit("message_id", {"message_id": ctx.ai_message_id})
+        except Exception as store_err:
+            logger.error(f"Failed to store AI message for conversation {ctx.conversation_id}: {store_err}")
+    try:
+        await asyncio.to_thread(update_conversation_timestamp, ctx.db, ctx.conversation_id)
+    except Exception as update_err:
+        logger.error(f"Failed to update timestamp for conversation {ctx.conversation_id}: {update_err}")
+    return None
+
+
+DEFAULT_STAGES: Tuple[Stage, ...] = (
+    Stage("history", history_stage, required=False),
+    Stage("store_query", store_query_stage, required=False),
+    Stage("retrieve", retrieve_stage, failure_response=RETRIEVAL_ERROR_RESPONSE),
+    Stage("rerank", rerank_stage, required=False),
+    Stage("pack", pack_stage),
+    Stage("generate", generate_stage),
+    Stage("persist", persist_stage, required=False, always=True),
+)
+
+
+# --- Engine ---
+
+class RagPipeline:
+    """Runs PipelineContexts through a sequence of stages."""
+
+    def __init__(self, stages: Sequence[Stage] = DEFAULT_STAGES):
+        self.stages = tuple(stages)
+
+    async def _run_stage(self, stage: Stage, ctx: PipelineContext) -> None:
+        if ctx.stopped and not stage.always:
+            ctx.stages.append(StageRecord(stage.name, 0.0, "skipped"))
+            return
+        start = time.perf_counter()
+        status, cache = "ok", None
+        with span(f"rag.{stage.name}") as stage_span:
+            try:
+                cache = await stage.run(ctx)
+            except Exception as e:
+                status = "failed"
+                stage_span.set_status("error", str(e))
+                logger.exception(f"RAG pipeline stage '{stage.name}' failed: {e}")
+                if stage.required:
+                    ctx.error_detail = ctx.error_detail or f"{stage.name.capitalize()} error: {e}"
+                    ctx.stop(stage.failure_response or ctx.response)
+                    if ctx.sink.streaming:
+                        await ctx.sink.emit("error", {"detail": stage.failure_response or STREAM_ERROR_DETAIL})
+            stage_span.set_attributes(**(cache or {}))
+        duration_ms = (time.perf_counter() - start) * 1000
+        record(stage.name, duration_ms)
+        ctx.stages.append(StageRecord(stage.name, duration_ms, status, cache or {}))
+
+    async def run(self, ctx: PipelineContext) -> PipelineContext:
+        """Run every stage; the answer, sources and stage records are left on ctx."""
+        mode = "stream" if ctx.sink.streaming else "complete"
+        with RAG_IN_FLIGHT.track_inprogress(mode=mode), span("rag.pipeline", mode=mode, top_k=ctx.top_k,
+                                                             anonymous=ctx.is_anonymous) as pipeline_span:
+            for stage in self.stages:
+                await self._run_stage(stage, ctx)
+            pipeline_span.set_attributes(model=ctx.model_used, fallback=ctx.fallback_used,
+                                         documents=len(ctx.documents), error=ctx.error_detail)
+        timings = ", ".join(f"{name}={ms:.1f}ms" for name, ms in ctx.timings().items())
+        logger.info(f"RAG pipeline finished ({timings}); model: {ctx.model_used}, error: {ctx.error_detail}")
+        return ctx
+
+    async def stream(self, ctx: PipelineContext) -> AsyncGenerator[Tuple[str, Any], None]:
+        """Run every stage, yielding (event, data) pairs as the stages emit them."""
+        sink = QueueSink()
+        ctx.sink = sink
+
+        async def run_and_close() -> None:
+            try:
+                await self.run(ctx)
+            finally:
+                await sink.close()
+
+        task = asyncio.create_task(run_and_close())
+        try:
+            while True:
+                item = await sink.queue.get()
+                if item is None:
+                    break
+                yield item
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+
+@lru_cache()
+def get_rag_pipeline() -> RagPipeline:
+    """Shared pipeline with the default stages."""
+    return RagPipeline()
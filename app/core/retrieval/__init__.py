@@ -4,7 +4,6 @@ from app.config.settings import settings
 from .base import Retriever
 from .pinecone import PineconeRetriever
 # Import other retriever implementations here if added later
-# from .faiss import FaissRetriever
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +18,10 @@ def get_retriever() -> Retriever:
 
     if provider == "pinecone":
         return PineconeRetriever()
+    elif provider == "local":
+        from .local import LocalRetriever  # Imported lazily: loads the embedding store
+        return LocalRetriever()
     # Add other providers here
-    # elif provider == "faiss":
-    #     return FaissRetriever()
     else:
         logger.error(f"Unsupported retriever provider configured: {provider}")
         raise ValueError(f"Unsupported retriever provider: {provider}")
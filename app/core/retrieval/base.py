@@ -1,19 +1,37 @@
 import logging
 from typing import List, Protocol, Optional
-from app.models.schemas import DocumentMatch
+from app.models.schemas import DocumentMatch, RetrievalFilter
 
 logger = logging.getLogger(__name__)
 
 class Retriever(Protocol):
     """Protocol defining the interface for all retriever implementations."""
 
-    async def retrieve(self, query: str, top_k: int) -> Optional[List[DocumentMatch]]:
+    async def retrieve(self, query: str, top_k: int,
+                       filters: Optional[RetrievalFilter] = None) -> Optional[List[DocumentMatch]]:
         """
         Retrieves relevant documents for a given query.
 
         Args:
             query: The user's query text.
             top_k: The maximum number of documents to return.
+            filters: Optional metadata filter, applied by the backend before top_k is taken.
+
+        Returns:
+            A list of DocumentMatch objects, or None if an error occurs.
+        """
+        ...
+
+    async def retrieve_by_vector(self, query_vector: List[float], top_k: int,
+                                 filters: Optional[RetrievalFilter] = None) -> Optional[List[DocumentMatch]]:
+        """
+        Retrieves relevant documents for an already computed query embedding,
+        e.g. one of several embedded together by the batch retrieval endpoint.
+
+        Args:
+            query_vector: The query embedding.
+            top_k: The maximum number of documents to return.
+            filters: Optional metadata filter, applied by the backend before top_k is taken.
 
         Returns:
             A list of DocumentMatch objects, or None if an error occurs.
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.embedding_store import EmbeddingStore
+from app.core.embeddings import embed_query, get_text_embedding
+from app.core.timing import timed
+from app.core.tracing import span
+from app.models.schemas import DocumentMatch, DocumentMetadata, RetrievalFilter
+from .base import Retriever
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _filter_key(field: str, value: Any) -> Any:
+    """Normalise a metadata value for filter matching (book ids may be stored as floats)."""
+    if field == "book_id":
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+    return None if value is None else str(value)
+
+
+class LocalRetriever(Retriever):
+    """
+    Retriever implementation doing exact cosine search over the local binary
+    embedding store. Shards stay memory-mapped; only their norms are cached.
+
+    Metadata filters are applied before scoring: for each (shard, field) the
+    sorted row indices of each distinct value are built on first use and
+    cached (memory proportional to the shard, not to shard x values), so a
+    filtered query only multiplies the selected rows. A book filter also
+    matches canonical chunks whose deduplicated copies came from that book.
+    The scan runs in a worker thread, so queries don't block the event loop.
+    """
+
+    def __init__(self, store_path: Optional[str] = None):
+        self.store = EmbeddingStore(store_path or settings.EMBEDDING_STORE_PATH)
+        self._norms: Dict[str, np.ndarray] = {}
+        self._value_rows: Dict[Tuple[str, str], Dict[Any, np.ndarray]] = {}
+        logger.info(f"Local retriever opened store {self.store.path} with {len(self.store)} vectors")
+
+    def _shard_norms(self, name: str, vectors: np.ndarray) -> np.ndarray:
+        if name not in self._norms:
+            norms = np.linalg.norm(vectors.astype(np.float32, copy=False), axis=1)
+            norms[norms == 0] = 1.0
+            self._norms[name] = norms
+        return self._norms[name]
+
+    def _rows_by_value(self, name: str, rows: List[Dict[str, Any]], field: str) -> Dict[Any, np.ndarray]:
+        """
+        Sorted row indices of each distinct value of a metadata field in a shard.
+        Rows are listed under their book_id and under each of their duplicate_book_ids.
+        """
+        key = (name, field)
+        if key not in self._value_rows:
+            grouped: Dict[Any, List[int]] = {}
+            for row_index, row in enumerate(rows):
+                metadata = row.get("metadata") or {}
+                values = [metadata.get(field)]
+                if field == "book_id":
+                    values.extend(metadata.get("duplicate_book_ids") or [])
+                for value in {_filter_key(field, value) for value in values} - {None}:
+                    grouped.setdefault(value, []).append(row_index)
+            self._value_rows[key] = {value: np.array(indices, dtype=np.int32) for value, indices in grouped.items()}
+        return self._value_rows[key]
+
+    def _shard_selection(self, name: str, rows: List[Dict[str, Any]],
+                         conditions: Dict[str, List[Any]]) -> np.ndarray:
+        """Row indices of a shard matching every field condition (any value within a field)."""
+        selected: Optional[np.ndarray] = None
+        for field, values in conditions.items():
+            rows_by_value = self._rows_by_value(name, rows, field)
+            matches = [rows_by_value[key] for key in {_filter_key(field, value) for value in values}
+                       if key in rows_by_value]
+            field_rows = np.unique(np.concatenate(matches)) if matches else np.empty(0, dtype=np.int32)
+            selected = field_rows if selected is None else np.intersect1d(selected, field_rows, assume_unique=True)
+            if not selected.size:
+                break
+        return selected if selected is not None else np.arange(len(rows))
+
+    def _search(self, query_vector: List[float], top_k: int,
+                filters: Optional[RetrievalFilter]) -> List[Tuple[float, str, int]]:
+        """Exact cosine scan over every shard; returns the best (score, shard name, row index), best first."""
+        query = np.array(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        conditions = filters.conditions() if filters else {}
+        candidates = []
+        for name, rows, vectors in self.store.iter_shards():
+            if not rows:
+                continue
+            norms = self._shard_norms(name, vectors)
+            if conditions:
+                selected = self._shard_selection(name, rows, conditions)
+                if not selected.size:
+                    continue
+                scores = (vectors[selected] @ query) / norms[selected]
+            else:
+                selected = None
+                scores = (vectors @ query) / norms
+            k = min(top_k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            row_indices = selected[best] if selected is not None else best
+            candidates.extend((float(scores[i]), name, int(row)) for i, row in zip(best, row_indices))
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return candidates[:top_k]
+
+    def _to_document_match(self, row: Dict[str, Any], score: float) -> Optional[DocumentMatch]:
+        metadata = row.get("metadata") or {}
+        book_id = metadata.get("book_id")
+        try:
+            metadata_model = DocumentMetadata(
+                author_name=metadata.get("author_name"),
+                book_name=metadata.get("book_name"),
+                category_name=metadata.get("category_name"),
+                section_title=metadata.get("section_title"),
+                text=metadata.get("text", ""),
+                book_id=str(int(book_id)) if book_id is not None else None,
+                chunk_index=metadata.get("chunk_index"),
+                page_row_start=metadata.get("page_row_start"),
+                page_row_end=metadata.get("page_row_end"),
+            )
+            return DocumentMatch(id=row["id"], score=score, metadata=metadata_model)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Invalid metadata for local match ID {row.get('id')}: {e}")
+            return None
+
+    async def retrieve(self, query: str, top_k: int,
+                       filters: Optional[RetrievalFilter] = None) -> List[DocumentMatch]:
+        """
+        Retrieves the top_k most similar chunks from the local store,
+        restricted to rows matching the metadata filter if one is given.
+        Always returns a list (possibly empty), never None.
+        """
+        query_embedding = await embed_query(query, get_text_embedding)
+        if not query_embedding:
+            logger.error("Failed to generate query embedding for local retrieval.")
+            return []
+        return await self.retrieve_by_vector(query_embedding, top_k, filters) or []
+
+    async def retrieve_by_vector(self, query_vector: List[float], top_k: int,
+                                 filters: Optional[RetrievalFilter] = None) -> Optional[List[DocumentMatch]]:
+        """
+        Retrieves the top_k chunks for an already computed query embedding.
+        Returns None if the search fails, so batch callers can report it.
+        """
+        try:
+            with timed("vector_search"), span("local.vector_search", top_k=top_k,
+                                              filtered=bool(filters and filters.conditions())):
+                # The scan is CPU-bound; run it off the event loop
+                candidates = await asyncio.to_thread(self._search, query_vector, top_k, filters)
+
+            matches = []
+            for score, name, row_index in candidates:
+                match = self._to_document_match(self.store.load_rows(name)[row_index], score)
+                if match:
+                    matches.append(match)
+
+            logger.info(f"Local retrieval returned {len(matches)} documents.")
+            return matches
+
+        except Exception as e:
+            logger.exception(f"CRITICAL Error querying local embedding store: {e}")
+            return None
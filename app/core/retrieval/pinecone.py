@@ -1,19 +1,78 @@
+import asyncio
 import logging
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from app.core.chunk_text_store import get_chunk_text_store
 from app.core.clients import get_pinecone_index
-from app.core.embeddings import get_text_embedding
-from app.models.schemas import DocumentMatch, DocumentMetadata
+from app.core.embeddings import embed_query, get_text_embedding
+from app.core.metrics import UPSTREAM_ERRORS
+from app.core.page_store import resolve_chunk_text
+from app.core.timing import timed
+from app.core.tracing import CLIENT, span
+from app.models.schemas import DocumentMatch, DocumentMetadata, RetrievalFilter
 from .base import Retriever
 from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+
+def build_pinecone_filter(filters: Optional[RetrievalFilter]) -> Optional[Dict[str, Any]]:
+    """
+    Translate a RetrievalFilter into a Pinecone metadata filter.
+
+    A single value becomes {"$eq": value}, several become {"$in": [...]}, and
+    multiple fields are combined with "$and". A book condition also matches
+    canonical chunks whose deduplicated copies came from those books
+    (duplicate_book_ids, a list of strings). Returns None when nothing is constrained.
+    """
+    if filters is None:
+        return None
+    clauses = []
+    for field, values in filters.conditions().items():
+        clause = {field: {"$eq": values[0]} if len(values) == 1 else {"$in": values}}
+        if field == "book_id":
+            clause = {"$or": [clause, {"duplicate_book_ids": {"$in": [str(value) for value in values]}}]}
+        clauses.append(clause)
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _int_metadata(value: Any) -> Optional[int]:
+    """Pinecone returns numeric metadata as floats."""
+    try:
+        return int(float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
 class PineconeRetriever(Retriever):
     """Retriever implementation using Pinecone."""
 
-    async def retrieve(self, query: str, top_k: int) -> List[DocumentMatch]:
+    def _resolve_texts(self, raw_matches) -> Dict[str, str]:
+        """
+        Look up text for matches whose metadata has none (PINECONE_SLIM_METADATA vectors):
+        from the page store for chunks made of whole pages, otherwise from the chunk-text store.
+        """
+        texts: Dict[str, str] = {}
+        missing = []
+        for match in raw_matches:
+            metadata = match.get('metadata') or {}
+            if not match.get('id') or metadata.get('text'):
+                continue
+            text = resolve_chunk_text(metadata.get('book_id'), metadata.get('page_row_start'),
+                                      metadata.get('page_row_end'))
+            if text is not None:
+                texts[match['id']] = text
+            else:
+                missing.append(match['id'])
+        store = get_chunk_text_store() if missing else None
+        if store is not None:
+            texts.update(store.get_many(missing))
+        return texts
+
+    async def retrieve(self, query: str, top_k: int,
+                       filters: Optional[RetrievalFilter] = None) -> List[DocumentMatch]:
         """
         Retrieves documents from Pinecone based on the query.
+        Filters are pushed down as a Pinecone metadata filter.
         Always returns a list (possibly empty), never None.
         """
         try:
@@ -22,77 +81,114 @@ class PineconeRetriever(Retriever):
                 logger.error("Pinecone index not available for retrieval.")
                 return []
 
-            # Assuming get_text_embedding is synchronous for now.
-            query_embedding = get_text_embedding(query)
+            # Off the event loop, micro-batched with concurrent queries when enabled
+            query_embedding = await embed_query(query, get_text_embedding)
             if not query_embedding:
                 logger.error("Failed to generate query embedding for retrieval.")
                 return []
 
-            logger.debug(f"Querying Pinecone index '{settings.PINECONE_INDEX_NAME}' with top_k={top_k}")
-            results = index.query(
+            return await self._query(index, query_embedding, top_k, filters, query)
+
+        except Exception as e:
+            logger.exception(f"CRITICAL Error querying Pinecone vector store: {e}")
+            UPSTREAM_ERRORS.inc(service="pinecone", status=getattr(e, "status", None) or "error")
+            return []
+
+    async def retrieve_by_vector(self, query_vector: List[float], top_k: int,
+                                 filters: Optional[RetrievalFilter] = None) -> Optional[List[DocumentMatch]]:
+        """
+        Retrieves documents for an already computed query embedding.
+        Returns None if the query fails, so batch callers can report the
+        failure instead of an empty result.
+        """
+        try:
+            index = get_pinecone_index()
+            if not index:
+                logger.error("Pinecone index not available for retrieval.")
+                return None
+            return await self._query(index, query_vector, top_k, filters)
+
+        except Exception as e:
+            logger.exception(f"CRITICAL Error querying Pinecone vector store: {e}")
+            UPSTREAM_ERRORS.inc(service="pinecone", status=getattr(e, "status", None) or "error")
+            return None
+
+    async def _query(self, index, query_embedding: List[float], top_k: int,
+                     filters: Optional[RetrievalFilter], query: str = "") -> List[DocumentMatch]:
+        """Run the index query off the event loop and convert the matches."""
+        query_filter = build_pinecone_filter(filters)
+        logger.debug("Querying Pinecone index '%s' with top_k=%d, filter=%s",
+                     settings.PINECONE_INDEX_NAME, top_k, query_filter)
+        query_kwargs = {"filter": query_filter} if query_filter else {}
+        with timed("vector_search"), span("pinecone.query", kind=CLIENT, index=settings.PINECONE_INDEX_NAME,
+                                          top_k=top_k, filtered=bool(query_filter)) as query_span:
+            results = await asyncio.to_thread(
+                index.query,
                 vector=query_embedding,
                 top_k=top_k,
-                include_metadata=True
+                include_metadata=True,
+                **query_kwargs
             )
+            query_span.set_attribute("result_count", len(results.get('matches') or []) if results else 0)
 
-            matches = []
-            if results and results.get('matches'):
-                logger.debug(f"Received {len(results['matches'])} matches from Pinecone.")
-                for match in results['matches']:
-                    match_id = match.get('id', 'UNKNOWN_ID')
-                    metadata_dict = match.get('metadata', {})
-                    logger.debug(f"Raw metadata for match ID {match_id}: {metadata_dict}")
-
-                    # Extract fields safely
-                    raw_text_content = metadata_dict.get('text', "")  # Default to empty string
-                    if not raw_text_content:  # Log if text is actually empty in metadata
-                        logger.warning(f"Match ID {match_id}: 'text' field is missing or empty in raw metadata.")
-
-                    author = metadata_dict.get('author_name')
-                    book = metadata_dict.get('book_name')
-                    category = metadata_dict.get('category_name')
-                    section = metadata_dict.get('section_title')
-
-                    # Convert book_id to string if it exists
-                    book_id_val = metadata_dict.get('book_id')
-                    book_id_str: Optional[str] = None
-                    if book_id_val is not None:
-                        try:
-                            # Convert float to int first (if applicable), then to string
-                            book_id_str = str(int(book_id_val))
-                        except (ValueError, TypeError):
-                            # If conversion fails, log it and keep as None or original string if already str
-                            logger.warning(f"Match ID {match_id}: Could not convert book_id '{book_id_val}' to string. Setting to None.")
-                            book_id_str = None
+        matches = []
+        if results and results.get('matches'):
+            logger.debug("Received %d matches from Pinecone.", len(results['matches']))
+            store_texts = self._resolve_texts(results['matches'])
+            for match in results['matches']:
+                match_id = match.get('id', 'UNKNOWN_ID')
+                metadata_dict = match.get('metadata', {})
+                logger.debug("Raw metadata for match ID %s: %s", match_id, metadata_dict)
 
+                # Extract fields safely; slim vectors carry no text, it comes from the local store
+                raw_text_content = metadata_dict.get('text') or store_texts.get(match_id, "")
+                if not raw_text_content:  # Log if text is actually empty in metadata
+                    logger.warning(f"Match ID {match_id}: 'text' field is missing or empty in raw metadata.")
+
+                author = metadata_dict.get('author_name')
+                book = metadata_dict.get('book_name')
+                category = metadata_dict.get('category_name')
+                section = metadata_dict.get('section_title')
+
+                # Convert book_id to string if it exists
+                book_id_val = metadata_dict.get('book_id')
+                book_id_str: Optional[str] = None
+                if book_id_val is not None:
                     try:
-                        # Create Pydantic model using the converted book_id_str
-                        metadata = DocumentMetadata(
-                            author_name=author,
-                            book_name=book,
-                            category_name=category,
-                            section_title=section,
-                            text=raw_text_content,
-                            book_id=book_id_str  # Pass the converted string or None
-                        )
-
-                        doc_match = DocumentMatch(
-                            id=match_id,
-                            score=match.get('score', 0.0),
-                            metadata=metadata
-                        )
-                        matches.append(doc_match)
-                    except Exception as pydantic_error:
-                        logger.error(f"Pydantic validation failed for metadata of match ID {match_id}: {pydantic_error}")
-                        logger.debug(f"Failing metadata dictionary (post book_id conversion attempt): {metadata_dict}")
+                        # Convert float to int first (if applicable), then to string
+                        book_id_str = str(int(book_id_val))
+                    except (ValueError, TypeError):
+                        # If conversion fails, log it and keep as None or original string if already str
+                        logger.warning(f"Match ID {match_id}: Could not convert book_id '{book_id_val}' to string. Setting to None.")
+                        book_id_str = None
 
-            else:
-                logger.warning(f"No matches found in Pinecone for query: {query[:50]}...")
+                try:
+                    # Create Pydantic model using the converted book_id_str
+                    metadata = DocumentMetadata(
+                        author_name=author,
+                        book_name=book,
+                        category_name=category,
+                        section_title=section,
+                        text=raw_text_content,
+                        book_id=book_id_str,  # Pass the converted string or None
+                        chunk_index=_int_metadata(metadata_dict.get('chunk_index')),
+                        page_row_start=_int_metadata(metadata_dict.get('page_row_start')),
+                        page_row_end=_int_metadata(metadata_dict.get('page_row_end'))
+                    )
 
-            # Log how many matches *successfully* passed validation
-            logger.info(f"Successfully processed {len(matches)} documents after validation.")
-            return matches
+                    doc_match = DocumentMatch(
+                        id=match_id,
+                        score=match.get('score', 0.0),
+                        metadata=metadata
+                    )
+                    matches.append(doc_match)
+                except Exception as pydantic_error:
+                    logger.error(f"Pydantic validation failed for metadata of match ID {match_id}: {pydantic_error}")
+                    logger.debug("Failing metadata dictionary (post book_id conversion attempt): %s", metadata_dict)
 
-        except Exception as e:
-            logger.exception(f"CRITICAL Error querying Pinecone vector store: {e}")
-            return []
+        else:
+            logger.warning(f"No matches found in Pinecone for query: {query[:50]}...")
+
+        # Log how many matches *successfully* passed validation
+        logger.info(f"Successfully processed {len(matches)} documents after validation.")
+        return matches
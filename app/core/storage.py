@@ -11,6 +11,8 @@ from appwrite.role import Role
 from appwrite.query import Query
 from appwrite.exception import AppwriteException # Added AppwriteException import
 from app.config.settings import settings
+from app.core.timing import timed
+from app.core.tracing import CLIENT, span
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +47,7 @@ def store_message(
         if is_anonymous:
             # For anonymous users, we don't persist to DB, just return a structure
             # consistent with persisted messages for the RAG response flow.
-            logger.debug(f"Handling anonymous message storage for user {user_id}")
+            logger.debug("Handling anonymous message storage for user %s", user_id)
             return {
                 "user_id": user_id,
                 "content": content,
@@ -65,24 +67,26 @@ def store_message(
             raise ValueError("conversation_id is required for non-anonymous users")
 
 
-        logger.debug(f"Storing message for user {user_id} in conversation {conversation_id}")
-        message_result = db.create_document(
-            database_id=settings.APPWRITE_DATABASE_ID,
-            collection_id=settings.APPWRITE_MESSAGES_COLLECTION_ID,
-            document_id="unique()",
-            data=message_data,
-            permissions=[
-                Permission.read(Role.user(user_id)),
-                Permission.update(Role.user(user_id)),
-                Permission.delete(Role.user(user_id))
-            ]
-        )
+        logger.debug("Storing message for user %s in conversation %s", user_id, conversation_id)
+        with timed("appwrite_write"), span("appwrite.create_document", kind=CLIENT, collection="messages",
+                                           message_type=message_type):
+            message_result = db.create_document(
+                database_id=settings.APPWRITE_DATABASE_ID,
+                collection_id=settings.APPWRITE_MESSAGES_COLLECTION_ID,
+                document_id="unique()",
+                data=message_data,
+                permissions=[
+                    Permission.read(Role.user(user_id)),
+                    Permission.update(Role.user(user_id)),
+                    Permission.delete(Role.user(user_id))
+                ]
+            )
         logger.info(f"Stored message {message_result['$id']} for user {user_id}")
 
         # Store sources if they exist and user is not anonymous
         stored_source_ids = []
         if sources:
-            logger.debug(f"Storing {len(sources)} sources for message {message_result['$id']}")
+            logger.debug("Storing %d sources for message %s", len(sources), message_result['$id'])
             try:
                 for source in sources:
                     book_id = extract_book_id(source.get("document_id", ""))
@@ -102,16 +106,18 @@ def store_message(
                         }, ensure_ascii=False) # <-- ADD ensure_ascii=False HERE
                     }
 
-                    source_doc = db.create_document(
-                        database_id=settings.APPWRITE_DATABASE_ID,
-                        collection_id=settings.APPWRITE_MESSAGE_SOURCES_COLLECTION_ID,
-                        document_id="unique()",
-                        data=source_data,
-                        permissions=[
-                            Permission.read(Role.user(user_id)),
-                            # Sources are usually read-only once created with the message
-                        ]
-                    )
+                    with timed("appwrite_write"), span("appwrite.create_document", kind=CLIENT,
+                                                       collection="message_sources"):
+                        source_doc = db.create_document(
+                            database_id=settings.APPWRITE_DATABASE_ID,
+                            collection_id=settings.APPWRITE_MESSAGE_SOURCES_COLLECTION_ID,
+                            document_id="unique()",
+                            data=source_data,
+                            permissions=[
+                                Permission.read(Role.user(user_id)),
+                                # Sources are usually read-only once created with the message
+                            ]
+                        )
                     stored_source_ids.append(source_doc['$id'])
                 logger.info(f"Stored {len(stored_source_ids)} sources for message {message_result['$id']}")
             except Exception as source_error:
@@ -153,17 +159,18 @@ def create_new_conversation(db: Databases, user_id: str, is_anonymous: bool) ->
             "is_anonymous": is_anonymous
         }
 
-        result = db.create_document(
-            database_id=settings.APPWRITE_DATABASE_ID,
-            collection_id=settings.APPWRITE_CONVERSATIONS_COLLECTION_ID,
-            document_id=conversation_id,
-            data=document_data,
-            permissions=[
-                Permission.read(Role.user(user_id)),
-                Permission.update(Role.user(user_id)),
-                Permission.delete(Role.user(user_id)),
-            ] if not is_anonymous else []
-        )
+        with timed("appwrite_write"), span("appwrite.create_document", kind=CLIENT, collection="conversations"):
+            result = db.create_document(
+                database_id=settings.APPWRITE_DATABASE_ID,
+                collection_id=settings.APPWRITE_CONVERSATIONS_COLLECTION_ID,
+                document_id=conversation_id,
+                data=document_data,
+                permissions=[
+                    Permission.read(Role.user(user_id)),
+                    Permission.update(Role.user(user_id)),
+                    Permission.delete(Role.user(user_id)),
+                ] if not is_anonymous else []
+            )
         logger.info(f"Successfully created conversation {result['$id']}")
         return {"conversation_id": result['$id'], "message": "Conversation created successfully"}
 
@@ -196,14 +203,17 @@ def get_user_conversations(
         logger.info(f"Fetching conversations for user: {user_id}")
 
         # Query Appwrite for conversations belonging to the user
-        result = db.list_documents(
-            database_id=settings.APPWRITE_DATABASE_ID,
-            collection_id=settings.APPWRITE_CONVERSATIONS_COLLECTION_ID,
-            queries=[
-                Query.equal("user_id", user_id),
-                Query.order_desc("last_updated") # Order by most recently updated
-            ]
-        )
+        with timed("appwrite_read"), span("appwrite.list_documents", kind=CLIENT,
+                                          collection="conversations") as list_span:
+            result = db.list_documents(
+                database_id=settings.APPWRITE_DATABASE_ID,
+                collection_id=settings.APPWRITE_CONVERSATIONS_COLLECTION_ID,
+                queries=[
+                    Query.equal("user_id", user_id),
+                    Query.order_desc("last_updated") # Order by most recently updated
+                ]
+            )
+            list_span.set_attribute("result_count", result.get('total', 0))
 
         total_found = result.get('total', 0)
         logger.info(f"Found {total_found} conversations for user: {user_id}")
@@ -227,17 +237,18 @@ def get_user_conversations(
 def update_conversation_timestamp(db: Databases, conversation_id: str):
     """Updates the last_updated timestamp of a conversation."""
     if conversation_id.startswith("anon_conv_"):
-        logger.debug(f"Skipping timestamp update for anonymous conversation {conversation_id}")
+        logger.debug("Skipping timestamp update for anonymous conversation %s", conversation_id)
         return # No need to update for anonymous
 
     try:
-        logger.debug(f"Updating timestamp for conversation {conversation_id}")
-        db.update_document(
-            database_id=settings.APPWRITE_DATABASE_ID,
-            collection_id=settings.APPWRITE_CONVERSATIONS_COLLECTION_ID,
-            document_id=conversation_id,
-            data={"last_updated": datetime.now().isoformat()}
-        )
+        logger.debug("Updating timestamp for conversation %s", conversation_id)
+        with timed("appwrite_write"), span("appwrite.update_document", kind=CLIENT, collection="conversations"):
+            db.update_document(
+                database_id=settings.APPWRITE_DATABASE_ID,
+                collection_id=settings.APPWRITE_CONVERSATIONS_COLLECTION_ID,
+                document_id=conversation_id,
+                data={"last_updated": datetime.now().isoformat()}
+            )
         logger.info(f"Timestamp updated for conversation {conversation_id}")
     except Exception as e:
         # Log error but don't let it block the chat flow
@@ -0,0 +1,115 @@
+# app/core/timing.py
+"""
+Request-scoped latency breakdown.
+
+The HTTP middleware in app.main opens a RequestTimings collector for each
+request (when settings.SERVER_TIMING_ENABLED) and stores it in a context
+variable, which asyncio tasks and asyncio.to_thread workers inherit. Core code
+reports into it with ``timed("name")`` or ``record("name", ms)``; repeated
+names are summed. The result is sent as a standard ``Server-Timing`` header
+and, for SSE responses, as a final ``timing`` event.
+
+Every reported duration is also observed in the stage_duration_seconds
+histogram of app.core.metrics when METRICS_ENABLED. With both disabled,
+timed() and record() cost one context variable and one settings lookup.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.core.metrics import STAGE_DURATION
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+# Server-Timing metric names are HTTP tokens; stage descriptions go in desc
+DESCRIPTIONS = {
+    "auth": "Token validation (Appwrite)",
+    "history": "Conversation history",
+    "store_query": "User message storage (Appwrite)",
+    "embed": "Query embedding",
+    "vector_search": "Vector search",
+    "retrieve": "Retrieval stage",
+    "rerank": "Reranking",
+    "pack": "Context packing",
+    "generate": "Generation stage",
+    "persist": "Answer storage (Appwrite)",
+    "llm": "LLM call",
+    "llm_first_token": "LLM time to first token",
+    "appwrite_read": "Appwrite reads",
+    "appwrite_write": "Appwrite writes",
+    "total": "Total",
+}
+
+
+class RequestTimings:
+    """Durations reported during one request, summed per name in first-seen order."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._durations: Dict[str, float] = {}
+
+    def add(self, name: str, duration_ms: float) -> None:
+        self._durations[name] = self._durations.get(name, 0.0) + duration_ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        """Milliseconds per name, rounded, including the elapsed total."""
+        durations = {name: round(ms, 2) for name, ms in self._durations.items()}
+        durations["total"] = round(self.elapsed_ms(), 2)
+        return durations
+
+    def header_value(self) -> str:
+        """Server-Timing header value, e.g. 'embed;dur=41.2;desc="Query embedding", total;dur=512.0'."""
+        entries: List[str] = []
+        for name, duration_ms in self.as_dict().items():
+            entry = f"{name};dur={duration_ms:.1f}"
+            if name in DESCRIPTIONS:
+                entry += f';desc="{DESCRIPTIONS[name]}"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+
+def start_request() -> Tuple[Optional[RequestTimings], Optional[Token]]:
+    """Open a collector for the current request if enabled; pass the token to end_request()."""
+    if not settings.SERVER_TIMING_ENABLED:
+        return None, None
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token: Optional[Token]) -> None:
+    if token is not None:
+        _current.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """The collector of the request being handled, or None when timing is off."""
+    return _current.get()
+
+
+def record(name: str, duration_ms: float) -> None:
+    """Add a measured duration to the current request (if timed) and to the stage metrics."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, duration_ms)
+    if settings.METRICS_ENABLED:
+        STAGE_DURATION.observe(duration_ms / 1000, stage=name)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time the enclosed block into the current request and the stage metrics (also around awaits)."""
+    timings = _current.get()
+    if timings is None and not settings.METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
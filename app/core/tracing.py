@@ -0,0 +1,432 @@
+# app/core/tracing.py
+"""
+Trace spans around requests, pipeline stages and external calls.
+
+A small, dependency-free tracer in the OpenTelemetry data model: a span has a
+128-bit trace id, a 64-bit span id, its parent's id, a kind, attributes and a
+status. The current span lives in a context variable, so children opened in
+asyncio tasks, asyncio.to_thread workers and streaming generators attach to
+it; thread pools need ``propagate(fn)`` around the submitted callable.
+
+Finished spans are queued and written by a background thread to
+
+- a JSON-lines file (TRACE_JSONL_PATH), one span per line, for offline
+  tail-latency analysis without a tracing backend, and/or
+- an OTLP/HTTP JSON collector (TRACE_OTLP_ENDPOINT, e.g.
+  http://localhost:4318/v1/traces).
+
+Nothing is recorded until configure_tracing() runs with TRACING_ENABLED (the
+app does so at startup, ingestion scripts in main()); until then span() yields
+a shared no-op span. Root spans are sampled at TRACE_SAMPLE_RATE, and an
+incoming W3C ``traceparent`` header continues the caller's trace.
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+INTERNAL, SERVER, CLIENT = "internal", "server", "client"
+OTLP_KINDS = {INTERNAL: 1, SERVER: 2, CLIENT: 3}
+OTLP_STATUS = {"unset": 0, "ok": 1, "error": 2}
+MAX_QUEUED_SPANS = 10000  # Spans beyond this are dropped rather than slowing requests
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL_SECONDS = 2.0
+
+
+class Span:
+    """One timed operation. Use span() rather than creating these directly."""
+
+    recording = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64) or 1:016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {key: value for key, value in (attributes or {}).items()
+                                           if value is not None}
+        self.status = "unset"
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self._start_perf_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_status(self, status: str, message: str = "") -> None:
+        """Set "ok" or "error" (with a description)."""
+        self.status = status
+        self.status_message = message
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = self.start_ns + time.perf_counter_ns() - self._start_perf_ns
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or self.start_ns) - self.start_ns) / 1e6
+
+    def traceparent(self) -> str:
+        """W3C traceparent header value for outgoing calls."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-lines record of the span."""
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        if self.status_message:
+            record["status_message"] = self.status_message
+        return record
+
+
+class _NoopSpan:
+    """Stands in for spans that are not recorded (tracing off or trace not sampled)."""
+
+    recording = False
+    trace_id = span_id = parent_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def set_status(self, status: str, message: str = "") -> None:
+        pass
+
+    def traceparent(self) -> Optional[str]:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+# --- Exporters ---
+
+class JsonLinesExporter:
+    """Appends spans to a file, one JSON object per line."""
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: Sequence[Span]) -> None:
+        lines = []
+        for finished in spans:
+            record = finished.to_dict()
+            record["service"] = self.service_name
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # int64 is a string in OTLP JSON
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class OtlpJsonExporter:
+    """Posts spans to an OTLP/HTTP collector in the OTLP JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def payload(self, spans: Sequence[Span]) -> Dict[str, Any]:
+        otlp_spans = []
+        for finished in spans:
+            otlp_span = {
+                "traceId": finished.trace_id,
+                "spanId": finished.span_id,
+                "name": finished.name,
+                "kind": OTLP_KINDS.get(finished.kind, 1),
+                "startTimeUnixNano": str(finished.start_ns),
+                "endTimeUnixNano": str(finished.end_ns or finished.start_ns),
+                "attributes": _otlp_attributes(finished.attributes),
+                "status": {"code": OTLP_STATUS.get(finished.status, 0)},
+            }
+            if finished.parent_id:
+                otlp_span["parentSpanId"] = finished.parent_id
+            if finished.status_message:
+                otlp_span["status"]["message"] = finished.status_message
+            otlp_spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": otlp_spans}],
+        }]}
+
+    def export(self, spans: Sequence[Span]) -> None:
+        response = self._session.post(self.endpoint, json=self.payload(spans), timeout=self.timeout)
+        if response.status_code >= 400:
+            raise RuntimeError(f"OTLP collector returned {response.status_code}: {response.text[:200]}")
+
+    def shutdown(self) -> None:
+        self._session.close()
+
+
+# --- Tracer ---
+
+class Tracer:
+    """Samples root spans and hands finished spans to a background export thread."""
+
+    def __init__(self, exporters: Sequence[Any], sample_rate: float = 1.0,
+                 max_queued: int = MAX_QUEUED_SPANS, export_interval: float = EXPORT_INTERVAL_SECONDS):
+        self.exporters = list(exporters)
+        self.sample_rate = sample_rate
+        self.export_interval = export_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def on_end(self, finished: Span) -> None:
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export(self, batch: List[Span]) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                logger.warning(f"Exporting {len(batch)} spans with {type(exporter).__name__} failed: {e}")
+
+    def _export_loop(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.export_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                item = False  # Interval elapsed
+            if item is None:  # Shutdown
+                break
+            if item:
+                batch.append(item)
+            if batch and (item is False or len(batch) >= EXPORT_BATCH_SIZE):
+                self._export(batch)
+                batch = []
+            if item is False:
+                deadline = time.monotonic() + self.export_interval
+        while True:  # Drain what was queued before shutdown
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item:
+                batch.append(item)
+        if batch:
+            self._export(batch)
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Export everything still queued and stop the export thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        for exporter in self.exporters:
+            exporter.shutdown()
+        if self.dropped:
+            logger.warning(f"Dropped {self.dropped} spans because the export queue was full")
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def configure_tracing(enabled: Optional[bool] = None,
+                      jsonl_path: Optional[str] = None,
+                      otlp_endpoint: Optional[str] = None,
+                      service_name: Optional[str] = None,
+                      sample_rate: Optional[float] = None) -> Optional[Tracer]:
+    """
+    Start recording spans. Arguments override the TRACE_* settings.
+
+    Returns:
+        The active tracer, or None when tracing is disabled or has no exporter
+    """
+    global _tracer
+    enabled = settings.TRACING_ENABLED if enabled is None else enabled
+    if not enabled:
+        return None
+    service_name = service_name or settings.TRACE_SERVICE_NAME
+    jsonl_path = settings.TRACE_JSONL_PATH if jsonl_path is None else jsonl_path
+    otlp_endpoint = settings.TRACE_OTLP_ENDPOINT if otlp_endpoint is None else otlp_endpoint
+    with _tracer_lock:
+        if _tracer is not None:
+            return _tracer
+        exporters: List[Any] = []
+        if jsonl_path:
+            exporters.append(JsonLinesExporter(jsonl_path, service_name))
+        if otlp_endpoint:
+            exporters.append(OtlpJsonExporter(otlp_endpoint, service_name))
+        if not exporters:
+            logger.warning("Tracing enabled but neither TRACE_JSONL_PATH nor TRACE_OTLP_ENDPOINT is set")
+            return None
+        _tracer = Tracer(exporters, settings.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate)
+        logger.info(f"Tracing enabled for {service_name}: "
+                    f"{', '.join(type(exporter).__name__ for exporter in exporters)}")
+        return _tracer
+
+
+def shutdown_tracing() -> None:
+    """Flush queued spans and stop recording."""
+    global _tracer
+    with _tracer_lock:
+        tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.shutdown()
+
+
+# --- Instrumentation API ---
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header, or None if absent/invalid."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        if int(parts[1], 16) == 0 or int(parts[2], 16) == 0:
+            return None
+        sampled = bool(int(parts[3][:2], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1].lower(), parts[2].lower(), sampled
+
+
+def current_span() -> Any:
+    """The innermost open span, or the no-op span."""
+    return _current.get() or NOOP_SPAN
+
+
+@contextmanager
+def span(name: str, kind: str = INTERNAL, remote_parent: Optional[Tuple[str, str, bool]] = None,
+         **attributes: Any) -> Iterator[Any]:
+    """
+    Record the enclosed block as a child of the current span (also around awaits).
+
+    An exception escaping the block marks the span as an error and is re-raised.
+
+    Args:
+        name: Operation name, e.g. "pinecone.query"
+        kind: INTERNAL, SERVER (incoming request) or CLIENT (outgoing call)
+        remote_parent: parse_traceparent() result for a caller's trace (root spans only)
+        **attributes: Initial attributes; None values are skipped
+    """
+    tracer = _tracer
+    parent = _current.get()
+    if tracer is None or parent is NOOP_SPAN:
+        yield NOOP_SPAN
+        return
+    if parent is not None:
+        new_span = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    elif remote_parent is not None:
+        if not remote_parent[2]:
+            token = _current.set(NOOP_SPAN)  # The caller did not sample this trace
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current.reset(token)
+            return
+        new_span = Span(name, remote_parent[0], remote_parent[1], kind, attributes)
+    elif tracer.sampled():
+        new_span = Span(name, f"{random.getrandbits(128) or 1:032x}", None, kind, attributes)
+    else:
+        token = _current.set(NOOP_SPAN)  # Children of an unsampled root are not recorded either
+        try:
+            yield NOOP_SPAN
+        finally:
+            _current.reset(token)
+        return
+
+    token = _current.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.set_status("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        new_span.end()
+        try:
+            _current.reset(token)
+        except ValueError:  # Closed in another context (e.g. a generator finalised elsewhere)
+            _current.set(parent)
+        tracer.on_end(new_span)
+
+
+def traced(name: str, kind: str = INTERNAL) -> Callable[[Callable], Callable]:
+    """Decorator recording each call of a (sync) function as a span; add attributes with current_span()."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Bind fn to a copy of the current context, so spans (and request timings)
+    opened where it runs, e.g. in a ThreadPoolExecutor, attach to the caller's.
+    Wrap once per submit: a context copy cannot run in two threads at once.
+    """
+    context = copy_context()
+    return functools.partial(context.run, fn)
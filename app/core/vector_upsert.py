@@ -0,0 +1,323 @@
+# app/core/vector_upsert.py
+"""
+Concurrent, byte-size-aware Pinecone upsert engine.
+
+Shared by the ingestion endpoint and the bulk upload scripts. It:
+1. Packs vectors into batches by serialized request size (not a fixed count)
+2. Trims metadata "text" so each vector stays under Pinecone's metadata limit,
+   or with PINECONE_SLIM_METADATA writes it to the chunk-text store and drops
+   it from the vector before the batch is sent (see chunk_text_store)
+3. Sends several batches concurrently with retry and exponential backoff
+4. Records every successful batch in a SQLite manifest so a re-run skips
+   vectors that are already uploaded with the same content; a chunk whose
+   content changed under the same id is upserted again
+5. Reports throughput in vectors/sec
+"""
+
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config.settings import settings
+from app.core.chunk_text_store import ChunkTextStore, get_chunk_text_store, slim_metadata as slim_metadata_fields
+from app.core.tracing import CLIENT, propagate, span
+
+logger = logging.getLogger(__name__)
+
+PINECONE_MAX_METADATA_BYTES = 40 * 1024
+PINECONE_MAX_BATCH_VECTORS = 1000
+BYTES_PER_JSON_FLOAT = 20  # Upper bound for a float32 rendered in a JSON request
+VECTOR_OVERHEAD_BYTES = 64
+PROGRESS_LOG_INTERVAL_SECONDS = 10.0
+MANIFEST_QUERY_CHUNK = 500
+
+
+def fit_metadata(metadata: Dict[str, Any], max_bytes: int = PINECONE_MAX_METADATA_BYTES) -> Dict[str, Any]:
+    """
+    Trim the "text" field so the serialized metadata fits within max_bytes.
+
+    Text is cut on a UTF-8 character boundary, so Arabic text is never split
+    mid-character.
+
+    Returns:
+        The original dict if it fits, otherwise a trimmed copy
+    """
+    size = len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+    text = metadata.get("text")
+    if size <= max_bytes or not isinstance(text, str):
+        return metadata
+    text_bytes = text.encode("utf-8")
+    allowed = max(len(text_bytes) - (size - max_bytes) - 16, 0)  # Slack for JSON escaping
+    return {**metadata, "text": text_bytes[:allowed].decode("utf-8", "ignore")}
+
+
+def estimate_vector_bytes(vector: Dict[str, Any]) -> int:
+    """Approximate serialized size of one vector record in an upsert request."""
+    metadata = vector.get("metadata")
+    metadata_bytes = len(json.dumps(metadata, ensure_ascii=False).encode("utf-8")) if metadata else 0
+    return (len(vector["values"]) * BYTES_PER_JSON_FLOAT + len(str(vector["id"]).encode("utf-8"))
+            + metadata_bytes + VECTOR_OVERHEAD_BYTES)
+
+
+def record_hash(record: Dict[str, Any]) -> Optional[str]:
+    """
+    Content version of a chunk or vector record, as stored in the manifest.
+
+    Uses metadata["content_hash"] when present (set by the embedding job and
+    the ingestion pipeline), otherwise a digest of the vector values.
+
+    Returns:
+        The hash, or None for a chunk that has neither (never treated as done)
+    """
+    content_hash = (record.get("metadata") or {}).get("content_hash")
+    if content_hash:
+        return str(content_hash)
+    if "values" in record:
+        return hashlib.sha256(json.dumps(record["values"]).encode("utf-8")).hexdigest()
+    return None
+
+
+class UpsertManifest:
+    """SQLite record of the (id, content hash) pairs that were upserted successfully."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS upserted "
+            "(id TEXT PRIMARY KEY, batch INTEGER, upserted_at REAL, content_hash TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(upserted)")}
+        if "content_hash" not in columns:
+            # Manifests written before hashes were recorded: their ids are upserted again once
+            self._conn.execute("ALTER TABLE upserted ADD COLUMN content_hash TEXT")
+        self._conn.commit()
+
+    def completed(self, records: List[Tuple[str, Optional[str]]]) -> Set[str]:
+        """Return the ids of (id, hash) pairs that were already upserted with that same hash."""
+        wanted = {vector_id: content_hash for vector_id, content_hash in records if content_hash is not None}
+        ids = list(wanted)
+        found: Set[str] = set()
+        with self._lock:
+            for start in range(0, len(ids), MANIFEST_QUERY_CHUNK):
+                chunk = ids[start:start + MANIFEST_QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, content_hash FROM upserted WHERE id IN ({placeholders})", chunk)
+                found.update(vector_id for vector_id, content_hash in rows if content_hash == wanted[vector_id])
+        return found
+
+    def record(self, records: List[Tuple[str, Optional[str]]], batch_number: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO upserted (id, batch, upserted_at, content_hash) VALUES (?, ?, ?, ?)",
+                [(vector_id, batch_number, now, content_hash) for vector_id, content_hash in records],
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class VectorUpserter:
+    """Upserts a stream of vectors into a Pinecone index in concurrent, size-bounded batches."""
+
+    def __init__(self,
+                 index,
+                 namespace: Optional[str] = None,
+                 concurrency: Optional[int] = None,
+                 max_request_bytes: Optional[int] = None,
+                 max_batch_vectors: int = PINECONE_MAX_BATCH_VECTORS,
+                 max_retries: int = 5,
+                 base_delay: float = 1.0,
+                 manifest_path: Optional[str] = None,
+                 slim_metadata: Optional[bool] = None,
+                 text_store: Optional[ChunkTextStore] = None):
+        """
+        Args:
+            index: Pinecone index client
+            namespace: Optional Pinecone namespace
+            concurrency: Batches in flight at once (defaults to settings.UPSERT_CONCURRENCY)
+            max_request_bytes: Request size cap (defaults to settings.UPSERT_MAX_REQUEST_BYTES)
+            max_batch_vectors: Vector count cap per request
+            max_retries: Attempts per batch before it is counted as failed
+            base_delay: Base delay for exponential backoff in seconds
+            manifest_path: SQLite file recording completed (id, content hash) pairs; enables skip-on-rerun
+            slim_metadata: Upsert only small filterable metadata fields, without chunk text
+                (defaults to settings.PINECONE_SLIM_METADATA)
+            text_store: Where slimmed chunk text is written (defaults to the configured
+                chunk-text store, created if missing)
+        """
+        self.index = index
+        self.namespace = namespace
+        self.concurrency = concurrency or settings.UPSERT_CONCURRENCY
+        self.max_request_bytes = max_request_bytes or settings.UPSERT_MAX_REQUEST_BYTES
+        self.max_batch_vectors = max_batch_vectors
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.manifest = UpsertManifest(manifest_path) if manifest_path else None
+        self.slim_metadata = settings.PINECONE_SLIM_METADATA if slim_metadata is None else slim_metadata
+        self.text_store = text_store
+
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+        self._batch_counter = 0
+        self._last_progress_log = 0.0
+        self.stats = {"upserted": 0, "skipped": 0, "failed": 0, "batches": 0, "trimmed": 0}
+
+    def _store_texts(self, texts: List[Dict[str, Any]]) -> None:
+        """Write the text of slimmed vectors to the chunk-text store (raises if it cannot be written)."""
+        if not texts:
+            return
+        if self.text_store is None:
+            self.text_store = get_chunk_text_store(create=True)
+        self.text_store.write(texts)
+
+    def iter_batches(self, vectors: Iterable[Dict[str, Any]]) -> Iterable[List[Dict[str, Any]]]:
+        """
+        Pack vectors into batches bounded by request bytes and vector count.
+
+        With slim metadata, each batch's chunk texts are written to the
+        chunk-text store before the batch is yielded, so no vector reaches
+        Pinecone without its text being retrievable.
+        """
+        batch: List[Dict[str, Any]] = []
+        texts: List[Dict[str, Any]] = []
+        batch_bytes = 0
+        for vector in vectors:
+            metadata = vector.get("metadata")
+            text = None
+            if metadata and self.slim_metadata:
+                text = metadata.get("text") if isinstance(metadata.get("text"), str) else None
+                metadata = slim_metadata_fields(metadata)
+                vector = {**vector, "metadata": metadata}
+            if metadata:
+                fitted = fit_metadata(metadata)
+                if fitted is not metadata:
+                    self.stats["trimmed"] += 1
+                    vector = {**vector, "metadata": fitted}
+            size = estimate_vector_bytes(vector)
+            if batch and (batch_bytes + size > self.max_request_bytes or len(batch) >= self.max_batch_vectors):
+                self._store_texts(texts)
+                yield batch
+                batch, texts, batch_bytes = [], [], 0
+            batch.append(vector)
+            batch_bytes += size
+            if text is not None:
+                texts.append({"id": vector["id"], "text": text})
+        if batch:
+            self._store_texts(texts)
+            yield batch
+
+    def send_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        Upsert one batch synchronously with retry and exponential backoff.
+
+        Records the batch in the manifest and the stats. Safe to call from
+        several threads at once.
+
+        Returns:
+            True if the batch was upserted, False once retries are exhausted
+        """
+        with self._lock:
+            self._batch_counter += 1
+            batch_number = self._batch_counter
+        records = [(str(vector["id"]), record_hash(vector)) for vector in batch] if self.manifest else []
+        with span("pinecone.upsert", kind=CLIENT, batch=batch_number, vectors=len(batch),
+                  namespace=self.namespace or None) as upsert_span:
+            for attempt in range(self.max_retries):
+                upsert_span.set_attribute("attempts", attempt + 1)
+                try:
+                    if self.namespace:
+                        self.index.upsert(vectors=batch, namespace=self.namespace)
+                    else:
+                        self.index.upsert(vectors=batch)
+                    if self.manifest:
+                        self.manifest.record(records, batch_number)
+                    with self._lock:
+                        self.stats["upserted"] += len(batch)
+                        self.stats["batches"] += 1
+                    return True
+                except Exception as e:
+                    if attempt == self.max_retries - 1:
+                        logger.error(f"Upsert batch {batch_number} ({len(batch)} vectors) failed "
+                                     f"after {self.max_retries} attempts: {e}")
+                        break
+                    delay = self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay)
+                    logger.warning(f"Upsert batch {batch_number} failed ({e}); retrying in {delay:.1f} seconds")
+                    time.sleep(delay)
+            upsert_span.set_status("error", f"Gave up after {self.max_retries} attempts")
+        with self._lock:
+            self.stats["failed"] += len(batch)
+        return False
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            self.send_batch(batch)
+        finally:
+            self._in_flight.release()
+
+    def pending_vectors(self, vectors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Drop vectors (or chunks) the manifest records as already upserted with the same content.
+
+        A record whose id was upserted with a different content hash stays
+        pending, so re-embedded chunks replace their stale vectors.
+        """
+        if not self.manifest or not vectors:
+            return vectors
+        done = self.manifest.completed([(str(vector["id"]), record_hash(vector)) for vector in vectors])
+        if not done:
+            return vectors
+        with self._lock:
+            self.stats["skipped"] += len(done)
+        return [vector for vector in vectors if str(vector["id"]) not in done]
+
+    def _log_progress(self, start_time: float, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_progress_log < PROGRESS_LOG_INTERVAL_SECONDS:
+            return
+        self._last_progress_log = now
+        elapsed = max(now - start_time, 1e-6)
+        logger.info(f"Upserted {self.stats['upserted']} vectors "
+                    f"({self.stats['upserted'] / elapsed:.1f} vectors/sec, "
+                    f"{self.stats['skipped']} skipped, {self.stats['failed']} failed)")
+
+    def upsert(self, vectors: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Upsert every vector, skipping those the manifest records with the same content.
+
+        The input is consumed lazily and at most 2 x concurrency batches are
+        held in memory, so arbitrarily large streams are fine.
+
+        Args:
+            vectors: Vector records with "id", "values" and optional "metadata"
+
+        Returns:
+            Stats with upserted, skipped, failed, batches, trimmed, elapsed_seconds
+            and vectors_per_second
+        """
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="upsert") as executor:
+            for batch in self.iter_batches(vectors):
+                batch = self.pending_vectors(batch)
+                if not batch:
+                    continue
+                self._in_flight.acquire()
+                executor.submit(propagate(self._send), batch)
+                self._log_progress(start_time)
+
+        elapsed = time.monotonic() - start_time
+        self._log_progress(start_time, force=True)
+        self.stats["elapsed_seconds"] = round(elapsed, 3)
+        self.stats["vectors_per_second"] = round(self.stats["upserted"] / max(elapsed, 1e-6), 1)
+        return self.stats
@@ -12,16 +12,28 @@ The modular organization helps with scaling as the app grows,
 since each part (endpoints, core logic, etc.) is separated.
 """
 
+import asyncio
 import logging
+from contextlib import ExitStack
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import time
 import traceback
+from typing import AsyncIterator
 
 from app.config.settings import settings
-from app.api.endpoints import embed, retrieval, ingestion, rag_query, auth, chat
+from app.api.endpoints import embed, retrieval, ingestion, rag_query, auth, chat, debug
 from app.utils.helpers import setup_logging
+from app.core.jobs import get_job_manager
+from app.core.page_store import get_page_store
+from app.core.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, HTTP_REQUESTS,
+    render_metrics, start_metrics, stop_metrics
+)
+from app.core.profiling import start_loop_monitor, stop_loop_monitor
+from app.core.timing import end_request, start_request
+from app.core.tracing import SERVER, configure_tracing, parse_traceparent, shutdown_tracing, span
 import os
 # Set up logging
 setup_logging()
@@ -52,6 +64,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def _end_span_after_body(body: AsyncIterator[bytes], span_scope: ExitStack) -> AsyncIterator[bytes]:
+    """Keep the request span open until the body is sent (or fails), then end it."""
+    with span_scope:
+        async for chunk in body:
+            yield chunk
+
+
 # Add middleware for request timing
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
@@ -59,21 +78,56 @@ async def add_process_time_header(request: Request, call_next):
     Middleware that times how long each request takes to process and
     adds it as a header in the response. This is useful for monitoring
     performance and debugging slow endpoints.
+
+    With SERVER_TIMING_ENABLED it also opens the request's timing collector
+    (app.core.timing) and sends its per-stage breakdown as a Server-Timing
+    header. Streaming responses send their headers before the body runs, so
+    their breakdown arrives as a final SSE "timing" event instead.
+
+    Request counts, latency (by route template) and in-flight requests are
+    recorded for GET /metrics. With tracing enabled the request is the root
+    "http.request" span (continuing an incoming traceparent) and its trace id
+    is returned in X-Trace-Id. call_next returns before a streaming body runs,
+    so the span is handed to the body and ends when the body has been sent.
     """
     start_time = time.time()
-    try:
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
-    except Exception as e:
-        # Log the full exception with traceback
-        logger.error(f"Request failed: {e}\n{traceback.format_exc()}")
-        # Return a JSON error response
-        return JSONResponse(
-            status_code=500,
-            content={"detail": "Internal server error"},
-        )
+    timings, timing_token = start_request()
+    status_code = 500
+    HTTP_IN_FLIGHT.inc()
+    with ExitStack() as span_scope:
+        request_span = span_scope.enter_context(span(
+            "http.request", kind=SERVER, remote_parent=parse_traceparent(request.headers.get("traceparent")),
+            **{"http.method": request.method, "http.target": request.url.path}))
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            if status_code >= 500:
+                request_span.set_status("error", f"HTTP {status_code}")
+            process_time = time.time() - start_time
+            response.headers["X-Process-Time"] = str(process_time)
+            if timings is not None:
+                response.headers["Server-Timing"] = timings.header_value()
+            if request_span.recording:
+                response.headers["X-Trace-Id"] = request_span.trace_id
+                response.body_iterator = _end_span_after_body(response.body_iterator, span_scope.pop_all())
+            return response
+        except Exception as e:
+            # Log the full exception with traceback
+            logger.error(f"Request failed: {e}\n{traceback.format_exc()}")
+            request_span.set_status("error", str(e))
+            # Return a JSON error response
+            return JSONResponse(
+                status_code=500,
+                content={"detail": "Internal server error"},
+            )
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = request.scope.get("route")
+            route_path = getattr(route, "path", "unmatched")  # Templates keep label cardinality bounded
+            HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+            HTTP_REQUEST_DURATION.observe(time.time() - start_time, method=request.method, route=route_path)
+            request_span.set_attributes(**{"http.route": route_path, "http.status_code": status_code})
+            end_request(timing_token)
 
 # Include routers from endpoints
 app.include_router(embed.router, prefix="/embed", tags=["embeddings"])
@@ -82,6 +136,7 @@ app.include_router(ingestion.router, prefix="/ingestion", tags=["ingestion"])
 app.include_router(rag_query.router, prefix="/rag", tags=["rag"])
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
+app.include_router(debug.router, prefix="/debug", tags=["debug"])
 
 # Include other routers as needed
 
@@ -93,7 +148,11 @@ async def startup_event():
     Initialize connections to external services, load models, etc.
     """
     logger.info("Application startup: initializing services and connections")
-    # You can add initialization code here if needed
+    get_job_manager().start()
+    get_page_store()  # Memory-map the page store (if built) before the first request
+    start_metrics()
+    configure_tracing()
+    start_loop_monitor()
     
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -102,7 +161,10 @@ async def shutdown_event():
     Close connections, free resources, etc.
     """
     logger.info("Application shutdown: cleaning up resources")
-    # You can add cleanup code here if needed
+    await asyncio.to_thread(get_job_manager().stop)  # Waits for running job items; keep the loop free
+    stop_metrics()
+    shutdown_tracing()
+    stop_loop_monitor()
 
 # Health check endpoint
 @app.get("/health", tags=["health"])
@@ -110,6 +172,13 @@ async def health_check():
     """Simple health check endpoint to verify the API is running"""
     return {"status": "healthy"}
 
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    """Prometheus metrics of this worker (and of the other workers with METRICS_MULTIPROC_DIR)"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
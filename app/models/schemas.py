@@ -34,12 +34,32 @@ class DocumentMetadata(BaseModel):
     section_title: Optional[str] = Field(None, description="Title of the section within the book")
     text: str = Field(..., description="The actual text content of the document chunk")
     book_id: Optional[str] = Field(None, description="Unique identifier for the book (e.g., for URL generation)")
+    chunk_index: Optional[int] = Field(None, description="Position of the chunk within its section or document, if known")
+    page_row_start: Optional[int] = Field(None, description="First page row of a chunk made of whole pages (page store)")
+    page_row_end: Optional[int] = Field(None, description="Last page row of a chunk made of whole pages (page store)")
 
 class DocumentMatch(BaseModel):
     """Represents a single document match from the retriever."""
     id: str = Field(..., description="Unique identifier for the document chunk (e.g., section_id)")
     score: float = Field(..., description="Relevance score from the retrieval system")
     metadata: DocumentMetadata = Field(..., description="Structured metadata for the document")
+    merged_ids: Optional[List[str]] = Field(None, description="IDs of all chunks merged into this passage, in reading order")
+
+class RetrievalFilter(BaseModel):
+    """
+    Metadata filter applied inside the retrieval backend, before top_k is taken.
+    Values within a field are OR-ed; different fields are AND-ed. Book ids also
+    match chunks kept for a duplicate cluster that includes a copy from those books.
+    """
+    book_ids: Optional[List[int]] = Field(None, description="Only return chunks from these books", max_length=100)
+    author_names: Optional[List[str]] = Field(None, description="Only return chunks by these authors", max_length=100)
+    category_names: Optional[List[str]] = Field(None, description="Only return chunks in these categories",
+                                                max_length=100)
+
+    def conditions(self) -> Dict[str, List[Any]]:
+        """Map each constrained metadata field to its allowed values, skipping empty fields."""
+        fields = {"book_id": self.book_ids, "author_name": self.author_names, "category_name": self.category_names}
+        return {field: list(values) for field, values in fields.items() if values}
 
 class RetrievalRequest(BaseModel):
     """Request model for the /retrieval endpoint."""
@@ -47,6 +67,13 @@ class RetrievalRequest(BaseModel):
                       description="Query text to search for",
                       min_length=1)
     top_k: int = Field(5, description="Number of documents to retrieve", ge=1, le=50)
+    filter: Optional[RetrievalFilter] = Field(None, description="Restrict results to books, authors or categories")
+
+class BatchRetrievalRequest(BaseModel):
+    """Request model for the /retrieval/batch endpoint."""
+    queries: List[str] = Field(..., description="Query texts, answered in this order", min_length=1, max_length=500)
+    top_k: int = Field(5, description="Number of documents to retrieve per query", ge=1, le=50)
+    filter: Optional[RetrievalFilter] = Field(None, description="Restrict every query to books, authors or categories")
 
 class RetrievalResponse(BaseModel):
     """Response model for the /retrieval endpoint."""
@@ -74,6 +101,19 @@ class IngestionResponse(BaseModel):
     message: str = Field(..., description="Details about the ingestion process")
     processed_chunks: Optional[int] = Field(None, description="Number of chunks processed")
 
+class IngestionJobStatus(BaseModel):
+    """Status of a background ingestion job."""
+    job_id: str = Field(..., description="Unique ID of the ingestion job")
+    status: str = Field(..., description="queued, running, completed, failed or cancelled")
+    created_at: float = Field(..., description="Creation time (Unix seconds)")
+    updated_at: float = Field(..., description="Last update time (Unix seconds)")
+    total_documents: int = Field(..., description="Documents in the job")
+    processed_documents: int = Field(0, description="Documents ingested successfully")
+    failed_documents: int = Field(0, description="Documents that failed; retry the job to re-run them")
+    chunks: int = Field(0, description="Chunks produced so far")
+    vectors: int = Field(0, description="Vectors upserted so far")
+    errors: List[str] = Field([], description="First errors reported by failed documents")
+
 
 # --- Chat Schemas ---
 
@@ -87,6 +127,8 @@ class MessageCreate(BaseModel):
     conversation_id: Optional[str] = Field(None, description="ID of the conversation to continue.")
     # Add history field for frontend to pass context for anonymous users
     history: Optional[List[HistoryMessage]] = Field(None, description="Recent message history for anonymous context.")
+    filter: Optional[RetrievalFilter] = Field(None, description="Restrict retrieved sources to books, authors or categories.")
+    compress: Optional[bool] = Field(None, description="Keep only the sentences of each source that match the question (defaults to server setting).")
 
 class Message(BaseModel):
     """Represents a single message in a conversation."""
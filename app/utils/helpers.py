@@ -5,10 +5,19 @@ import os
 import re
 from typing import Optional, Dict, Any
 from app.config.settings import settings
+from app.utils.logging_utils import (
+    DebugSampler, JsonFormatter, TraceContextFilter, start_queue_listener, stop_queue_listener
+)
+from app.utils.normalization import normalize_text
 
 def setup_logging():
     """
     Configure application logging with rotating file handler and console output.
+
+    With LOG_QUEUE_ENABLED the handlers run on a background writer thread
+    behind a queue, so logging never blocks the event loop on I/O. LOG_JSON
+    switches both outputs to one JSON object per line (with trace ids when
+    tracing), and LOG_DEBUG_SAMPLE_RATE < 1 samples repeated DEBUG records.
     """
     # Create logs directory if it doesn't exist
     os.makedirs("logs", exist_ok=True)
@@ -20,14 +29,14 @@ def setup_logging():
     # Remove existing handlers to avoid duplicates
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    stop_queue_listener()
     
     # Create formatter
-    formatter = logging.Formatter(settings.LOG_FORMAT)
+    formatter = JsonFormatter() if settings.LOG_JSON else logging.Formatter(settings.LOG_FORMAT)
     
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
     
     # Create rotating file handler
     file_handler = logging.handlers.RotatingFileHandler(
@@ -36,7 +45,20 @@ def setup_logging():
         backupCount=5
     )
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
+
+    if settings.LOG_QUEUE_ENABLED:
+        handlers = [start_queue_listener(console_handler, file_handler)]
+    else:
+        handlers = [console_handler, file_handler]
+    for handler in handlers:
+        # Filters run in the logging thread, before records are queued. Each
+        # handler gets its own sampler: its per-call-site counts must only see
+        # the records that handler receives.
+        if settings.LOG_JSON:
+            handler.addFilter(TraceContextFilter())
+        if settings.LOG_DEBUG_SAMPLE_RATE < 1.0:
+            handler.addFilter(DebugSampler(settings.LOG_DEBUG_SAMPLE_RATE))
+        root_logger.addHandler(handler)
     
     # Set specific log levels for noisy libraries
     logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -46,6 +68,9 @@ def normalize_arabic_text(text: str) -> str:
     """
     Normalize Arabic text by removing diacritics and standardizing characters.
     
+    Delegates to the normalization engine (app/utils/normalization.py) with
+    the configured profile, so it matches what is embedded and hashed.
+    
     Args:
         text: Arabic text to normalize
         
@@ -54,20 +79,26 @@ def normalize_arabic_text(text: str) -> str:
     """
     if not settings.NORMALIZE_ARABIC:
         return text
-        
-    # Remove diacritics (tashkeel)
-    text = re.sub(r'[\u064B-\u065F\u0670]', '', text)
-    
-    # Normalize alef variations to plain alef
-    text = re.sub(r'[إأآا]', 'ا', text)
-    
-    # Normalize yaa variations
-    text = re.sub(r'[يى]', 'ي', text)
-    
-    # Normalize taa marbuta
-    text = re.sub(r'ة', 'ه', text)
+    return normalize_text(text, profile="search")
+
+# Mistral's tokenizers average roughly four UTF-8 bytes per token for English
+# and somewhat more for Arabic, so bytes / 4 is a cheap, slightly conservative
+# estimate for both scripts.
+BYTES_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in a text without calling a tokenizer.
     
-    return text
+    Args:
+        text: Text to measure
+        
+    Returns:
+        Approximate token count (0 for empty text)
+    """
+    if not text:
+        return 0
+    return -(-len(text.encode("utf-8")) // BYTES_PER_TOKEN)
 
 def get_document_url_info(url: str) -> Dict[str, Any]:
     """
@@ -0,0 +1,125 @@
+# app/utils/logging_utils.py
+"""
+Logging building blocks used by setup_logging (app/utils/helpers.py).
+
+- NonBlockingQueueHandler puts records on an in-memory queue; a
+  QueueListener thread formats and writes them, so console and file I/O
+  never run on the event loop. Messages are interpolated when enqueued
+  (arguments may be mutated later), which only happens for enabled levels.
+- JsonFormatter writes one JSON object per line with the message, level,
+  logger, location, any ``extra=`` fields and the current trace/span ids.
+- DebugSampler keeps the first DEBUG record of each call site and then one
+  in every round(1 / rate), so chatty debug lines can stay on in production.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.tracing import current_span
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps formatted tracebacks separate, so the writer's formatter can place them."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class TraceContextFilter(logging.Filter):
+    """Copies the current trace and span ids onto records (in the logging thread, before queueing)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        active = current_span()
+        if active.recording:
+            record.trace_id, record.span_id = active.trace_id, active.span_id
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keeps the first DEBUG record of each call site, then one in every round(1 / rate)."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._seen.get(key, 0)
+            self._seen[key] = count + 1
+        return count % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value  # extra= fields and trace ids
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_queue_listener(*handlers: logging.Handler) -> logging.Handler:
+    """
+    Move handlers behind a queue written by a background thread.
+
+    Returns:
+        The handler to attach to loggers in their place
+    """
+    global _listener
+    stop_queue_listener()
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    return NonBlockingQueueHandler(records)
+
+
+def stop_queue_listener() -> None:
+    """Write out queued records and stop the writer thread (safe to call repeatedly)."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+atexit.register(stop_queue_listener)
@@ -0,0 +1,88 @@
+"""
+chunk_text Microbenchmark
+=========================
+Compares the previous chunk_text (whole-document whitespace regex plus six
+Latin-only rfind calls per window) against iter_chunk_spans on a synthetic
+multi-megabyte Arabic book.
+
+Usage:
+    python -m benchmarks.chunk_text_benchmark --megabytes 8 --repeat 3
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import List
+
+from app.core.document_processor import chunk_text, iter_chunk_spans
+
+WORDS = ["قال", "الشيخ", "رحمه", "الله", "باب", "المياه", "الماء", "طهور", "وهو", "الباقي", "على", "أصل",
+         "خلقته", "فإن", "تغير", "بشيء", "من", "الطاهرات", "فهو", "طاهر", "غير", "مطهر", "في", "أظهر", "الروايتين"]
+PUNCTUATION = [".", "،", "؛", "؟", ":", ""]
+
+
+def legacy_chunk_text(text: str, max_chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """The chunk_text implementation this benchmark measures against."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) <= max_chunk_size:
+        return [text]
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chunk_size, len(text))
+        if end < len(text):
+            search_from = max(end - 200, start + 200)
+            search_text = text[search_from:end]
+            sentence_end = max(
+                search_text.rfind('. '), search_text.rfind('! '), search_text.rfind('? '),
+                search_text.rfind('.\n'), search_text.rfind('!\n'), search_text.rfind('?\n')
+            )
+            if sentence_end != -1:
+                end = search_from + sentence_end + 2
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break  # The original loop re-chunks the tail until start passes the end
+        start = end - overlap
+    return chunks
+
+
+def make_book(megabytes: float, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    target = int(megabytes * 1024 * 1024)
+    parts, size = [], 0
+    while size < target:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))) + rng.choice(PUNCTUATION)
+        sentence += "\n\n" if rng.random() < 0.05 else " "
+        parts.append(sentence)
+        size += len(sentence.encode("utf-8"))
+    return "".join(parts)
+
+
+def bench(name: str, func, text: str, repeat: int) -> None:
+    megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = func(text)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<34} {count:>8} chunks  {best * 1000:>9.1f} ms  {megabytes / best:>7.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunk_text on a synthetic Arabic book.")
+    parser.add_argument("--megabytes", type=float, default=8.0, help="Size of the synthetic book")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation (best is reported)")
+    args = parser.parse_args()
+
+    text = make_book(args.megabytes)
+    print(f"Book: {len(text):,} characters, {len(text.encode('utf-8')):,} bytes")
+    bench("legacy chunk_text", lambda t: len(legacy_chunk_text(t)), text, args.repeat)
+    bench("chunk_text", lambda t: len(chunk_text(t)), text, args.repeat)
+    bench("iter_chunk_spans (offsets only)", lambda t: sum(1 for _ in iter_chunk_spans(t)), text, args.repeat)
+    bench("iter_chunk_spans (800 tokens)",
+          lambda t: sum(1 for _ in iter_chunk_spans(t, 800, 100, unit="tokens")), text, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
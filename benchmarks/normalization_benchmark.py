@@ -0,0 +1,96 @@
+"""
+Arabic Normalization Microbenchmark
+===================================
+Compares the previous normalize_arabic_text (four re.sub passes per call), and
+a str.translate table, against the engine in app/utils/normalization.py on a
+synthetic Arabic corpus, both per chunk and as one large text. Most Shamela
+text is unvocalised; --vocalised sets the share of fully vocalised words.
+
+Usage:
+    python -m benchmarks.normalization_benchmark --megabytes 8 --vocalised 0.2 --repeat 3
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import List
+
+from app.utils.normalization import (
+    ALEF_VARIANTS, DIACRITICS, QURANIC_MARKS, TAA_MARBUTA, TATWEEL, YAA_VARIANTS, get_normalizer
+)
+
+WORDS = ["قال", "الشيخ", "رحمه", "الله", "باب", "المياه", "الماء", "طهور", "وهو", "الباقي", "على", "أصل",
+         "خلقته", "فإن", "تغير", "بشيء", "من", "الطاهرات", "فهو", "طاهر", "غير", "مطهر", "في", "أظهر",
+         "الروايتين", "إلى", "آخره", "الصلاة", "ـــ"]
+VOCALISED_WORDS = ["قَالَ", "رَسُولُ", "اللَّهِ", "صَلَّى", "عَلَيْهِ", "وَسَلَّمَ", "إِنَّمَا", "الْأَعْمَالُ", "بِالنِّيَّاتِ",
+                   "ٱلرَّحْمَٰنِ", "ٱلرَّحِيمِۚ", "مَٰلِكِ", "يَوْمِ", "ٱلدِّينِ"]
+PUNCTUATION = [".", "،", "؛", "؟", ":", ""]
+
+
+def legacy_normalize(text: str) -> str:
+    """The normalize_arabic_text implementation this benchmark measures against."""
+    text = re.sub(r'[ً-ٰٟ]', '', text)
+    text = re.sub(r'[إأآا]', 'ا', text)
+    text = re.sub(r'[يى]', 'ي', text)
+    text = re.sub(r'ة', 'ه', text)
+    return text
+
+
+def make_translate_table() -> dict:
+    """The single str.translate table alternative, for comparison."""
+    table = dict.fromkeys(DIACRITICS + QURANIC_MARKS + TATWEEL)
+    table.update({**ALEF_VARIANTS, **YAA_VARIANTS, **TAA_MARBUTA})
+    return str.maketrans(table)
+
+
+def make_chunks(megabytes: float, vocalised: float, chunk_words: int = 150, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    target = int(megabytes * 1024 * 1024)
+    chunks, size = [], 0
+    while size < target:
+        words = [rng.choice(VOCALISED_WORDS if rng.random() < vocalised else WORDS)
+                 + (rng.choice(PUNCTUATION) if rng.random() < 0.1 else "")
+                 for _ in range(chunk_words)]
+        chunk = " ".join(words)
+        chunks.append(chunk)
+        size += len(chunk.encode("utf-8"))
+    return chunks
+
+
+def bench(name: str, func, data, megabytes: float, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<40} {best * 1000:>9.1f} ms  {megabytes / best:>7.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Arabic normalization on a synthetic corpus.")
+    parser.add_argument("--megabytes", type=float, default=8.0, help="Size of the synthetic corpus")
+    parser.add_argument("--vocalised", type=float, default=0.2, help="Share of fully vocalised words")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation (best is reported)")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.megabytes, args.vocalised)
+    corpus = "\n".join(chunks)
+    megabytes = len(corpus.encode("utf-8")) / (1024 * 1024)
+    print(f"Corpus: {len(chunks):,} chunks, {len(corpus):,} characters, {megabytes:.1f} MB")
+
+    search = get_normalizer("search")
+    dedup = get_normalizer("dedup")
+    table = make_translate_table()
+    bench("legacy normalize_arabic_text (chunks)", lambda data: [legacy_normalize(t) for t in data],
+          chunks, megabytes, args.repeat)
+    bench("str.translate table (chunks)", lambda data: [t.translate(table) for t in data],
+          chunks, megabytes, args.repeat)
+    bench("search profile normalize_batch", search.normalize_batch, chunks, megabytes, args.repeat)
+    bench("dedup profile normalize_batch", dedup.normalize_batch, chunks, megabytes, args.repeat)
+    bench("legacy normalize_arabic_text (one text)", legacy_normalize, corpus, megabytes, args.repeat)
+    bench("search profile normalize (one text)", search.normalize, corpus, megabytes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from app.config.settings import settings
+
+
+def test_debug_endpoints_are_hidden_without_admin_token(client: TestClient, mocker):
+    mocker.patch.object(settings, "ADMIN_TOKEN", "")
+    assert client.get("/debug/profile", headers={"X-Admin-Token": "anything"}).status_code == 404
+
+
+def test_profile_requires_the_admin_token(client: TestClient, mocker):
+    mocker.patch.object(settings, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/debug/profile").status_code == 401
+    assert client.get("/debug/profile", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+
+def test_profile_returns_collapsed_stacks_and_speedscope(client: TestClient, mocker):
+    mocker.patch.object(settings, "ADMIN_TOKEN", "s3cret")
+    headers = {"X-Admin-Token": "s3cret"}
+
+    response = client.get("/debug/profile", params={"seconds": 0.1, "interval_ms": 5}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines())
+
+    response = client.get("/debug/profile", params={"seconds": 0.1, "format": "speedscope"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["profiles"]
+
+    assert client.get("/debug/loop", headers=headers).json()["running"] is True
@@ -0,0 +1,44 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.jobs import JobManager, get_job_manager
+from app.main import app
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+@pytest.fixture
+def job_manager(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs.sqlite"),
+                         handler=lambda payload, index: {"chunks": 3, "vectors": 3},
+                         index_factory=lambda: None)
+    manager.start()
+    app.dependency_overrides[get_job_manager] = lambda: manager
+    yield manager
+    app.dependency_overrides.pop(get_job_manager, None)
+    manager.stop()
+
+
+def test_batch_ingestion_creates_job(client: TestClient, job_manager):
+    response = client.post("/ingestion/batch", headers=HEADERS,
+                           json=[{"text_content": "نص أول"}, {"text_content": "نص ثان"}])
+    assert response.status_code == 202
+    job = response.json()
+    assert job["total_documents"] == 2
+
+    deadline = time.monotonic() + 5
+    while True:
+        status_response = client.get(f"/ingestion/jobs/{job['job_id']}", headers=HEADERS)
+        assert status_response.status_code == 200
+        if status_response.json()["status"] == "completed" or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+    assert status_response.json()["status"] == "completed"
+    assert status_response.json()["vectors"] == 6
+
+
+def test_unknown_job_returns_404(client: TestClient, job_manager):
+    assert client.get("/ingestion/jobs/missing", headers=HEADERS).status_code == 404
+    assert client.post("/ingestion/jobs/missing/cancel", headers=HEADERS).status_code == 404
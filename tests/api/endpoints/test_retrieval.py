@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.core.embeddings import get_query_rate_limiter
+from app.models.schemas import DocumentMatch, DocumentMetadata
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+class FakeRetriever:
+    """Answers each vector with one match; earlier queries finish last."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def retrieve_by_vector(self, query_vector, top_k, filters=None):
+        self.calls.append((query_vector[0], filters))
+        await asyncio.sleep(0.01 * (3 - query_vector[0]))
+        metadata = DocumentMetadata(text=f"نص {query_vector[0]:.0f}", book_id="1")
+        return [DocumentMatch(id=f"doc{query_vector[0]:.0f}", score=0.5, metadata=metadata)]
+
+
+def test_batch_retrieval_streams_ndjson_in_order(client: TestClient, mocker):
+    retriever = FakeRetriever()
+    mocker.patch("app.api.endpoints.retrieval.get_retriever", return_value=retriever)
+    embed = mocker.patch("app.api.endpoints.retrieval.embed_texts_batched",
+                         return_value=[[0.0], None, [2.0]])
+
+    response = client.post("/retrieval/batch", headers=HEADERS,
+                           json={"queries": ["أ", "ب", "ج"], "top_k": 1, "filter": {"book_ids": [1]}})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    embed.assert_called_once_with(["أ", "ب", "ج"], limiter=get_query_rate_limiter())
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert [line["query"] for line in lines] == ["أ", "ب", "ج"]
+    assert lines[0]["matches"][0]["id"] == "doc0"
+    assert lines[1]["matches"] == [] and "error" in lines[1]
+    assert lines[2]["matches"][0]["metadata"]["text"] == "نص 2"
+    assert len(retriever.calls) == 2
+    assert retriever.calls[0][1].book_ids == [1]
+
+
+def test_batch_retrieval_reports_failed_queries(client: TestClient, mocker):
+    retriever = FakeRetriever()
+    retriever.retrieve_by_vector = mocker.AsyncMock(return_value=None)
+    mocker.patch("app.api.endpoints.retrieval.get_retriever", return_value=retriever)
+    mocker.patch("app.api.endpoints.retrieval.embed_texts_batched", return_value=[[0.0]])
+
+    response = client.post("/retrieval/batch", headers=HEADERS, json={"queries": ["أ"]})
+    line = json.loads(response.text)
+    assert line["matches"] == [] and line["error"] == "Retrieval failed"
+
+
+def test_batch_retrieval_rejects_empty_batch(client: TestClient):
+    assert client.post("/retrieval/batch", headers=HEADERS, json={"queries": []}).status_code == 422
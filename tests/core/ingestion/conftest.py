@@ -0,0 +1,47 @@
+import sqlite3
+import pytest
+
+
+@pytest.fixture
+def robust_db(tmp_path):
+    """
+    Builds a tiny shamela_robust.db with one book, its pages (b1) and its
+    section hierarchy (t1), mirroring the schema from prepare_robust_dataset.py.
+    """
+    db_path = tmp_path / "shamela_robust.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE books (book_id INTEGER PRIMARY KEY, book_name TEXT, category_id INTEGER, main_author TEXT);
+        CREATE TABLE authors (author_id INTEGER PRIMARY KEY, author_name TEXT);
+        CREATE TABLE categories (category_id INTEGER PRIMARY KEY, category_name TEXT);
+        CREATE TABLE b1 (chunk_id INTEGER PRIMARY KEY, content TEXT, part INTEGER, page INTEGER,
+                         number INTEGER, services TEXT, is_deleted INTEGER, section_title TEXT, citations TEXT);
+        CREATE TABLE t1 (section_id INTEGER PRIMARY KEY, section_title TEXT, page INTEGER,
+                         parent_section_id INTEGER, is_deleted INTEGER);
+    """)
+    conn.execute("INSERT INTO books VALUES (1, 'كتاب الاختبار', 7, 3)")
+    conn.execute("INSERT INTO authors VALUES (3, 'مؤلف الاختبار')")
+    conn.execute("INSERT INTO categories VALUES (7, 'الفقه الحنبلي')")
+    pages = [
+        (1, "مقدمة الكتاب", 1),
+        (2, "باب المياه الماء طهور", 2),
+        (3, "تتمة الكلام في المياه", 3),
+        (4, "فصل في الآنية", 4),
+        (5, "باب الصلاة", 5),
+    ]
+    for chunk_id, content, page in pages:
+        conn.execute(
+            "INSERT INTO b1 (chunk_id, content, part, page, number, is_deleted) VALUES (?, ?, 1, ?, ?, 0)",
+            (chunk_id, content, page, chunk_id),
+        )
+    sections = [
+        (1, "كتاب الطهارة", 2, 1),
+        (2, "باب المياه", 2, 2),
+        (3, "فصل الآنية", 4, 3),
+        (4, "كتاب الصلاة", 5, 1),
+    ]
+    for section_id, title, page, level in sections:
+        conn.execute("INSERT INTO t1 VALUES (?, ?, ?, ?, 0)", (section_id, title, page, level))
+    conn.commit()
+    conn.close()
+    return str(db_path)
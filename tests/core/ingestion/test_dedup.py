@@ -0,0 +1,49 @@
+import pytest
+
+from app.core.ingestion.dedup import (
+    apply_deduplication, find_duplicate_clusters, minhash_signature, normalize_for_dedup
+)
+
+PASSAGE = ("قال الشيخ رحمه الله تعالى في باب المياه إن الماء الطهور هو الباقي على خلقته "
+           "التي خلق عليها من حرارة أو برودة أو عذوبة أو ملوحة نزل من السماء أو نبع من الأرض "
+           "وما تغير بمكثه أو بما يشق صون الماء عنه فهو طهور ما لم يخالطه نجس")
+
+
+def _chunk(chunk_id, text):
+    return {"id": chunk_id, "text": text, "metadata": {"text": text}}
+
+
+def test_normalization_folds_diacritics_and_letters():
+    assert normalize_for_dedup("إِنَّ  الصَّلاةَ، مُهِمَّةٌ!") == "ان الصلاه مهمه"
+
+
+def test_signature_is_deterministic_and_similarity_sensitive():
+    base = minhash_signature(normalize_for_dedup(PASSAGE))
+    assert (base == minhash_signature(normalize_for_dedup(PASSAGE))).all()
+    other = minhash_signature(normalize_for_dedup("كتاب الصلاة باب مواقيت الصلاة وفضلها عند أهل العلم"))
+    assert (base == other).mean() < 0.2
+    assert minhash_signature("") is None
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_clusters_exact_and_near_duplicates(processes):
+    near = PASSAGE.replace("رحمه الله تعالى", "رحمه الله")  # abridged copy
+    chunks = [
+        _chunk("1_2_0", PASSAGE),
+        _chunk("5_9_0", "قَالَ " + PASSAGE[4:]),  # same text with a diacritic
+        _chunk("7_3_1", near),
+        _chunk("8_1_0", "كتاب الصلاة باب مواقيت الصلاة وفضلها عند أهل العلم"),
+    ]
+    clusters, stats = find_duplicate_clusters(chunks, threshold=0.7, processes=processes)
+
+    assert stats["exact_duplicates"] == 1
+    assert stats["near_duplicates"] == 1
+    assert len(clusters) == 1
+    canonical, duplicates = next(iter(clusters.items()))
+    assert sorted([canonical] + duplicates) == ["1_2_0", "5_9_0", "7_3_1"]
+
+    kept = list(apply_deduplication(chunks, clusters))
+    assert {c["id"] for c in kept} == {canonical, "8_1_0"}
+    canonical_chunk = next(c for c in kept if c["id"] == canonical)
+    assert canonical_chunk["metadata"]["duplicate_count"] == 2
+    assert set(canonical_chunk["metadata"]["duplicate_book_ids"]) <= {"1", "5", "7"}
@@ -0,0 +1,78 @@
+import pytest
+
+from app.core.embedding_store import EmbeddingStore
+from app.core.ingestion.embedding_job import EmbeddingJob, content_hash
+from app.core.ingestion.section_chunker import iter_dataset_chunks
+
+
+@pytest.fixture
+def fake_embed(mocker):
+    calls = []
+
+    def embed(texts, max_workers=None):
+        calls.append(list(texts))
+        return [None if "FAIL" in text else [float(len(text)), 1.0] for text in texts]
+
+    mocker.patch("app.core.ingestion.embedding_job.embed_texts_batched", side_effect=embed)
+    return calls
+
+
+def _chunk(chunk_id, text):
+    return {"id": chunk_id, "text": text, "metadata": {"text": text}}
+
+
+def test_content_hash_ignores_whitespace_but_not_model():
+    assert content_hash("باب  المياه\n") == content_hash("باب المياه")
+    assert content_hash("باب المياه", model="a") != content_hash("باب المياه", model="b")
+
+
+def test_rerun_skips_already_embedded(tmp_path, robust_db, fake_embed):
+    chunks = list(iter_dataset_chunks(robust_db))
+    first = EmbeddingJob(EmbeddingStore(str(tmp_path)), flush_size=2).run(chunks)
+    assert first["embedded"] == len(chunks)
+
+    second = EmbeddingJob(EmbeddingStore(str(tmp_path)), flush_size=2).run(chunks)
+    assert second["skipped"] == len(chunks)
+    assert second["embedded"] == 0
+    assert len(fake_embed) == len(chunks) // 2 + len(chunks) % 2  # no new API calls
+
+
+def test_resume_only_embeds_missing_work(tmp_path, fake_embed):
+    chunks = [_chunk("a", "one"), _chunk("b", "two FAIL"), _chunk("c", "three")]
+    stats = EmbeddingJob(EmbeddingStore(str(tmp_path))).run(chunks)
+    assert stats["failed"] == 1
+
+    chunks[1] = _chunk("b", "two fixed")
+    fake_embed.clear()
+    stats = EmbeddingJob(EmbeddingStore(str(tmp_path))).run(chunks)
+    assert fake_embed == [["two fixed"]]
+    assert stats == {"seen": 3, "skipped": 2, "reused": 0, "embedded": 1, "failed": 0}
+
+
+def test_duplicate_text_embedded_once(tmp_path, fake_embed):
+    chunks = [_chunk("a", "same text"), _chunk("b", "same  text"), _chunk("c", "other")]
+    store = EmbeddingStore(str(tmp_path))
+    stats = EmbeddingJob(store, flush_size=1).run(chunks)
+
+    assert stats["embedded"] == 2 and stats["reused"] == 1
+    assert sum(len(call) for call in fake_embed) == 2
+    vectors = {row["id"]: vector.tolist() for row, vector in store.iter_rows()}
+    assert vectors["a"] == vectors["b"]
+
+
+def test_rows_appended_to_the_last_shard_are_indexed(tmp_path, fake_embed):
+    # flush_size < shard_rows: later flushes fill the first shard in place
+    chunks = [_chunk("x", "first"), _chunk("y", "second"), _chunk("a", "same text"),
+              _chunk("b", "same  text"), _chunk("c", "third")]
+    store = EmbeddingStore(str(tmp_path), shard_rows=100)
+    stats = EmbeddingJob(store, flush_size=2).run(chunks)
+
+    assert stats == {"seen": 5, "skipped": 0, "reused": 1, "embedded": 4, "failed": 0}
+    assert store.shard_names == ["shard_00000"]
+    vectors = {row["id"]: vector.tolist() for row, vector in store.iter_rows()}
+    assert vectors["a"] == vectors["b"]
+
+    fake_embed.clear()
+    stats = EmbeddingJob(EmbeddingStore(str(tmp_path), shard_rows=100), flush_size=2).run(chunks)
+    assert fake_embed == []
+    assert stats["skipped"] == 5
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from app.core.ingestion.pipeline import IngestionPipeline
+from app.core.ingestion.section_chunker import iter_dataset_chunks
+from app.core.vector_upsert import VectorUpserter
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeIndex:
+    def __init__(self):
+        self.ids = []
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            self.ids.extend(vector["id"] for vector in vectors)
+
+
+@pytest.fixture
+def fake_embed(mocker):
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [None if "FAIL" in text else [float(len(text)), 1.0] for text in texts]
+
+    mocker.patch("app.core.ingestion.pipeline.embed_texts_batched", side_effect=embed)
+    return calls
+
+
+def _chunks(count, text="نص قصير"):
+    for i in range(count):
+        yield {"id": f"c{i}", "text": f"{text} {i}", "metadata": {"token_count": 10}}
+
+
+async def test_pipeline_streams_all_chunks_with_small_queues(fake_embed):
+    index = FakeIndex()
+    pipeline = IngestionPipeline(_chunks(100), VectorUpserter(index, max_batch_vectors=7),
+                                 read_batch_size=5, embed_window_tokens=30,
+                                 chunk_queue_size=1, vector_queue_size=1, upsert_workers=3)
+    snapshot = await pipeline.run()
+
+    assert sorted(index.ids) == sorted(f"c{i}" for i in range(100))
+    assert all(len(call) <= 3 for call in fake_embed)
+    assert snapshot["stages"]["read"]["items"] == 100
+    assert snapshot["stages"]["upsert"]["items"] == 100
+    assert set(snapshot["queues"]) == {"chunks", "vectors"}
+
+
+async def test_pipeline_counts_embedding_failures(fake_embed):
+    chunks = [{"id": "ok", "text": "نص", "metadata": {}}, {"id": "bad", "text": "FAIL", "metadata": {}}]
+    index = FakeIndex()
+    snapshot = await IngestionPipeline(chunks, VectorUpserter(index)).run()
+    assert index.ids == ["ok"]
+    assert snapshot["embed_failed"] == 1
+
+
+async def test_pipeline_resumes_from_manifest(fake_embed, robust_db, tmp_path):
+    manifest_path = str(tmp_path / "manifest.sqlite")
+    first_index = FakeIndex()
+    await IngestionPipeline(iter_dataset_chunks(str(robust_db)),
+                            VectorUpserter(first_index, manifest_path=manifest_path)).run()
+    assert first_index.ids
+
+    fake_embed.clear()
+    second_index = FakeIndex()
+    snapshot = await IngestionPipeline(iter_dataset_chunks(str(robust_db)),
+                                       VectorUpserter(second_index, manifest_path=manifest_path)).run()
+    assert second_index.ids == [] and fake_embed == []
+    assert snapshot["skipped"] == len(first_index.ids)
@@ -0,0 +1,85 @@
+import sqlite3
+import pytest
+
+from app.core.ingestion.section_chunker import (
+    iter_book_chunks, iter_dataset_chunks, load_sections, SECTION_PATH_SEPARATOR
+)
+from app.core.page_store import PageStore, build_page_store
+
+
+def test_load_sections_builds_title_path(robust_db):
+    conn = sqlite3.connect(robust_db)
+    sections = load_sections(conn, 1)
+    conn.close()
+
+    paths = [section["path"] for section in sections]
+    # Several headings can start on the same page; the deepest one keeps the full path
+    assert paths[1] == SECTION_PATH_SEPARATOR.join(["كتاب الطهارة", "باب المياه"])
+    assert paths[2] == SECTION_PATH_SEPARATOR.join(["كتاب الطهارة", "باب المياه", "فصل الآنية"])
+    assert paths[3] == "كتاب الصلاة"
+
+
+def test_chunks_never_cross_sections(robust_db):
+    chunks = list(iter_dataset_chunks(robust_db, max_tokens=500))
+
+    by_section = {chunk["metadata"]["section_id"]: chunk for chunk in chunks}
+    assert set(by_section) == {0, 2, 3, 4}
+    # Pages 2 and 3 both belong to "باب المياه" and are packed together
+    assert by_section[2]["metadata"]["page_start"] == 2
+    assert by_section[2]["metadata"]["page_end"] == 3
+    assert "تتمة الكلام" in by_section[2]["text"]
+    assert by_section[3]["metadata"]["section_path"].endswith("فصل الآنية")
+    assert by_section[4]["metadata"]["category_name"] == "الفقه الحنبلي"
+    assert by_section[4]["metadata"]["author_name"] == "مؤلف الاختبار"
+
+
+def test_token_budget_splits_sections(robust_db):
+    conn = sqlite3.connect(robust_db)
+    chunks = list(iter_book_chunks(conn, 1, max_tokens=10))
+    conn.close()
+
+    water_chunks = [c for c in chunks if c["metadata"]["section_id"] == 2]
+    assert len(water_chunks) > 1
+    assert [c["id"] for c in water_chunks][:2] == ["1_2_0", "1_2_1"]
+    assert all(c["metadata"]["token_count"] <= 10 for c in chunks)
+
+
+def test_whole_page_chunks_resolve_from_the_page_store(robust_db, tmp_path):
+    output = str(tmp_path / "page_store")
+    build_page_store(robust_db, output)
+    store = PageStore(output)
+
+    chunks = list(iter_dataset_chunks(robust_db, max_tokens=500))
+    water = next(chunk for chunk in chunks if chunk["metadata"]["section_id"] == 2)
+    assert (water["metadata"]["page_row_start"], water["metadata"]["page_row_end"]) == (2, 3)
+    for chunk in chunks:
+        metadata = chunk["metadata"]
+        assert store.chunk_text(1, metadata["page_row_start"], metadata["page_row_end"]) == chunk["text"]
+
+    # Chunks holding part of a split page have no page range
+    split = [chunk for chunk in iter_dataset_chunks(robust_db, max_tokens=3) if chunk["metadata"]["section_id"] == 2]
+    assert split and all("page_row_start" not in chunk["metadata"] for chunk in split)
+    store.close()
+
+
+def test_missing_book_yields_nothing(robust_db):
+    assert list(iter_dataset_chunks(robust_db, book_ids=[999])) == []
+
+
+def test_multi_volume_pages_join_sections_by_row(robust_db):
+    conn = sqlite3.connect(robust_db)
+    # Volume 2 restarts its printed page numbers at 1; its sections reference page row ids
+    conn.execute("INSERT INTO b1 (chunk_id, content, part, page, number, is_deleted) "
+                 "VALUES (6, 'كتاب الزكاة في المجلد الثاني', 2, 1, 6, 0)")
+    conn.execute("INSERT INTO b1 (chunk_id, content, part, page, number, is_deleted) "
+                 "VALUES (7, 'تتمة الزكاة', 2, 2, 7, 0)")
+    conn.execute("INSERT INTO t1 VALUES (5, 'كتاب الزكاة', 6, 1, 0)")
+    conn.commit()
+    chunks = list(iter_book_chunks(conn, 1, max_tokens=500))
+    conn.close()
+
+    by_section = {chunk["metadata"]["section_id"]: chunk for chunk in chunks}
+    assert "المجلد الثاني" not in by_section[0]["text"]  # Page 1 of volume 2 is not front matter
+    zakat = by_section[5]["metadata"]
+    assert (zakat["part_start"], zakat["page_start"], zakat["part_end"], zakat["page_end"]) == (2, 1, 2, 2)
+    assert "المجلد الثاني" not in by_section[4]["text"]
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from app.core.embedding_store import EmbeddingStore
+from app.core.retrieval.local import LocalRetriever
+from app.models.schemas import RetrievalFilter
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=2, shard_rows=2)
+    store.append(
+        ["a", "b", "c"], ["ha", "hb", "hc"],
+        [[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]],
+        metadata=[
+            {"text": "east", "book_id": 1.0, "book_name": "Book A"},
+            {"text": "north", "book_id": 2, "book_name": "Book B"},
+            {"text": "north-east", "book_id": 3, "book_name": "Book C", "duplicate_book_ids": ["4", "5"]},
+        ],
+    )
+    return str(tmp_path)
+
+
+async def test_local_retrieve_ranks_by_cosine(mocker, local_store):
+    mocker.patch("app.core.retrieval.local.get_text_embedding", return_value=[0.0, 2.0])
+    retriever = LocalRetriever(local_store)
+
+    matches = await retriever.retrieve("query", top_k=2)
+
+    assert [match.id for match in matches] == ["b", "c"]
+    assert matches[0].score == pytest.approx(1.0)
+    assert matches[0].metadata.text == "north"
+    assert matches[0].metadata.book_id == "2"
+
+
+async def test_local_retrieve_embedding_failure(mocker, local_store):
+    mocker.patch("app.core.retrieval.local.get_text_embedding", return_value=None)
+    assert await LocalRetriever(local_store).retrieve("query", top_k=2) == []
+
+
+async def test_local_retrieve_applies_metadata_filter(mocker, local_store):
+    mocker.patch("app.core.retrieval.local.get_text_embedding", return_value=[0.0, 2.0])
+    retriever = LocalRetriever(local_store)
+
+    matches = await retriever.retrieve("query", top_k=2, filters=RetrievalFilter(book_ids=[1, 3]))
+    assert [match.id for match in matches] == ["c", "a"]
+
+    # Chunks deduplicated out of book 5 are served by their canonical copy
+    matches = await retriever.retrieve("query", top_k=2, filters=RetrievalFilter(book_ids=[5]))
+    assert [match.id for match in matches] == ["c"]
+
+    matches = await retriever.retrieve("query", top_k=2, filters=RetrievalFilter(book_ids=[1],
+                                                                                 author_names=["nobody"]))
+    assert matches == []
+
+
+async def test_local_retrieve_by_vector_skips_embedding(mocker, local_store):
+    embed = mocker.patch("app.core.retrieval.local.get_text_embedding")
+    vector = [1.0, 0.0]
+
+    matches = await LocalRetriever(local_store).retrieve_by_vector(vector, top_k=1)
+
+    assert [match.id for match in matches] == ["a"]
+    assert vector == [1.0, 0.0]
+    embed.assert_not_called()
+
+
+async def test_local_scan_runs_off_the_event_loop(mocker, local_store):
+    retriever = LocalRetriever(local_store)
+    threads = []
+    search = retriever._search
+    mocker.patch.object(retriever, "_search", side_effect=lambda *args: threads.append(threading.get_ident())
+                        or search(*args))
+
+    matches = await retriever.retrieve_by_vector([1.0, 0.0], top_k=1)
+
+    assert [match.id for match in matches] == ["a"]
+    assert threads and threads[0] != threading.get_ident()
@@ -3,8 +3,8 @@ from unittest.mock import MagicMock, AsyncMock
 
 # Assuming your retriever is here
 try:
-    from app.core.retrieval.pinecone import PineconeRetriever
-    from app.models.schemas import DocumentMatch, DocumentMetadata
+    from app.core.retrieval.pinecone import PineconeRetriever, build_pinecone_filter
+    from app.models.schemas import DocumentMatch, DocumentMetadata, RetrievalFilter
 except ImportError:
     pytest.skip("Skipping pinecone retriever tests: Could not import.", allow_module_level=True)
 
@@ -42,6 +42,11 @@ def mock_get_text_embedding(mocker):
     # Return a dummy embedding vector
     return mocker.patch('app.core.retrieval.pinecone.get_text_embedding', return_value=[0.1, 0.2, 0.3])
 
+async def test_retrieve_by_vector_returns_none_on_query_error(mock_get_pinecone_index, mock_pinecone_index):
+    """A failed query is reported as None, not as an empty result."""
+    mock_pinecone_index.query.side_effect = Exception("Pinecone unavailable")
+    assert await PineconeRetriever().retrieve_by_vector([0.1, 0.2], top_k=2) is None
+
 async def test_retrieve_success(mock_get_pinecone_index, mock_get_text_embedding, mock_pinecone_index):
     """Test successful retrieval."""
     retriever = PineconeRetriever()
@@ -113,4 +118,55 @@ async def test_retrieve_pydantic_error_skips_match(mock_get_pinecone_index, mock
 
     assert len(matches) == 1 # Only the valid doc should be returned
     assert matches[0].id == 'valid_doc'
-    assert "Pydantic validation failed for metadata of match ID invalid_doc" in caplog.text
\ No newline at end of file
+    assert "Pydantic validation failed for metadata of match ID invalid_doc" in caplog.text
+async def test_retrieve_resolves_slim_metadata_text(mocker, mock_get_pinecone_index, mock_get_text_embedding,
+                                                    mock_pinecone_index):
+    """Matches without text in metadata get it from the local chunk-text store."""
+    mock_pinecone_index.query.return_value = {
+        'matches': [{'id': '10_2_0', 'score': 0.7, 'metadata': {'book_id': 10, 'book_name': 'Book 1'}}]
+    }
+    store = MagicMock()
+    store.get_many.return_value = {'10_2_0': 'Resolved text'}
+    mocker.patch('app.core.retrieval.pinecone.get_chunk_text_store', return_value=store)
+
+    matches = await PineconeRetriever().retrieve("query", 1)
+
+    store.get_many.assert_called_once_with(['10_2_0'])
+    assert matches[0].metadata.text == 'Resolved text'
+    assert matches[0].metadata.book_id == '10'
+
+async def test_retrieve_resolves_whole_page_chunks_from_the_page_store(mocker, mock_get_pinecone_index,
+                                                                       mock_get_text_embedding, mock_pinecone_index):
+    """Slim matches with a page row range are resolved from the page store before the chunk-text store."""
+    mock_pinecone_index.query.return_value = {
+        'matches': [
+            {'id': '10_2_0', 'score': 0.7, 'metadata': {'book_id': 10.0, 'page_row_start': 4.0, 'page_row_end': 5.0}},
+            {'id': '10_2_1', 'score': 0.6, 'metadata': {'book_id': 10.0}},
+        ]
+    }
+    resolve = mocker.patch('app.core.retrieval.pinecone.resolve_chunk_text',
+                           side_effect=lambda book_id, start, end: 'Page text' if start is not None else None)
+    store = MagicMock()
+    store.get_many.return_value = {'10_2_1': 'Stored text'}
+    mocker.patch('app.core.retrieval.pinecone.get_chunk_text_store', return_value=store)
+
+    matches = await PineconeRetriever().retrieve("query", 2)
+
+    resolve.assert_any_call(10.0, 4.0, 5.0)
+    store.get_many.assert_called_once_with(['10_2_1'])
+    assert [match.metadata.text for match in matches] == ['Page text', 'Stored text']
+    assert (matches[0].metadata.page_row_start, matches[0].metadata.page_row_end) == (4, 5)
+
+async def test_retrieve_pushes_filter_down(mock_get_pinecone_index, mock_get_text_embedding, mock_pinecone_index):
+    """Filters are sent to Pinecone as a metadata filter, not applied afterwards."""
+    filters = RetrievalFilter(book_ids=[10, 20], category_names=['فقه حنبلي'])
+    await PineconeRetriever().retrieve("query", 5, filters=filters)
+
+    assert mock_pinecone_index.query.call_args.kwargs['filter'] == {
+        '$and': [
+            {'$or': [{'book_id': {'$in': [10, 20]}}, {'duplicate_book_ids': {'$in': ['10', '20']}}]},
+            {'category_name': {'$eq': 'فقه حنبلي'}},
+        ]
+    }
+    assert build_pinecone_filter(RetrievalFilter()) is None
+    assert build_pinecone_filter(RetrievalFilter(author_names=['ابن قدامة'])) == {'author_name': {'$eq': 'ابن قدامة'}}
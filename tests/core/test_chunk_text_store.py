@@ -0,0 +1,28 @@
+from app.core import chunk_text_store
+from app.core.chunk_text_store import ChunkTextStore, slim_metadata
+
+
+def test_write_and_lookup_compressed_text(tmp_path):
+    store = ChunkTextStore(str(tmp_path / "chunk_text.sqlite"))
+    text = "باب المياه: الماء طهور. " * 50
+    assert store.write([{"id": "1_2_0", "text": text}, {"id": "1_2_1", "text": "قصير"}]) == 2
+
+    reopened = ChunkTextStore(str(tmp_path / "chunk_text.sqlite"))
+    assert len(reopened) == 2
+    assert reopened.get_many(["1_2_0", "1_2_1", "missing"]) == {"1_2_0": text, "1_2_1": "قصير"}
+    assert reopened.get("missing") is None
+
+
+def test_slim_metadata_drops_text():
+    metadata = {"book_id": 1, "book_name": "كتاب", "section_path": "أ > ب", "text": "نص طويل",
+                "duplicate_ids": ["2_1_0"], "page_start": 3}
+    assert slim_metadata(metadata) == {"book_id": 1, "book_name": "كتاب", "page_start": 3}
+
+
+def test_store_built_after_a_miss_is_picked_up(tmp_path, mocker):
+    path = str(tmp_path / "chunk_text.sqlite")
+    mocker.patch.object(chunk_text_store.settings, "CHUNK_TEXT_STORE_PATH", path)
+    mocker.patch.object(chunk_text_store, "_store", None)
+    assert chunk_text_store.get_chunk_text_store() is None
+    ChunkTextStore(path).write([{"id": "1_2_0", "text": "نص"}])
+    assert chunk_text_store.get_chunk_text_store().get("1_2_0") == "نص"
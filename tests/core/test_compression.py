@@ -0,0 +1,36 @@
+from app.core.compression import compress_passages, query_terms, score_sentences, split_sentences
+
+PASSAGE = ("باب المياه. الماء الطهور هو الباقي على خلقته؛ "
+           "ولا يجوز الوضوء بالماء المستعمل في رفع الحدث؟\n"
+           "وأما النبيذ فقد اختلف فيه العلماء. " + "وذكر المصنف أقوال السلف في المسألة. " * 30)
+
+
+def test_split_sentences_on_arabic_punctuation():
+    spans = split_sentences("الحمد لله. هل يجوز ذلك؟ نعم؛ بشرطه\nفصل")
+    assert [("الحمد لله. هل يجوز ذلك؟ نعم؛ بشرطه\nفصل")[start:end] for start, end in spans] == [
+        "الحمد لله.", "هل يجوز ذلك؟", "نعم؛", "بشرطه", "فصل"]
+
+
+def test_query_terms_drop_stopwords_and_proclitics():
+    assert query_terms("ما حكم الوضوء بالماء المستعمل؟") == ["حكم", "وضوء", "ماء", "مستعمل"]
+
+
+def test_matching_sentence_scores_highest():
+    sentences = ["باب المياه.", "لا يجوز الوضوء بالماء المستعمل.", "وذكر المصنف أقوال السلف."]
+    scores = score_sentences("حكم الوضوء بالماء المستعمل", sentences)
+    assert scores.argmax() == 1 and scores[2] == 0
+
+
+def test_compression_keeps_relevant_sentences_with_highlights():
+    [passage] = compress_passages("حكم الوضوء بالماء المستعمل", [PASSAGE], max_tokens=40)
+    assert "ولا يجوز الوضوء بالماء المستعمل في رفع الحدث؟" in passage.text
+    assert "أقوال السلف" not in passage.text
+    assert passage.compressed_tokens <= 40 < passage.original_tokens
+    assert any(PASSAGE[start:end] == "ولا يجوز الوضوء بالماء المستعمل في رفع الحدث؟"
+               for start, end in passage.highlights)
+
+
+def test_short_passages_are_kept_whole():
+    [passage] = compress_passages("الوضوء", ["باب الوضوء. فصل في الآنية."], max_tokens=200)
+    assert passage.text == "باب الوضوء. فصل في الآنية."
+    assert passage.highlights == [(0, 11)]
@@ -4,7 +4,7 @@ from typing import List
 # Assuming your formatter function is in app.core.context_formatter
 # Adjust the import path if necessary
 try:
-    from app.core.context_formatter import format_context_and_extract_sources, CONTEXT_SNIPPET_MAX_LENGTH
+    from app.core.context_formatter import format_context_and_extract_sources, CONTEXT_SNIPPET_MAX_LENGTH, pack_context
     from app.models.schemas import DocumentMatch, DocumentMetadata
 except ImportError as e:
     print(f"Error importing from app.core.context_formatter or app.models.schemas: {e}")
@@ -140,6 +140,22 @@ def test_format_context_and_extract_sources_missing_text():
     assert len(actual_sources) == 1
     assert actual_sources[0]["document_id"] == "valid_doc"
 
+def test_slim_matches_resolve_text_from_the_page_store(mocker):
+    """
+    Matches without text but with a page row range get their text from the page store.
+    """
+    resolve = mocker.patch("app.core.context_formatter.resolve_chunk_text", return_value="نص من مخزن الصفحات")
+    doc = DocumentMatch(id="1_2_0", score=0.7,
+                        metadata=DocumentMetadata(text="", book_id="1", page_row_start=2, page_row_end=3))
+
+    context, sources = format_context_and_extract_sources([doc])
+    packed = pack_context("سؤال", [doc], None, token_budget=2000)
+
+    resolve.assert_called_with("1", 2, 3)
+    assert "Content: نص من مخزن الصفحات" in context
+    assert sources[0]["content"] == "نص من مخزن الصفحات" and sources[0]["page_rows"] == [2, 3]
+    assert "نص من مخزن الصفحات" in packed.context_text and packed.sources[0]["page_rows"] == [2, 3]
+
 def test_format_context_and_extract_sources_multiple_docs():
     """
     Test with multiple valid documents.
@@ -162,4 +178,48 @@ def test_format_context_and_extract_sources_multiple_docs():
     assert actual_sources[1]["content"] == "Content 2"
 
 # Add tests for format_history and construct_llm_prompt if they exist
-# in context_formatter.py and have non-trivial logic.
\ No newline at end of file
+# in context_formatter.py and have non-trivial logic.
+
+def test_pack_context_fills_budget_by_relevance():
+    """
+    Whole passages are packed by score; one that doesn't fit is skipped or
+    truncated, and the reported token counts stay within the budget.
+    """
+    low = DocumentMatch(id="low", score=0.2, metadata=DocumentMetadata(text="نص قليل الصلة " * 20, book_id="1"))
+    best = DocumentMatch(id="best", score=0.9, metadata=DocumentMetadata(text="الماء طهور " * 200, book_id="2"))
+    huge = DocumentMatch(id="huge", score=0.5, metadata=DocumentMetadata(text="باب المياه " * 5000, book_id="3"))
+    history = [f"User: سؤال رقم {i} " + "كلام " * 50 for i in range(20)]
+
+    packed = pack_context("ما حكم الماء؟", [low, huge, best], history, token_budget=3000, history_share=0.2)
+    counts = packed.token_counts
+
+    assert counts["total"] <= 3000
+    assert counts["history"] <= 0.2 * 3000
+    # The most recent history lines are kept, oldest first
+    assert packed.history_text.endswith(history[-1])
+    assert 0 < counts["history_messages"] < len(history)
+    # Best passage is whole and first; the huge one is truncated into the remaining budget
+    assert packed.context_text.index("[ID: best]") < packed.context_text.index("[ID: huge]")
+    assert "الماء طهور " * 200 in packed.context_text
+    assert [source["document_id"] for source in packed.sources] == ["best", "huge"]
+    assert counts["passages_dropped"] == 1
+    assert len(packed.sources[0]["content"]) <= CONTEXT_SNIPPET_MAX_LENGTH + 3
+
+def test_pack_context_without_documents_or_history():
+    packed = pack_context("سؤال", [], None, token_budget=2000)
+    assert packed.context_text == "No relevant context found."
+    assert packed.history_text == "No previous conversation history."
+    assert packed.sources == [] and packed.token_counts["context"] == 0
+
+def test_pack_context_compresses_passages_per_request():
+    text = "لا يجوز الوضوء بالماء المستعمل. " + "وذكر المصنف أقوال السلف في المسألة. " * 40
+    doc = DocumentMatch(id="1_2_3", score=0.8, metadata=DocumentMetadata(text=text, book_id="1"))
+
+    packed = pack_context("الوضوء بالماء المستعمل", [doc], None, token_budget=3000, compress=True)
+    assert "Content: لا يجوز الوضوء بالماء المستعمل." in packed.context_text
+    assert "أقوال السلف" not in packed.context_text
+    assert packed.sources[0]["highlights"] == [[0, len("لا يجوز الوضوء بالماء المستعمل.")]]
+    assert packed.token_counts["compression_saved"] > 0
+
+    uncompressed = pack_context("الوضوء بالماء المستعمل", [doc], None, token_budget=3000, compress=False)
+    assert "أقوال السلف" in uncompressed.context_text and "highlights" not in uncompressed.sources[0]
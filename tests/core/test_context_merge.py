@@ -0,0 +1,70 @@
+from app.core.context_merge import merge_overlapping_documents, suffix_prefix_overlap
+from app.models.schemas import DocumentMatch, DocumentMetadata
+
+
+def make_doc(doc_id, text, score=0.5, book_id="1", section="باب الطهارة", chunk_index="from_id"):
+    if chunk_index == "from_id":
+        chunk_index = int(doc_id.rsplit("_", 1)[1])
+    return DocumentMatch(id=doc_id, score=score, metadata=DocumentMetadata(
+        book_id=book_id, book_name=f"كتاب {book_id}", section_title=section, text=text, chunk_index=chunk_index))
+
+
+FIRST = "الماء طهور لا ينجسه شيء إلا ما غلب على ريحه وطعمه ولونه"
+SECOND = "ما غلب على ريحه وطعمه ولونه وإذا بلغ الماء قلتين لم يحمل الخبث"
+
+
+def test_suffix_prefix_overlap():
+    assert suffix_prefix_overlap(FIRST, SECOND) == len("ما غلب على ريحه وطعمه ولونه")
+    assert suffix_prefix_overlap(SECOND, FIRST) == 0
+    assert suffix_prefix_overlap("قصير", "قصير") == 0
+
+
+def test_overlapping_chunks_merge_into_one_passage():
+    docs = [make_doc("1_5_3", SECOND, score=0.9), make_doc("1_5_2", FIRST, score=0.7)]
+    merged = merge_overlapping_documents(docs)
+    assert len(merged) == 1
+    assert merged[0].metadata.text == FIRST + SECOND[len("ما غلب على ريحه وطعمه ولونه"):]
+    assert merged[0].score == 0.9
+    assert merged[0].merged_ids == ["1_5_2", "1_5_3"]
+
+
+def test_consecutive_chunks_without_overlap_are_joined():
+    docs = [make_doc("1_5_2", "الفصل الأول في المياه"), make_doc("1_5_3", "الفصل الثاني في الآنية")]
+    merged = merge_overlapping_documents(docs)
+    assert [doc.metadata.text for doc in merged] == ["الفصل الأول في المياه الفصل الثاني في الآنية"]
+    assert merged[0].merged_ids == ["1_5_2", "1_5_3"]
+
+
+def test_merged_passage_covers_the_page_rows_of_its_chunks():
+    first, second = make_doc("1_5_2", "الفصل الأول في المياه"), make_doc("1_5_3", "الفصل الثاني في الآنية")
+    first.metadata.page_row_start, first.metadata.page_row_end = 10, 11
+    second.metadata.page_row_start, second.metadata.page_row_end = 12, 12
+    merged = merge_overlapping_documents([second, first])
+    assert (merged[0].metadata.page_row_start, merged[0].metadata.page_row_end) == (10, 12)
+
+    second.metadata.page_row_start = second.metadata.page_row_end = None  # Part of a split page
+    merged = merge_overlapping_documents([first, second])
+    assert merged[0].metadata.page_row_start is None and merged[0].metadata.page_row_end is None
+
+
+def test_duplicates_across_books_keep_every_citation():
+    docs = [make_doc("1_5_2", FIRST, score=0.9), make_doc("2_8_1", "  " + FIRST, score=0.8, book_id="2"),
+            make_doc("3_1_1", SECOND, book_id="3")]
+    merged = merge_overlapping_documents(docs)
+    assert [doc.id for doc in merged] == ["1_5_2", "3_1_1"]
+    assert merged[0].merged_ids == ["1_5_2", "2_8_1"]
+    assert merged[1].merged_ids is None
+
+
+def test_unrelated_chunks_are_left_alone():
+    docs = [make_doc("1_5_2", "الفصل الأول في المياه", score=0.9), make_doc("1_5_7", "باب صفة الوضوء", score=0.8),
+            make_doc("1_6_3", "باب التيمم", section="باب آخر")]
+    merged = merge_overlapping_documents(docs)
+    assert merged == docs
+
+
+def test_legacy_section_ids_are_not_read_as_chunk_indices():
+    # "{category}_{book}_{section}" ids: neighbouring sections that share a generic title
+    docs = [make_doc("3_1_41", "الفصل الأول في المياه", section="فصل", chunk_index=None),
+            make_doc("3_1_42", "الفصل الثاني في الآنية", section="فصل", chunk_index=None)]
+    assert merge_overlapping_documents(docs) == docs
@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core import document_processor
+from app.core.document_processor import (
+    DocumentFetcher, chunk_text, extract_shamela_metadata, iter_chunk_spans, parse_document
+)
+from app.utils.helpers import estimate_tokens
+
+HTML = """
+<html><body>
+  <h1 class="book-title">كتاب الطهارة</h1>
+  <span class="author-name">ابن قدامة</span>
+  <a class="category-tag">فقه</a>
+  <div class="main-content">باب المياه. الماء طهور.</div>
+</body></html>
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_validator_cache():
+    document_processor._validator_cache.clear()
+    yield
+    document_processor._validator_cache.clear()
+
+
+def test_parse_document_parses_once(mocker):
+    soup_spy = mocker.spy(document_processor, "BeautifulSoup")
+    chunks, metadata = parse_document("https://shamela.ws/book/1/2", HTML)
+
+    assert soup_spy.call_count == 1
+    assert metadata == {"book_name": "كتاب الطهارة", "author": "ابن قدامة", "topics": "فقه"}
+    assert chunks[0]["text"] == "باب المياه. الماء طهور."
+    assert chunks[0]["metadata"]["source_url"] == "https://shamela.ws/book/1/2"
+    # extract_shamela_metadata still accepts raw HTML
+    assert extract_shamela_metadata(HTML)["book_name"] == "كتاب الطهارة"
+
+
+def test_fetcher_uses_conditional_get():
+    seen_headers = []
+
+    def handler(request):
+        seen_headers.append(dict(request.headers))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text=HTML, headers={"ETag": '"v1"'})
+
+    async def run():
+        async with DocumentFetcher(transport=httpx.MockTransport(handler)) as fetcher:
+            first = await fetcher.fetch("https://shamela.ws/book/1")
+            second = await fetcher.fetch("https://shamela.ws/book/1")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == HTML
+    assert "if-none-match" not in seen_headers[0]
+    assert seen_headers[1]["if-none-match"] == '"v1"'
+
+
+def test_fetcher_limits_concurrency_per_host():
+    active = {"now": 0, "peak": 0}
+
+    async def handler(request):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(200, text=request.url.path)
+
+    async def run():
+        async with DocumentFetcher(per_host_concurrency=2, transport=httpx.MockTransport(handler)) as fetcher:
+            urls = [f"https://shamela.ws/page/{i}" for i in range(8)] + ["https://shamela.ws/missing"]
+            return await fetcher.fetch_many(urls)
+
+    results = asyncio.run(run())
+    assert results[:8] == [f"/page/{i}" for i in range(8)]
+    assert results[8] is None
+    assert active["peak"] == 2
+
+
+def test_chunk_spans_cut_on_arabic_sentence_boundaries():
+    text = ("كلمة " * 15 + "هل هذا صحيح؟ ") * 10
+    spans = list(iter_chunk_spans(text, max_size=120, overlap=20))
+    assert len(spans) > 1
+    for start, end in spans[:-1]:
+        assert end - start <= 120
+        assert text[end - 1] == "؟"
+    # Offsets slice the original text; consecutive chunks overlap and always move forward
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert start < next_start < end
+
+
+def test_chunk_spans_make_progress_without_boundaries():
+    text = "x" * 2500
+    assert list(iter_chunk_spans(text, max_size=1000, overlap=900)) == [(0, 1000), (500, 1500), (1000, 2000),
+                                                                       (1500, 2500)]
+    assert list(iter_chunk_spans("   ")) == []
+
+
+def test_chunk_spans_token_budget():
+    text = "باب المياه، الماء طهور. " * 400
+    spans = list(iter_chunk_spans(text, max_size=50, overlap=5, unit="tokens"))
+    assert all(estimate_tokens(text[start:end]) <= 50 for start, end in spans)
+    assert spans[-1][1] == len(text.rstrip())
+    with pytest.raises(ValueError):
+        next(iter_chunk_spans(text, unit="words"))
+
+
+def test_chunk_text_collapses_whitespace_per_chunk():
+    assert chunk_text("باب   المياه\n\nالماء  طهور") == ["باب المياه الماء طهور"]
+    assert chunk_text("") == []
@@ -0,0 +1,82 @@
+import json
+import numpy as np
+import pytest
+
+from app.core.embedding_store import EmbeddingStore
+
+
+def test_append_and_reopen_with_mmap(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=3, shard_rows=2)
+    vectors = np.arange(15, dtype=np.float32).reshape(5, 3)
+    store.append([f"c{i}" for i in range(5)], [f"h{i}" for i in range(5)], vectors,
+                 metadata=[{"text": f"t{i}"} for i in range(5)])
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 5
+    assert reopened.shard_names == ["shard_00000", "shard_00001", "shard_00002"]
+    shard = reopened.load_vectors("shard_00001")
+    assert isinstance(shard, np.memmap)
+    np.testing.assert_array_equal(shard, vectors[2:4])
+    assert reopened.hashes() == {f"h{i}" for i in range(5)}
+    rows = [row for row, _ in reopened.iter_rows()]
+    assert rows[4] == {"id": "c4", "hash": "h4", "metadata": {"text": "t4"}}
+
+
+def test_append_rejects_bad_vectors(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=2)
+    with pytest.raises(ValueError):
+        store.append(["a"], ["h"], [[1.0, 2.0, 3.0]])
+    with pytest.raises(ValueError, match="NaN"):
+        store.append(["a", "b"], ["h1", "h2"], [[1.0, 2.0], [np.nan, 0.0]])
+    assert len(store) == 0
+
+
+def test_float16_store_and_validate(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=2, dtype="float16")
+    store.append(["a", "b"], ["h1", "h2"], [[0.5, 1.0], [2.0, 4.0]])
+    assert store.load_vectors("shard_00000").dtype == np.float16
+
+    # Corrupt the shard behind the store's back; validate() finds it
+    np.save(tmp_path / "shard_00000.npy", np.array([[0.5, np.inf]], dtype=np.float16))
+    report = EmbeddingStore(str(tmp_path)).validate()
+    assert report["bad_rows"] == [0]
+    assert report["bad_shards"][0]["shard"] == "shard_00000"
+
+
+def test_manifest_mismatch_raises(tmp_path):
+    EmbeddingStore(str(tmp_path), dim=2).append(["a"], ["h"], [[1.0, 2.0]])
+    assert json.loads((tmp_path / "manifest.json").read_text())["dim"] == 2
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), dim=4)
+
+
+def test_small_appends_fill_the_last_shard(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=2, shard_rows=4)
+    vectors = np.arange(20, dtype=np.float32).reshape(10, 2)
+    for start in range(0, 10, 3):
+        end = min(start + 3, 10)
+        store.append([f"c{i}" for i in range(start, end)], [f"h{i}" for i in range(start, end)], vectors[start:end])
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert reopened.shard_names == ["shard_00000", "shard_00001", "shard_00002"]
+    assert [len(reopened.load_rows(name)) for name in reopened.shard_names] == [4, 4, 2]
+    np.testing.assert_array_equal(np.load(tmp_path / "shard_00001.npy"), vectors[4:8])
+    np.testing.assert_array_equal(np.vstack([v for _, _, v in reopened.iter_shards()]), vectors)
+    assert [row["id"] for row, _ in reopened.iter_rows()] == [f"c{i}" for i in range(10)]
+    assert reopened.validate()["bad_shards"] == []
+
+
+def test_rows_past_the_manifest_are_ignored_and_overwritten(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=2, shard_rows=4)
+    store.append(["a"], ["ha"], [[1.0, 2.0]])
+    # An append interrupted before its manifest write leaves extra bytes behind
+    with open(tmp_path / "shard_00000.npy", "ab") as f:
+        f.write(np.array([[9.0, 9.0]], dtype=np.float32).tobytes())
+    with open(tmp_path / "shard_00000.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"id": "junk", "hash": "hj"}\n')
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened.load_vectors("shard_00000")) == 1
+    reopened.append(["b"], ["hb"], [[3.0, 4.0]])
+    np.testing.assert_array_equal(np.load(tmp_path / "shard_00000.npy"), [[1.0, 2.0], [3.0, 4.0]])
+    assert [row["id"] for row, _ in EmbeddingStore(str(tmp_path)).iter_rows()] == ["a", "b"]
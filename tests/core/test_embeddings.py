@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from mistralai.models import SDKError
+
+from app.config.settings import settings
+from app.core.embeddings import (
+    EmbeddingRateLimiter, QueryEmbeddingBatcher, embed_texts_batched, get_embedding_rate_limiter,
+    get_query_rate_limiter, pack_batches
+)
+
+
+def _response(inputs):
+    return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(text))]) for text in inputs])
+
+
+@pytest.fixture
+def unlimited():
+    return EmbeddingRateLimiter(requests_per_minute=10_000, tokens_per_minute=10**9)
+
+
+def test_pack_batches_respects_token_and_item_limits():
+    assert pack_batches([5, 5, 5, 5], max_tokens=10, max_items=10) == [[0, 1], [2, 3]]
+    assert pack_batches([1, 1, 1], max_tokens=100, max_items=2) == [[0, 1], [2]]
+    # An oversized text is isolated instead of blocking the rest
+    assert pack_batches([3, 50, 3], max_tokens=10, max_items=10) == [[0], [1], [2]]
+
+
+def test_rate_limiter_waits_for_window():
+    now = [0.0]
+    limiter = EmbeddingRateLimiter(requests_per_minute=2, tokens_per_minute=100, clock=lambda: now[0])
+
+    assert limiter.try_acquire(10) == 0.0
+    assert limiter.try_acquire(95) > 0  # token budget exhausted
+    assert limiter.try_acquire(10) == 0.0
+    assert limiter.try_acquire(1) == pytest.approx(60.0)  # request budget exhausted
+    now[0] = 61.0
+    assert limiter.try_acquire(95) == 0.0
+
+
+def test_rate_limiter_treats_non_positive_limits_as_unlimited():
+    limiter = EmbeddingRateLimiter(requests_per_minute=0, tokens_per_minute=-1)
+    assert all(limiter.try_acquire(10**6) == 0.0 for _ in range(100))
+    limiter = EmbeddingRateLimiter(requests_per_minute=1, tokens_per_minute=0)
+    assert limiter.try_acquire(10**6) == 0.0
+    assert limiter.try_acquire(1) > 0  # Request limit still applies
+
+
+def test_query_limiter_is_separate_from_ingestion():
+    query_limiter = get_query_rate_limiter()
+    assert query_limiter is not get_embedding_rate_limiter()
+    assert query_limiter.requests_per_minute == settings.QUERY_EMBEDDING_REQUESTS_PER_MINUTE
+
+
+def test_embed_texts_batched_preserves_order(mocker, unlimited):
+    client = MagicMock()
+    client.embeddings.create.side_effect = lambda model, inputs: _response(inputs)
+    mocker.patch("app.core.embeddings.ensure_mistral_client", return_value=client)
+
+    texts = ["a" * n for n in range(1, 40)]
+    embeddings = embed_texts_batched(texts, max_workers=3, limiter=unlimited)
+
+    assert embeddings == [[float(len(text))] for text in texts]
+
+
+def test_embed_texts_batched_splits_only_failing_sub_batch(mocker, unlimited):
+    client = MagicMock()
+
+    def create(model, inputs):
+        if "bad" in inputs:
+            raise SDKError("invalid input", status_code=400)
+        return _response(inputs)
+
+    client.embeddings.create.side_effect = create
+    mocker.patch("app.core.embeddings.ensure_mistral_client", return_value=client)
+
+    embeddings = embed_texts_batched(["one", "bad", "three", "four"], max_workers=1,
+                                     limiter=unlimited, base_delay=0)
+
+    assert embeddings == [[3.0], None, [5.0], [4.0]]
+
+
+def test_query_batcher_coalesces_concurrent_requests(mocker, unlimited):
+    client = MagicMock()
+    client.embeddings.create.side_effect = lambda model, inputs: _response(inputs)
+    mocker.patch("app.core.embeddings.ensure_mistral_client", return_value=client)
+    batcher = QueryEmbeddingBatcher(max_batch_size=8, max_wait_ms=50, limiter=unlimited)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed_async("q" * n) for n in range(1, 9)))
+
+    assert asyncio.run(run()) == [[float(n)] for n in range(1, 9)]
+    assert client.embeddings.create.call_count == 1
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["items"] == 8
+    assert stats["buckets"]["4"] == 0 and stats["buckets"]["8"] == 1 and stats["buckets"]["+Inf"] == 1
+
+
+def test_query_batcher_defaults_to_the_query_limiter(mocker):
+    client = MagicMock()
+    client.embeddings.create.side_effect = lambda model, inputs: _response(inputs)
+    mocker.patch("app.core.embeddings.ensure_mistral_client", return_value=client)
+    ingestion = mocker.patch.object(get_embedding_rate_limiter(), "acquire")
+    query = mocker.patch.object(get_query_rate_limiter(), "acquire")
+
+    assert QueryEmbeddingBatcher(max_wait_ms=0).embed("سؤال") == [4.0]
+    query.assert_called_once()
+    ingestion.assert_not_called()
+
+
+def test_query_batcher_returns_none_on_rejected_input(mocker, unlimited):
+    client = MagicMock()
+    client.embeddings.create.side_effect = SDKError("invalid input", status_code=400)
+    mocker.patch("app.core.embeddings.ensure_mistral_client", return_value=client)
+    batcher = QueryEmbeddingBatcher(max_batch_size=4, max_wait_ms=0, limiter=unlimited)
+
+    assert batcher.embed("bad") is None
+    assert batcher.stats()["batches"] == 1
+
+
+def test_embedded_text_is_normalized_only_when_opted_in(mocker, unlimited):
+    client = MagicMock()
+    client.embeddings.create.side_effect = lambda model, inputs: _response(inputs)
+    mocker.patch("app.core.embeddings.ensure_mistral_client", return_value=client)
+
+    embed_texts_batched(["الصَّلاةُ  عَلَى"], limiter=unlimited)
+    assert client.embeddings.create.call_args.kwargs["inputs"] == ["الصَّلاةُ عَلَى"]
+
+    mocker.patch.object(settings, "NORMALIZATION_PROFILE", "search")
+    embed_texts_batched(["الصَّلاةُ  عَلَى"], limiter=unlimited)
+    assert client.embeddings.create.call_args.kwargs["inputs"] == ["الصلاه علي"]
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from app.core.jobs import CANCELLED, COMPLETED, FAILED, QUEUED, JobManager
+
+
+def wait_for_status(manager, job_id, *statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job stayed {manager.get(job_id)['status']}")
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    managers = []
+
+    def make(handler):
+        manager = JobManager(str(tmp_path / "jobs.sqlite"), handler=handler, index_factory=lambda: "index", workers=1)
+        manager.start()
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.stop()
+
+
+def test_job_runs_items_and_reports_progress(make_manager):
+    seen = []
+
+    def handler(payload, index):
+        seen.append((payload["text_content"], index))
+        return {"chunks": 2, "vectors": 2}
+
+    manager = make_manager(handler)
+    job_id = manager.submit([{"text_content": "أ"}, {"text_content": "ب"}])
+    job = wait_for_status(manager, job_id, COMPLETED)
+
+    assert seen == [("أ", "index"), ("ب", "index")]
+    assert job["processed_documents"] == 2 and job["failed_documents"] == 0
+    assert job["chunks"] == 4 and job["vectors"] == 4
+
+
+def test_failed_items_are_reported_and_retried(make_manager):
+    attempts = {"count": 0}
+
+    def handler(payload, index):
+        if payload["text_content"] == "bad" and attempts["count"] == 0:
+            attempts["count"] += 1
+            raise RuntimeError("embedding failed")
+        return {"chunks": 1, "vectors": 1}
+
+    manager = make_manager(handler)
+    job_id = manager.submit([{"text_content": "ok"}, {"text_content": "bad"}])
+    job = wait_for_status(manager, job_id, FAILED)
+    assert job["failed_documents"] == 1
+    assert job["errors"] == ["Document 1: embedding failed"]
+
+    manager.retry(job_id)
+    job = wait_for_status(manager, job_id, COMPLETED)
+    assert job["processed_documents"] == 2 and job["failed_documents"] == 0 and job["vectors"] == 2
+
+
+def test_cancel_stops_before_next_item(make_manager):
+    started, release = threading.Event(), threading.Event()
+
+    def handler(payload, index):
+        started.set()
+        release.wait(5)
+        return {"chunks": 1, "vectors": 1}
+
+    manager = make_manager(handler)
+    job_id = manager.submit([{"text_content": str(i)} for i in range(5)])
+    assert started.wait(5)
+    manager.cancel(job_id)
+    release.set()
+    job = wait_for_status(manager, job_id, CANCELLED)
+    assert job["processed_documents"] == 1
+
+    with pytest.raises(ValueError):
+        manager.retry(manager.submit([{"text_content": "x"}]))  # Still queued or running
+
+
+def test_unfinished_jobs_resume_on_start(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite")
+    stopped = JobManager(db_path, handler=lambda payload, index: {}, index_factory=lambda: None)
+    job_id = stopped.submit([{"text_content": "x"}])  # Never started: stays queued
+    assert stopped.get(job_id)["status"] == QUEUED
+
+    manager = JobManager(db_path, handler=lambda payload, index: {"chunks": 1, "vectors": 1},
+                         index_factory=lambda: None)
+    manager.start()
+    try:
+        assert wait_for_status(manager, job_id, COMPLETED)["vectors"] == 1
+    finally:
+        manager.stop()
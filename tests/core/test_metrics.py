@@ -0,0 +1,64 @@
+import os
+
+from app.core.metrics import MetricsRegistry, read_other_snapshots, remove_stale_snapshots, write_snapshot
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ("route", "status"))
+    latency = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    in_flight = registry.gauge("in_flight", "In flight.")
+    requests.inc(route="/chat", status=200)
+    requests.inc(2, route="/chat", status=200)
+    requests.inc(route='/a"b', status=429)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage="embed")
+    with in_flight.track_inprogress():
+        in_flight.inc()
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/chat",status="200"} 3.0' in text
+    assert 'requests_total{route="/a\\"b",status="429"} 1.0' in text
+    assert 'latency_seconds_bucket{stage="embed",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="embed",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{stage="embed",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{stage="embed"} 5.55' in text
+    assert 'latency_seconds_count{stage="embed"} 3' in text
+    assert "in_flight 1.0" in text
+
+
+def test_disabled_metrics_record_nothing(mocker):
+    from app.config.settings import settings
+    mocker.patch.object(settings, "METRICS_ENABLED", False)
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.").inc()
+    assert "\nrequests_total " not in registry.render()
+
+
+def test_worker_snapshots_are_merged(tmp_path):
+    other = MetricsRegistry()
+    other.counter("requests_total", "Requests.", ("route",)).inc(4, route="/chat")
+    other.gauge("in_flight", "In flight.").inc(2)
+    other.histogram("latency_seconds", "Latency.", buckets=(1.0,)).observe(0.5)
+    write_snapshot(other, str(tmp_path))
+    # Pretend the snapshot came from another live worker (our parent) and from one that exited
+    own = tmp_path / f"metrics_{os.getpid()}.json"
+    (tmp_path / f"metrics_{os.getppid()}.json").write_text(own.read_text())
+    own.rename(tmp_path / "metrics_999999999.json")
+
+    mine = MetricsRegistry()
+    mine.counter("requests_total", "Requests.", ("route",)).inc(route="/chat")
+    text = mine.render(read_other_snapshots(str(tmp_path)))
+    assert 'requests_total{route="/chat"} 5.0' in text  # Only the live worker is summed
+    assert "in_flight 2.0" in text
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in text
+    assert not (tmp_path / "metrics_999999999.json").exists()  # The exited worker's file is deleted
+
+
+def test_stale_snapshots_are_removed(tmp_path):
+    for pid in (os.getpid(), os.getppid(), 999999999):
+        (tmp_path / f"metrics_{pid}.json").write_text("{}")
+    (tmp_path / "metrics_999999998.json.tmp").write_text("{")
+    assert remove_stale_snapshots(str(tmp_path)) == 3  # Ours (reused PID), the dead one and its leftover
+    assert [path.name for path in tmp_path.iterdir()] == [f"metrics_{os.getppid()}.json"]
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from app.core import page_store
+from app.core.page_store import PageStore, build_page_store, resolve_chunk_text
+
+
+@pytest.fixture
+def pages_db(tmp_path):
+    """Two books; book 2 has a deleted page and a gap in its chunk ids."""
+    db_path = tmp_path / "shamela_robust.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE books (book_id INTEGER PRIMARY KEY, book_name TEXT)")
+    for book_id in (1, 2):
+        conn.execute("INSERT INTO books VALUES (?, ?)", (book_id, f"كتاب {book_id}"))
+        conn.execute(f"CREATE TABLE b{book_id} (chunk_id INTEGER PRIMARY KEY, content TEXT, page INTEGER, "
+                     f"is_deleted INTEGER)")
+    for chunk_id in range(1, 301):
+        conn.execute("INSERT INTO b1 VALUES (?, ?, ?, 0)",
+                     (chunk_id, f"باب المياه  الصفحة {chunk_id}\n" + "الماء طهور " * 40, chunk_id))
+    conn.executemany("INSERT INTO b2 VALUES (?, ?, ?, ?)", [
+        (10, "مقدمة", 1, 0), (11, "محذوف", 2, 1), (13, "فصل في الآنية", 3, 0),
+    ])
+    conn.commit()
+    conn.close()
+    return str(db_path)
+
+
+def test_build_and_lookup(pages_db, tmp_path):
+    output = str(tmp_path / "page_store")
+    stats = build_page_store(pages_db, output)
+    assert stats["books"] == 2 and stats["pages"] == 302
+    assert stats["blocks"] > 2
+    assert stats["compressed_bytes"] < stats["raw_bytes"] / 4
+
+    store = PageStore(output)
+    assert len(store) == 302
+    assert store.get(1, 150) == "باب المياه الصفحة 150 " + " ".join(["الماء طهور"] * 40)
+    assert store.page_number(1, 150) == 150
+    assert store.get(2, 13) == "فصل في الآنية"
+    # Deleted rows, gaps and unknown books
+    assert store.get(2, 11) is None
+    assert store.get(2, 12) is None
+    assert store.get(2, 99) is None
+    assert store.get(3, 1) is None
+    store.close()
+
+
+def test_neighbours_skip_missing_pages(pages_db, tmp_path):
+    output = str(tmp_path / "page_store")
+    build_page_store(pages_db, output, book_ids=[2])
+    store = PageStore(output)
+    assert store.neighbours(2, 11, before=1, after=2) == [(10, "مقدمة"), (13, "فصل في الآنية")]
+    assert store.neighbours(1, 1) == []
+    store.close()
+
+
+def test_chunk_text_joins_a_page_range(pages_db, tmp_path):
+    output = str(tmp_path / "page_store")
+    build_page_store(pages_db, output, book_ids=[2])
+    store = PageStore(output)
+    assert store.pages(2, 10, 13) == [(10, "مقدمة"), (13, "فصل في الآنية")]
+    assert store.chunk_text(2, 10, 13) == "مقدمة\nفصل في الآنية"
+    assert store.chunk_text(2, 11, 12) is None
+    store.close()
+
+
+def test_resolve_chunk_text_uses_the_configured_store(pages_db, tmp_path, mocker):
+    output = str(tmp_path / "page_store")
+    mocker.patch.object(page_store.settings, "PAGE_STORE_PATH", output)
+    mocker.patch.object(page_store, "_store", None)
+    assert resolve_chunk_text(2, 10, 10) is None  # Not built yet
+
+    build_page_store(pages_db, output, book_ids=[2])
+    assert resolve_chunk_text(2.0, 13.0, 13.0) == "فصل في الآنية"  # Pinecone returns floats
+    assert resolve_chunk_text(2, None, 13) is None
+    page_store._store.close()
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.config.settings import settings
+from app.core.profiling import LoopLagMonitor, ProfilerBusy, sample_stacks, to_collapsed, to_speedscope
+
+
+def busy_wait(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_monitor_logs_the_stack_of_a_blocking_callback(caplog):
+    async def main():
+        monitor = LoopLagMonitor(interval=0.01, threshold_ms=50)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.2)  # Blocks the loop
+        await asyncio.sleep(0.03)
+        monitor.stop()
+        return monitor
+
+    with caplog.at_level("WARNING", logger="app.core.profiling"):
+        monitor = asyncio.run(main())
+
+    assert monitor.stalls >= 1
+    assert monitor.stats()["max_lag_ms"] >= 150
+    stall_logs = [record.getMessage() for record in caplog.records if "Event loop blocked" in record.getMessage()]
+    assert len(stall_logs) == monitor.stalls and "in main" in stall_logs[0] and "time.sleep(0.2)" in stall_logs[0]
+
+
+def test_sampling_profiler_finds_the_busy_function():
+    worker = threading.Thread(target=busy_wait, args=(0.3,), name="busy-worker")
+    worker.start()
+    samples = sample_stacks(0.15, interval=0.005, thread_ids={worker.ident})
+    worker.join()
+
+    assert samples and all(thread_name == "busy-worker" for thread_name, _ in samples)
+    collapsed = to_collapsed(samples)
+    assert collapsed.startswith("busy-worker;") and "busy_wait (" in collapsed
+
+    document = to_speedscope(samples, 0.005)
+    json.dumps(document)
+    (profile,) = document["profiles"]
+    assert profile["type"] == "sampled" and profile["name"] == "busy-worker"
+    assert "busy_wait" in {document["shared"]["frames"][i]["name"] for i in profile["samples"][0]}
+    assert profile["endValue"] == pytest.approx(sum(profile["weights"]))
+
+
+def test_only_one_profile_runs_at_a_time(mocker):
+    mocker.patch.object(settings, "PROFILE_MAX_SECONDS", 0.2)
+    started = threading.Event()
+    first = threading.Thread(target=lambda: (started.set(), sample_stacks(10, interval=0.01)))
+    first.start()
+    started.wait()
+    time.sleep(0.02)
+    with pytest.raises(ProfilerBusy):
+        sample_stacks(0.01)
+    first.join()  # Capped at PROFILE_MAX_SECONDS
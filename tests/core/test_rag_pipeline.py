@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.rag_pipeline import (
+    NO_DOCUMENTS_RESPONSE, RETRIEVAL_ERROR_RESPONSE, PipelineContext, RagPipeline, get_rag_pipeline
+)
+from app.models.schemas import DocumentMatch, DocumentMetadata, HistoryMessage
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def retriever(mocker):
+    retriever = mocker.AsyncMock()
+    retriever.retrieve.return_value = [
+        DocumentMatch(id="1_2_3", score=0.4, metadata=DocumentMetadata(text="الماء طهور", book_id="1")),
+        DocumentMatch(id="4_5_6", score=0.9, metadata=DocumentMetadata(text="باب الوضوء", book_id="4")),
+    ]
+    mocker.patch("app.core.rag_pipeline.get_retriever", return_value=retriever)
+    return retriever
+
+
+@pytest.fixture
+def mistral(mocker):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"choices": [{"message": {"content": "الجواب"}}]}
+    return mocker.patch("app.core.rag_pipeline.call_mistral_with_retry", return_value=response)
+
+
+async def test_run_records_every_stage(retriever, mistral):
+    ctx = PipelineContext(query="ما حكم الوضوء؟",
+                          frontend_history=[HistoryMessage(role="user", content="سؤال سابق")])
+    await RagPipeline().run(ctx)
+
+    assert ctx.response == "الجواب" and ctx.error_detail is None
+    assert [source["document_id"] for source in ctx.sources] == ["4_5_6", "1_2_3"]
+    assert "Human: سؤال سابق" in mistral.call_args.args[0]
+    assert [record.name for record in ctx.stages] == [
+        "history", "store_query", "retrieve", "rerank", "pack", "generate", "persist"]
+    assert all(record.status == "ok" for record in ctx.stages)
+    assert ctx.stages[0].cache == {"source": "frontend", "messages": 1}
+    assert set(ctx.stages[4].cache) == {"token_count_hits", "token_count_misses"}
+    assert set(ctx.timings()) == {record.name for record in ctx.stages}
+
+
+async def test_retrieval_failure_stops_with_friendly_response(retriever, mistral):
+    retriever.retrieve.side_effect = RuntimeError("index unavailable")
+    ctx = await RagPipeline().run(PipelineContext(query="سؤال"))
+
+    assert ctx.response == RETRIEVAL_ERROR_RESPONSE
+    assert ctx.error_detail == "Retrieve error: index unavailable"
+    assert [record.status for record in ctx.stages] == ["ok", "ok", "failed", "skipped", "skipped", "skipped", "ok"]
+    mistral.assert_not_called()
+
+
+async def test_require_documents_stops_before_generation(retriever, mistral):
+    retriever.retrieve.return_value = []
+    ctx = await get_rag_pipeline().run(PipelineContext(query="سؤال", require_documents=True))
+    assert ctx.response == NO_DOCUMENTS_RESPONSE and ctx.error_detail is None
+    mistral.assert_not_called()
+
+
+async def test_stream_falls_back_and_emits_events_in_order(mocker, retriever):
+    async def failing(prompt):
+        raise ConnectionError("down")
+        yield  # pragma: no cover
+
+    async def gemini(prompt):
+        for token in ("الج", "واب"):
+            yield token
+
+    mocker.patch("app.core.rag_pipeline.call_mistral_streaming", failing)
+    mocker.patch("app.core.rag_pipeline.call_gemini_streaming", gemini)
+    ctx = PipelineContext(query="سؤال")
+    events = [event async for event in RagPipeline().stream(ctx)]
+
+    assert [name for name, _ in events] == ["chunk", "chunk", "sources"]
+    assert events[0][1] == {"token": "الج"}
+    assert ctx.response == "الجواب" and ctx.fallback_used
+
+
+async def test_authenticated_requests_load_history_and_persist(mocker, retriever, mistral):
+    db = MagicMock()
+    db.list_documents.return_value = {"documents": [
+        {"$id": "m1", "conversation_id": "c1", "user_id": "u1", "content": "سؤال سابق",
+         "message_type": "user", "timestamp": "2025-01-01T00:00:00"},
+    ]}
+    store = mocker.patch("app.core.rag_pipeline.store_message",
+                         side_effect=lambda **kwargs: {"message_id": f"{kwargs['message_type']}_id"})
+    mocker.patch("app.core.rag_pipeline.update_conversation_timestamp")
+    ctx = await RagPipeline().run(PipelineContext(query="سؤال", db=db, user_id="u1", conversation_id="c1",
+                                                  is_anonymous=False))
+
+    assert "User: سؤال سابق" in mistral.call_args.args[0]
+    assert [call.kwargs["message_type"] for call in store.call_args_list] == ["user", "ai"]
+    assert store.call_args_list[1].kwargs["sources"] == ctx.sources
+    assert (ctx.user_message_id, ctx.ai_message_id) == ("user_id", "ai_id")
+
+
+async def test_stream_stores_the_question_first_and_only_answers_the_client_saw(mocker, retriever):
+    retriever.retrieve.side_effect = RuntimeError("index unavailable")
+    calls = []
+    mocker.patch("app.core.rag_pipeline.store_message",
+                 side_effect=lambda **kwargs: calls.append(kwargs["message_type"]) or {"message_id": "m"})
+    mocker.patch("app.core.rag_pipeline.update_conversation_timestamp",
+                 side_effect=lambda db, conversation_id: calls.append("timestamp"))
+    ctx = PipelineContext(query="سؤال", db=MagicMock(), user_id="u1", conversation_id="c1", is_anonymous=False)
+    events = [event async for event in RagPipeline().stream(ctx)]
+
+    assert [name for name, _ in events] == ["error"]
+    assert calls == ["user", "timestamp", "timestamp"]  # No AI message for text the client never received
+    assert ctx.ai_message_id is None
+
+
+async def test_timestamp_is_updated_when_storing_the_answer_fails(mocker, retriever, mistral):
+    def store(**kwargs):
+        if kwargs["message_type"] == "ai":
+            raise ConnectionError("appwrite down")
+        return {"message_id": "user_id"}
+
+    mocker.patch("app.core.rag_pipeline.store_message", side_effect=store)
+    update = mocker.patch("app.core.rag_pipeline.update_conversation_timestamp")
+    ctx = await RagPipeline().run(PipelineContext(query="سؤال", db=MagicMock(), user_id="u1", conversation_id="c1",
+                                                  is_anonymous=False))
+    assert ctx.user_message_id == "user_id" and ctx.ai_message_id is None
+    assert update.call_count == 2
@@ -0,0 +1,37 @@
+import asyncio
+
+from app.config.settings import settings
+from app.core.timing import current_timings, end_request, record, start_request, timed
+
+
+def test_disabled_timing_records_nothing(mocker):
+    mocker.patch.object(settings, "SERVER_TIMING_ENABLED", False)
+    timings, token = start_request()
+    assert timings is None and token is None
+    with timed("embed"):
+        record("llm", 5.0)
+    assert current_timings() is None
+
+
+def test_durations_are_summed_and_rendered_as_server_timing(mocker):
+    mocker.patch.object(settings, "SERVER_TIMING_ENABLED", True)
+    timings, token = start_request()
+    try:
+        record("embed", 10.0)
+        record("embed", 2.5)
+        with timed("vector_search"):
+            pass
+
+        async def in_task_and_thread():
+            await asyncio.to_thread(record, "persist", 4.0)
+
+        asyncio.run(in_task_and_thread())
+    finally:
+        end_request(token)
+
+    durations = timings.as_dict()
+    assert list(durations) == ["embed", "vector_search", "persist", "total"]
+    assert durations["embed"] == 12.5 and durations["persist"] == 4.0
+    header = timings.header_value()
+    assert header.startswith('embed;dur=12.5;desc="Query embedding", vector_search;dur=')
+    assert current_timings() is None
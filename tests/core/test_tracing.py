@@ -0,0 +1,110 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.config.settings import settings
+from app.core.tracing import (
+    CLIENT, NOOP_SPAN, OtlpJsonExporter, configure_tracing, current_span, parse_traceparent, propagate,
+    shutdown_tracing, span, traced
+)
+
+
+@pytest.fixture
+def trace_file(tmp_path, mocker):
+    mocker.patch.object(settings, "TRACE_OTLP_ENDPOINT", "")
+    path = tmp_path / "traces.jsonl"
+    configure_tracing(enabled=True, jsonl_path=str(path), sample_rate=1.0)
+    yield path
+    shutdown_tracing()
+
+
+def read_spans(path):
+    shutdown_tracing()  # Flushes the export queue
+    return {record["name"]: record for record in map(json.loads, path.read_text(encoding="utf-8").splitlines())}
+
+
+def test_spans_are_noops_until_tracing_is_configured():
+    with span("pinecone.query", top_k=5) as query_span:
+        query_span.set_attribute("result_count", 3)
+    assert query_span is NOOP_SPAN
+    assert current_span() is NOOP_SPAN
+
+
+def test_spans_nest_across_tasks_threads_and_thread_pools(trace_file):
+    @traced("mistral.embed", kind=CLIENT)
+    def embed_batch(size):
+        current_span().set_attribute("inputs", size)
+
+    async def request():
+        with span("rag.retrieve", top_k=5):
+            await asyncio.to_thread(embed_batch, 2)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(propagate(span_in_pool)).result()
+
+    def span_in_pool():
+        with span("pinecone.upsert", kind=CLIENT, vectors=10):
+            pass
+
+    with span("http.request") as root:
+        asyncio.run(request())
+
+    spans = read_spans(trace_file)
+    assert {record["trace_id"] for record in spans.values()} == {root.trace_id}
+    assert spans["http.request"]["parent_id"] is None
+    assert spans["rag.retrieve"]["parent_id"] == root.span_id
+    assert spans["mistral.embed"]["parent_id"] == spans["rag.retrieve"]["span_id"]
+    assert spans["mistral.embed"]["attributes"] == {"inputs": 2}
+    assert spans["mistral.embed"]["kind"] == "client"
+    assert spans["pinecone.upsert"]["parent_id"] == root.span_id
+
+
+def test_exceptions_mark_the_span_as_error(trace_file):
+    with pytest.raises(ValueError):
+        with span("gemini.chat"):
+            raise ValueError("blocked")
+    record = read_spans(trace_file)["gemini.chat"]
+    assert record["status"] == "error" and record["status_message"] == "ValueError: blocked"
+    assert record["duration_ms"] >= 0
+
+
+def test_unsampled_roots_record_no_children(tmp_path, mocker):
+    mocker.patch.object(settings, "TRACE_OTLP_ENDPOINT", "")
+    path = tmp_path / "traces.jsonl"
+    configure_tracing(enabled=True, jsonl_path=str(path), sample_rate=0.0)
+    with span("http.request") as root:
+        with span("rag.pack") as child:
+            pass
+    shutdown_tracing()
+    assert root is NOOP_SPAN and child is NOOP_SPAN
+    assert not path.exists() or path.read_text() == ""
+
+
+def test_traceparent_continues_the_callers_trace(trace_file):
+    remote = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+    assert remote == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    assert parse_traceparent("garbage") is None
+    with span("http.request", remote_parent=remote):
+        pass
+    record = read_spans(trace_file)["http.request"]
+    assert record["trace_id"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert record["parent_id"] == "00f067aa0ba902b7"
+
+
+def test_otlp_payload_uses_typed_attributes(trace_file):
+    with span("pinecone.query", kind=CLIENT, top_k=5, filtered=True, score=0.5, index="books") as query_span:
+        pass
+    payload = OtlpJsonExporter("http://collector", "rag-backend").payload([query_span])
+    resource_spans = payload["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": "rag-backend"}}]
+    otlp_span = resource_spans["scopeSpans"][0]["spans"][0]
+    assert otlp_span["kind"] == 3 and otlp_span["traceId"] == query_span.trace_id
+    assert "parentSpanId" not in otlp_span
+    assert otlp_span["attributes"] == [
+        {"key": "top_k", "value": {"intValue": "5"}},
+        {"key": "filtered", "value": {"boolValue": True}},
+        {"key": "score", "value": {"doubleValue": 0.5}},
+        {"key": "index", "value": {"stringValue": "books"}},
+    ]
@@ -0,0 +1,106 @@
+import json
+import threading
+
+from app.core.chunk_text_store import ChunkTextStore
+from app.core.vector_upsert import VectorUpserter, estimate_vector_bytes, fit_metadata
+
+
+class FakeIndex:
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            if self.fail_times:
+                self.fail_times -= 1
+                raise RuntimeError("503 Service Unavailable")
+            self.calls.append([vector["id"] for vector in vectors])
+
+
+def make_vectors(count, dim=8, text="نص"):
+    return [{"id": f"v{i}", "values": [0.1] * dim, "metadata": {"text": text}} for i in range(count)]
+
+
+def test_fit_metadata_trims_text_on_character_boundary():
+    metadata = {"book_name": "كتاب", "text": "سلام " * 20000}
+    fitted = fit_metadata(metadata, max_bytes=1000)
+    assert len(json.dumps(fitted, ensure_ascii=False).encode("utf-8")) <= 1000
+    assert fitted["book_name"] == "كتاب"
+    assert fitted["text"] and "�" not in fitted["text"]
+    small = {"text": "قصير"}
+    assert fit_metadata(small) is small
+
+
+def test_batches_are_bounded_by_bytes_and_count():
+    vectors = make_vectors(50)
+    per_vector = estimate_vector_bytes(vectors[0])
+    upserter = VectorUpserter(FakeIndex(), concurrency=2, max_request_bytes=per_vector * 4, max_batch_vectors=3)
+    batches = list(upserter.iter_batches(vectors))
+    assert all(len(batch) <= 3 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 50
+
+    upserter = VectorUpserter(FakeIndex(), concurrency=2, max_request_bytes=per_vector * 4)
+    assert [len(batch) for batch in upserter.iter_batches(vectors[:9])] == [4, 4, 1]
+
+
+def test_upsert_retries_and_reports_throughput():
+    index = FakeIndex(fail_times=2)
+    upserter = VectorUpserter(index, concurrency=3, max_batch_vectors=10, base_delay=0.001)
+    stats = upserter.upsert(make_vectors(45))
+    assert stats["upserted"] == 45 and stats["failed"] == 0
+    assert stats["batches"] == 5
+    assert sorted(vector_id for call in index.calls for vector_id in call) == sorted(f"v{i}" for i in range(45))
+    assert stats["vectors_per_second"] > 0
+
+
+def test_failed_batches_are_counted():
+    upserter = VectorUpserter(FakeIndex(fail_times=100), concurrency=1, max_batch_vectors=10,
+                              max_retries=2, base_delay=0.001)
+    stats = upserter.upsert(make_vectors(15))
+    assert stats["upserted"] == 0 and stats["failed"] == 15
+
+
+def test_manifest_skips_completed_ids_on_rerun(tmp_path):
+    manifest_path = str(tmp_path / "manifest.sqlite")
+    first = VectorUpserter(FakeIndex(), concurrency=2, max_batch_vectors=10, manifest_path=manifest_path)
+    assert first.upsert(make_vectors(20))["upserted"] == 20
+    first.manifest.close()
+
+    index = FakeIndex()
+    second = VectorUpserter(index, concurrency=2, max_batch_vectors=10, manifest_path=manifest_path)
+    stats = second.upsert(make_vectors(25))
+    assert stats["skipped"] == 20 and stats["upserted"] == 5
+    assert sorted(vector_id for call in index.calls for vector_id in call) == [f"v{i}" for i in range(20, 25)]
+
+
+def test_slim_metadata_upserts_without_text_after_storing_it(tmp_path):
+    index = FakeIndex()
+    sent = []
+    text_store = ChunkTextStore(str(tmp_path / "chunk_text.sqlite"))
+    index.upsert = lambda vectors, namespace=None: sent.append(text_store.get_many([v["id"] for v in vectors]))
+    upserter = VectorUpserter(index, slim_metadata=True, max_batch_vectors=2, text_store=text_store)
+    batches = list(upserter.iter_batches(
+        [{"id": f"v{i}", "values": [0.1], "metadata": {"book_id": 1, "text": f"نص {i}"}} for i in range(3)]))
+    assert [[vector["metadata"] for vector in batch] for batch in batches] == [[{"book_id": 1}] * 2, [{"book_id": 1}]]
+    upserter.upsert([{"id": "v9", "values": [0.1], "metadata": {"book_id": 1, "text": "نص"}}])
+    assert sent == [{"v9": "نص"}]  # Text was in the store before the upsert was sent
+    assert len(text_store) == 4
+
+
+def test_manifest_reupserts_ids_whose_content_changed(tmp_path):
+    manifest_path = str(tmp_path / "manifest.sqlite")
+    vectors = [{"id": f"v{i}", "values": [0.1, 0.2], "metadata": {"content_hash": f"h{i}"}} for i in range(3)]
+    first = VectorUpserter(FakeIndex(), manifest_path=manifest_path)
+    first.upsert(vectors)
+    first.manifest.close()
+
+    vectors[1] = {"id": "v1", "values": [0.3, 0.4], "metadata": {"content_hash": "h1-edited"}}
+    vectors[2] = {"id": "v2", "values": [0.5, 0.6], "metadata": {}}  # No hash: compared by values
+    index = FakeIndex()
+    second = VectorUpserter(index, manifest_path=manifest_path)
+    stats = second.upsert(vectors)
+    assert stats["skipped"] == 1
+    assert sorted(vector_id for call in index.calls for vector_id in call) == ["v1", "v2"]
+    assert second.pending_vectors(vectors) == []
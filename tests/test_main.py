@@ -22,4 +22,52 @@ def test_read_root(client: TestClient):
 # def test_health_check(client: TestClient):
 #     response = client.get("/health") # Assuming you have a /health endpoint
 #     assert response.status_code == 200
-#     assert response.json() == {"status": "ok"}
\ No newline at end of file
+#     assert response.json() == {"status": "ok"}
+
+def test_server_timing_header(client: TestClient, mocker):
+    from app.config.settings import settings
+    mocker.patch.object(settings, "SERVER_TIMING_ENABLED", True)
+    response = client.get("/health")
+    assert "X-Process-Time" in response.headers
+    assert response.headers["Server-Timing"].startswith("total;dur=")
+
+    mocker.patch.object(settings, "SERVER_TIMING_ENABLED", False)
+    assert "Server-Timing" not in client.get("/health").headers
+
+
+def test_metrics_endpoint(client: TestClient):
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
+    assert "# TYPE stage_duration_seconds histogram" in response.text
+
+
+def test_request_span_covers_streamed_body(client: TestClient, mocker, tmp_path):
+    import json
+    from app.config.settings import settings
+    from app.core.tracing import configure_tracing, shutdown_tracing, span
+
+    class SpanningRetriever:
+        async def retrieve_by_vector(self, query_vector, top_k, filters=None):
+            with span("pinecone.query"):
+                return []
+
+    mocker.patch.object(settings, "TRACE_OTLP_ENDPOINT", "")
+    mocker.patch("app.api.endpoints.retrieval.get_retriever", return_value=SpanningRetriever())
+    mocker.patch("app.api.endpoints.retrieval.embed_texts_batched", return_value=[[0.0]])
+    path = tmp_path / "traces.jsonl"
+    configure_tracing(enabled=True, jsonl_path=str(path), sample_rate=1.0)
+    try:
+        response = client.post("/retrieval/batch", headers={"X-API-Key": "test-key"}, json={"queries": ["أ"]})
+    finally:
+        shutdown_tracing()  # Flushes the export queue
+
+    assert response.status_code == 200
+    spans = {record["name"]: record for record in map(json.loads, path.read_text(encoding="utf-8").splitlines())}
+    request_span, query_span = spans["http.request"], spans["pinecone.query"]
+    assert response.headers["X-Trace-Id"] == request_span["trace_id"] == query_span["trace_id"]
+    assert query_span["parent_id"] == request_span["span_id"]
+    assert request_span["attributes"]["http.status_code"] == 200
+    assert request_span["end_ns"] >= query_span["end_ns"]
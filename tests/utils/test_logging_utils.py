@@ -0,0 +1,107 @@
+import json
+import logging
+import logging.handlers
+import queue
+
+from app.core.tracing import configure_tracing, shutdown_tracing, span
+from app.utils.logging_utils import DebugSampler, JsonFormatter, NonBlockingQueueHandler, TraceContextFilter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_logger(name, *handlers):
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_queue_listener_writes_interpolated_records_off_thread():
+    target = ListHandler()
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, target)
+    listener.start()
+    logger = make_logger("tests.logging.queue", NonBlockingQueueHandler(records))
+    payload = {"id": 1}
+    try:
+        logger.info("Stored %s", payload)
+        payload["id"] = 2  # Mutated after logging: the queued message must not change
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed")
+    finally:
+        listener.stop()
+
+    assert [record.getMessage() for record in target.records] == ["Stored {'id': 1}", "Failed"]
+    assert target.records[0].args is None  # Interpolated before queueing
+    formatted = logging.Formatter("%(message)s").format(target.records[1])
+    assert formatted.startswith("Failed\nTraceback") and "ValueError: boom" in formatted
+
+
+def test_debug_sampler_keeps_first_and_every_nth_record_per_call_site():
+    target = ListHandler()
+    target.addFilter(DebugSampler(0.25))
+    logger = make_logger("tests.logging.sampling", target)
+    for i in range(9):
+        logger.debug("match %d", i)
+        logger.info("kept %d", i)
+    logger.debug("other call site")
+
+    debug = [record.getMessage() for record in target.records if record.levelno == logging.DEBUG]
+    assert debug == ["match 0", "match 4", "match 8", "other call site"]
+    assert sum(record.levelno == logging.INFO for record in target.records) == 9
+
+
+def test_json_formatter_includes_extra_fields_and_trace_ids(tmp_path):
+    target = ListHandler()
+    target.addFilter(TraceContextFilter())
+    logger = make_logger("tests.logging.json", target)
+    configure_tracing(enabled=True, jsonl_path=str(tmp_path / "traces.jsonl"), otlp_endpoint="")
+    try:
+        with span("rag.retrieve") as active:
+            logger.warning("Retrieved %d documents", 3, extra={"top_k": 5})
+    finally:
+        shutdown_tracing()
+
+    entry = json.loads(JsonFormatter().format(target.records[0]))
+    assert entry["message"] == "Retrieved 3 documents"
+    assert entry["level"] == "WARNING" and entry["logger"] == "tests.logging.json"
+    assert entry["top_k"] == 5
+    assert entry["trace_id"] == active.trace_id and entry["span_id"] == active.span_id
+
+
+def test_setup_logging_samples_each_handler_independently(tmp_path, monkeypatch, mocker):
+    from app.config.settings import settings
+    from app.utils.helpers import setup_logging
+
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.object(settings, "LOG_QUEUE_ENABLED", False)
+    mocker.patch.object(settings, "LOG_DEBUG_SAMPLE_RATE", 0.5)
+    mocker.patch.object(settings, "LOG_LEVEL", "DEBUG")
+    mocker.patch("app.utils.helpers.stop_queue_listener")  # Leave the app's listener running
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    try:
+        setup_logging()
+        console, file_handler = root.handlers
+        assert console.filters[0] is not file_handler.filters[0]
+        for i in range(4):
+            logging.getLogger("tests.logging.setup").debug("sampled %d", i)
+        file_handler.flush()
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.handlers[:], root.level = saved_handlers, saved_level
+
+    written = (tmp_path / "logs" / "app.log").read_text(encoding="utf-8")
+    assert "sampled 0" in written and "sampled 2" in written and "sampled 1" not in written
@@ -0,0 +1,37 @@
+import pytest
+
+from app.config.settings import settings
+from app.utils.helpers import normalize_arabic_text
+from app.utils.normalization import ArabicNormalizer, normalize_batch, normalize_text
+
+
+def test_profiles():
+    text = "قَالَ  إِنَّ الصَّلاةَ ــ مُهِمَّةٌ، وَهِيَ عَلَى الْهُدَى"
+    assert normalize_text(text, profile="none") == "قَالَ إِنَّ الصَّلاةَ ــ مُهِمَّةٌ، وَهِيَ عَلَى الْهُدَى"
+    assert normalize_text(text, profile="light") == "قال إن الصلاة مهمة، وهي على الهدى"
+    assert normalize_text(text, profile="search") == "قال ان الصلاه مهمه، وهي علي الهدي"
+    assert normalize_text(text, profile="dedup") == "قال ان الصلاه مهمه وهي علي الهدي"
+    # Quranic annotation marks (small high letters, pause marks)
+    assert normalize_text("الرَّحِيمِۚ مَٰلِكِ", profile="light") == "الرحيم ملك"
+
+
+def test_batch_matches_single_and_uses_configured_profile(mocker):
+    texts = ["بِسْمِ اللَّهِ", "  أَحْمَدُ\n"]
+    assert normalize_batch(texts) == ["بِسْمِ اللَّهِ", "أَحْمَدُ"]  # Default "none": matches the raw-text index
+    mocker.patch.object(settings, "NORMALIZATION_PROFILE", "search")
+    assert normalize_batch(texts) == [normalize_text(text) for text in texts] == ["بسم الله", "احمد"]
+    mocker.patch.object(settings, "NORMALIZE_ARABIC", False)
+    assert normalize_batch(texts) == ["بِسْمِ اللَّهِ", "أَحْمَدُ"]
+    assert normalize_arabic_text("أَحْمَدُ") == "أَحْمَدُ"
+
+
+def test_settings_reject_unknown_profile():
+    with pytest.raises(ValueError, match="NORMALIZATION_PROFILE"):
+        type(settings)(NORMALIZATION_PROFILE="aggressive")
+
+
+def test_unknown_features_and_profiles_are_rejected():
+    with pytest.raises(ValueError):
+        ArabicNormalizer(["vowels"])
+    with pytest.raises(ValueError):
+        normalize_text("نص", profile="aggressive")